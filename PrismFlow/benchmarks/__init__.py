@@ -0,0 +1 @@
+"""PrismFlow 性能基准测试（可在离线CPU环境运行，使用随机初始化的模型）"""
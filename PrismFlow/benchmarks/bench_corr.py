@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+RAFT相关体基准测试
+用随机特征图对比以下相关体实现的构建耗时、单次查找耗时和常驻内存（查找结果的一致性见 tests/test_corr.py）:
+- CorrBlock-levels: 全局相关体，每层金字塔单独调用一次 bilinear_sampler（原实现）
+- CorrBlock:        全局相关体，预计算各层的偏移网格，一次算出所有层的采样坐标
+- LocalCorrBlock:   纯PyTorch局部相关体
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_corr --width 768 --height 512
+    python -m benchmarks.bench_corr --width 1920 --height 1088 --skip-corr-block
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow'))
+from RAFT.corr import CorrBlock, LocalCorrBlock
+from RAFT.utils.utils import coords_grid
+
+
+def _tensor_bytes(tensors):
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def block_bytes(block):
+    """相关体对象常驻的张量大小（字节）"""
+    if isinstance(block, CorrBlock):
+        return _tensor_bytes(block.corr_pyramid)
+    return _tensor_bytes(block.pyramid) + _tensor_bytes([block.fmap1])
+
+
+BLOCKS = {
+    "CorrBlock-levels": lambda fmap1, fmap2, radius: CorrBlock(fmap1, fmap2, radius=radius, fused=False),
+    "CorrBlock": lambda fmap1, fmap2, radius: CorrBlock(fmap1, fmap2, radius=radius),
+    "LocalCorrBlock": lambda fmap1, fmap2, radius: LocalCorrBlock(fmap1, fmap2, radius=radius),
+}
+
+
+def bench_block(build, fmap1, fmap2, coords, radius, runs):
+    """返回 (构建耗时, 平均查找耗时, 常驻字节数)"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    block = build(fmap1, fmap2, radius=radius)
+    build_time = time.perf_counter() - start
+
+    block(coords)  # 预热
+    start = time.perf_counter()
+    for _ in range(runs):
+        block(coords)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return build_time, (time.perf_counter() - start) / runs, block_bytes(block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAFT相关体实现对比")
+    parser.add_argument("--width", type=int, default=768, help="图像宽度（特征图为1/8）")
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--batch", type=int, default=2, help="前向+后向为2")
+    parser.add_argument("--dim", type=int, default=256, help="特征通道数（RAFT为256，RAFT small为128）")
+    parser.add_argument("--radius", type=int, default=4, help="查找半径（RAFT为4，RAFT small为3）")
+    parser.add_argument("--max-flow", type=float, default=8.0, help="随机光流幅度（1/8分辨率像素）")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-corr-block", action="store_true", help="不运行全局相关体（分辨率过高时内存不够）")
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    torch.manual_seed(0)
+    h8, w8 = args.height // 8, args.width // 8
+    fmap1 = torch.randn(args.batch, args.dim, h8, w8, device=args.device)
+    fmap2 = torch.randn(args.batch, args.dim, h8, w8, device=args.device)
+    coords = coords_grid(args.batch, h8, w8, device=args.device)
+    coords = coords + (torch.rand_like(coords) * 2 - 1) * args.max_flow
+    print(f"🔍 相关体基准: 特征图 {w8}x{h8}, batch={args.batch}, dim={args.dim}, r={args.radius}, 设备={args.device}")
+
+    blocks = ["LocalCorrBlock"] if args.skip_corr_block else list(BLOCKS)
+    print(f"{'实现':<18}{'构建(ms)':>10}{'查找(ms)':>10}{'内存(MB)':>10}")
+    for name in blocks:
+        build_time, lookup_time, nbytes = bench_block(BLOCKS[name], fmap1, fmap2, coords, args.radius, args.runs)
+        print(f"{name:<18}{build_time * 1000:>10.1f}{lookup_time * 1000:>10.1f}{nbytes / 2 ** 20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+遮挡遮罩与混合基准测试
+对比 numpy 参考实现（compute_diff_map + 流程中原有的 float64 混合）与 torch 实现 compute_flow_blend
+的耗时（两者输出的一致性见 tests/test_flow_blend.py）。光流为随机的平滑运动场，不需要RAFT。
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_diff_map --width 768 --height 512
+    python -m benchmarks.bench_diff_map --device cuda
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from run_v2v_v2_with_lora import FLOW_MASK_ARGS
+from benchmarks.synthetic_video import MOTION_PATTERNS, generate_synthetic_frames
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow', 'scripts'))
+from core import local_flow_utils
+
+
+def smooth_flow(width, height, magnitude, rng):
+    """低分辨率随机场双线性放大得到的平滑光流 (H, W, 2) float32"""
+    coarse = rng.standard_normal((6, 8, 2)).astype(np.float32) * magnitude
+    return cv2.resize(coarse, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def blend_reference(next_flow, prev_flow, prev_frame, curr_frame, prev_frame_styled):
+    """优化前 process_frame_with_optical_flow 中的做法，返回 (uint8遮罩, uint8混合帧, 覆盖率)"""
+    alpha_mask, warped_styled_frame = local_flow_utils.compute_diff_map(
+        next_flow, prev_flow, prev_frame, curr_frame, prev_frame_styled, FLOW_MASK_ARGS
+    )
+    blended = curr_frame.astype(float) * alpha_mask + warped_styled_frame.astype(float) * (1 - alpha_mask)
+    mask = np.clip(alpha_mask * 255, 0, 255).astype(np.uint8)[..., 0]
+    return mask, blended.astype(np.uint8), float(np.mean(alpha_mask))
+
+
+def blend_torch(next_flow, prev_flow, prev_frame, curr_frame, prev_frame_styled, device):
+    return local_flow_utils.compute_flow_blend(
+        next_flow, prev_flow, prev_frame, curr_frame, prev_frame_styled, FLOW_MASK_ARGS, device=device
+    )
+
+
+def time_pairs(fn, pairs, runs):
+    """返回每帧对平均耗时"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(runs):
+        for pair in pairs:
+            fn(*pair)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / (runs * len(pairs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compute_diff_map 与 compute_flow_blend 对比")
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--motion", type=str, default="pan", choices=MOTION_PATTERNS)
+    parser.add_argument("--flow-magnitude", type=float, default=4.0, help="随机光流的幅度（像素）")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    rng = np.random.default_rng(0)
+    frames = generate_synthetic_frames(args.frames, args.width, args.height, args.motion)
+    pairs = []
+    for prev_frame, curr_frame in zip(frames[:-1], frames[1:]):
+        next_flow = smooth_flow(args.width, args.height, args.flow_magnitude, rng)
+        prev_flow = -next_flow + smooth_flow(args.width, args.height, args.flow_magnitude / 4, rng)
+        styled = np.ascontiguousarray(prev_frame[..., ::-1])
+        pairs.append((next_flow, prev_flow, prev_frame, curr_frame, styled))
+    print(f"🔍 遮罩混合基准: {len(pairs)}个帧对 {args.width}x{args.height}, 设备={args.device}")
+
+    blend_torch(*pairs[0], args.device)  # 预热（缓存网格和高斯核）
+    ref_time = time_pairs(blend_reference, pairs, args.runs)
+    new_time = time_pairs(lambda *pair: blend_torch(*pair, args.device), pairs, args.runs)
+
+    print(f"{'实现':<20}{'每帧对(ms)':>12}{'加速比':>10}")
+    print(f"{'compute_diff_map':<20}{ref_time * 1000:>12.1f}{1.0:>10.3f}")
+    print(f"{'compute_flow_blend':<20}{new_time * 1000:>12.1f}{ref_time / new_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
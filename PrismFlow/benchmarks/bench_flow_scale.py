@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+降分辨率光流基准测试
+对比不同 flow_scale 下RAFT的耗时、相关体内存，以及最终遮挡遮罩（compute_diff_map 的 alpha_mask）
+相对全分辨率的差异。
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_flow_scale --width 768 --height 512 --scales 1 0.5 0.25
+    python -m benchmarks.bench_flow_scale --raft-full --raft-checkpoint models/RAFT/raft-sintel.pth
+
+随机初始化的权重只能用来比较耗时和内存；遮罩质量请用 --raft-checkpoint 指定真实权重。
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from run_v2v_v2_with_lora import FLOW_MASK_ARGS
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import MOTION_PATTERNS, generate_synthetic_frames
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow', 'scripts'))
+from core import local_flow_utils
+
+
+def corr_volume_bytes(size, batch=2):
+    """全局相关体及其池化金字塔的内存（float32），batch=2 对应前向+后向"""
+    pixels = (size[0] // 8) * (size[1] // 8)
+    return int(batch * pixels * pixels * 4 * 4 / 3)
+
+
+def run_scale(frames, flow_scale, args):
+    """返回 (每帧对耗时, CUDA峰值显存或None, alpha_mask列表)"""
+    local_flow_utils.RAFT_clear_memory()
+    local_flow_utils.RAFT_load_model(args.device, args.raft_checkpoint, not args.raft_full)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+
+    masks = []
+    elapsed = 0.0
+    for prev_frame, curr_frame in zip(frames[:-1], frames[1:]):
+        start = time.perf_counter()
+        next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+            prev_frame, curr_frame, device=args.device, model_path=args.raft_checkpoint,
+            small=not args.raft_full, flow_scale=flow_scale
+        )
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        elapsed += time.perf_counter() - start
+        alpha_mask, _ = local_flow_utils.compute_diff_map(
+            next_flow, prev_flow, prev_frame, curr_frame, prev_frame, FLOW_MASK_ARGS
+        )
+        masks.append(alpha_mask[..., 0])
+
+    peak = int(torch.cuda.max_memory_allocated()) if torch.cuda.is_available() else None
+    return elapsed / (len(frames) - 1), peak, masks
+
+
+def mask_quality(masks, reference):
+    """与全分辨率遮罩的平均绝对差和二值化(>0.5)后的IoU"""
+    mad = float(np.mean([np.abs(m - r).mean() for m, r in zip(masks, reference)]))
+    ious = []
+    for m, r in zip(masks, reference):
+        a, b = m > 0.5, r > 0.5
+        union = np.logical_or(a, b).sum()
+        ious.append(np.logical_and(a, b).sum() / union if union else 1.0)
+    return mad, float(np.mean(ious))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="flow_scale 对比")
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--motion", type=str, default="objects", choices=MOTION_PATTERNS)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.5, 0.25])
+    parser.add_argument("--raft-full", action="store_true", help="测试完整RAFT而不是RAFT small")
+    parser.add_argument("--raft-checkpoint", type=str, default=None, help="RAFT权重，默认使用随机初始化的权重")
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    if args.raft_checkpoint is None:
+        args.raft_checkpoint = build_stub_raft_checkpoint(tempfile.mkdtemp(prefix="prismflow_scale_bench_"),
+                                                          small=not args.raft_full)
+    frames = generate_synthetic_frames(args.frames, args.width, args.height, args.motion)
+    print(f"🔍 flow_scale基准: {args.frames}帧 {args.width}x{args.height}, "
+          f"{'RAFT' if args.raft_full else 'RAFT small'}, 设备={args.device}")
+
+    results = {scale: run_scale(frames, scale, args) for scale in sorted(set(args.scales) | {1.0}, reverse=True)}
+    reference_time, _, reference_masks = results[1.0]
+    print(f"{'scale':<8}{'处理分辨率':>12}{'相关体(MB)':>12}{'每帧对(ms)':>12}{'加速比':>8}"
+          f"{'峰值显存(MB)':>14}{'遮罩MAD':>10}{'遮罩IoU':>10}")
+    for scale, (pair_time, peak, masks) in results.items():
+        size = local_flow_utils.RAFT_processing_size((args.width, args.height), scale)
+        mad, iou = mask_quality(masks, reference_masks)
+        peak_text = f"{peak / 2 ** 20:.1f}" if peak is not None else "-"
+        print(f"{scale:<8}{f'{size[0]}x{size[1]}':>12}{corr_volume_bytes(size) / 2 ** 20:>12.1f}"
+              f"{pair_time * 1000:>12.1f}{reference_time / pair_time:>8.2f}{peak_text:>14}{mad:>10.4f}{iou:>10.3f}")
+    local_flow_utils.RAFT_clear_memory()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+forward_interpolate 基准测试
+对比前向投影的 torch 实现（forward_interpolate，溅射 + jump flood 最近邻填充）与上游RAFT的
+scipy griddata 实现（forward_interpolate_griddata）的耗时和结果差异。输入为RAFT 1/8分辨率大小的合成光流:
+- smooth: 低分辨率随机场放大得到的平滑光流
+- zoom:   以画面中心为原点的缩放运动（投影后有空洞和重叠）
+- split:  左右两半反向平移（运动边界处遮挡）；位移为整数时重叠区的投影点与像素等距，
+          两种实现对等距点的取舍不同，这里的差异只来自等距点
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_forward_interpolate --width 768 --height 512
+    python -m benchmarks.bench_forward_interpolate --device cuda --magnitude 8
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow'))
+from RAFT.utils.utils import forward_interpolate, forward_interpolate_griddata
+
+FLOW_PATTERNS = ("smooth", "zoom", "split")
+
+
+def make_flow(pattern, ht, wd, magnitude, rng):
+    """(2, ht, wd) float32 合成光流（1/8分辨率像素）"""
+    if pattern == "smooth":
+        coarse = rng.standard_normal((4, 6, 2)).astype(np.float32) * magnitude
+        flow = cv2.resize(coarse, (wd, ht), interpolation=cv2.INTER_LINEAR)
+    elif pattern == "zoom":
+        y, x = np.mgrid[0:ht, 0:wd].astype(np.float32)
+        scale = magnitude / max(ht, wd)
+        flow = np.stack([(x - wd / 2) * scale, (y - ht / 2) * scale], axis=-1)
+    else:
+        flow = np.zeros((ht, wd, 2), dtype=np.float32)
+        flow[:, :wd // 2, 0] = magnitude
+        flow[:, wd // 2:, 0] = -magnitude
+    return torch.from_numpy(np.ascontiguousarray(flow.transpose(2, 0, 1)))
+
+
+def time_call(fn, flow, runs):
+    """返回 (平均耗时, 输出)"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(runs):
+        output = fn(flow)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / runs, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="forward_interpolate torch实现与 griddata 对比")
+    parser.add_argument("--width", type=int, default=768, help="图像宽度（光流为1/8分辨率）")
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--magnitude", type=float, default=4.0, help="光流幅度（1/8分辨率像素）")
+    parser.add_argument("--patterns", type=str, nargs="+", default=list(FLOW_PATTERNS), choices=FLOW_PATTERNS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    rng = np.random.default_rng(0)
+    ht, wd = args.height // 8, args.width // 8
+    print(f"🔍 forward_interpolate 基准: 光流 {wd}x{ht}, 幅度={args.magnitude}, 设备={args.device}")
+    print(f"{'运动':<8}{'griddata(ms)':>14}{'torch(ms)':>10}{'加速比':>10}{'平均差':>10}{'p99差':>10}{'最大差':>10}")
+    for pattern in args.patterns:
+        flow = make_flow(pattern, ht, wd, args.magnitude, rng)
+        ref_time, reference = time_call(forward_interpolate_griddata, flow, args.runs)
+        new_time, output = time_call(forward_interpolate, flow.to(args.device), args.runs)
+        error = torch.linalg.vector_norm(output.cpu() - reference, dim=0).flatten().numpy()
+        print(f"{pattern:<8}{ref_time * 1000:>14.2f}{new_time * 1000:>10.2f}{ref_time / new_time:>10.1f}"
+              f"{error.mean():>10.4f}{np.percentile(error, 99):>10.4f}{error.max():>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+推理优化基准测试
+对比 CycleGAN 生成器和 RAFT 在 eager 与 torch.compile / TorchScript 后端下的耗时，
+并检查优化后的输出与 eager 一致。
+"folded" 行为 prepare_for_inference（BatchNorm折叠、去掉恒等层和dropout、Conv2d+ReLU融合）后的eager结果，
+用于检查简化后的模型与原模型等价；BatchNorm的统计量会被随机化，避免恒等的初始统计量掩盖折叠错误。
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_inference_opt --width 320 --height 192
+    python -m benchmarks.bench_inference_opt --backends script compile --raft-full
+    python -m benchmarks.bench_inference_opt --norm batch --netG unet_256 --width 256 --height 256 --raft-full
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import torch
+
+from inference_opt import INFERENCE_BACKENDS, optimize_module, prepare_for_inference, warmup
+from cyclegan_lib.models import networks
+from benchmarks.stub_models import RAFT
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow', 'scripts'))
+from core.local_flow_utils import RAFT_optimize
+
+
+def _time_call(fn, runs):
+    """返回多次调用的平均耗时（秒）"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(runs):
+        output = fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / runs, output
+
+
+def randomize_batchnorm(module):
+    """给BatchNorm层随机的统计量和仿射参数（初始化时均值0方差1，折叠后与原模型恒等）"""
+    for m in module.modules():
+        if isinstance(m, torch.nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 2.0)
+            if m.affine:
+                m.weight.data.uniform_(0.5, 1.5)
+                m.bias.data.uniform_(-0.5, 0.5)
+    return module
+
+
+def bench_folded(module, run, eager_time, reference, runs):
+    """prepare_for_inference 后的eager耗时和与原模型的误差"""
+    folded = prepare_for_inference(copy.deepcopy(module), fuse_relu=True)
+    elapsed, output = _time_call(lambda: run(folded), runs)
+    return {
+        "mean_ms": round(elapsed * 1000, 2),
+        "speedup": round(eager_time / elapsed, 3),
+        "max_abs_diff": float((output - reference).abs().max()),
+    }
+
+
+def bench_cyclegan(backends, width, height, ngf, device, runs, netG='resnet_9blocks', norm='instance'):
+    torch.manual_seed(0)
+    net = networks.define_G(3, 3, ngf, netG, norm=norm, use_dropout=True).to(device)
+    net = randomize_batchnorm(net).eval()
+    x = torch.randn(1, 3, height, width, device=device)
+
+    results = {}
+    eager_time, reference = _time_call(lambda: net(x), runs)
+    results["eager"] = {"mean_ms": round(eager_time * 1000, 2), "speedup": 1.0, "max_abs_diff": 0.0}
+    results["folded"] = bench_folded(net, lambda m: m(x), eager_time, reference, runs)
+    for backend in backends:
+        optimized = optimize_module(copy.deepcopy(net), backend, channels_last=True)
+        warmup(optimized, x)
+        elapsed, output = _time_call(lambda: optimized(x), runs)
+        results[backend] = {
+            "mean_ms": round(elapsed * 1000, 2),
+            "speedup": round(eager_time / elapsed, 3),
+            "max_abs_diff": float((output - reference).abs().max()),
+        }
+    return results
+
+
+def bench_raft(backends, width, height, small, device, runs, iters):
+    torch.manual_seed(0)
+    raft_args = argparse.Namespace(small=small, mixed_precision=False, alternate_corr=False, dropout=0)
+    model = randomize_batchnorm(RAFT(raft_args).to(device)).eval()
+    image1 = torch.rand(1, 3, height, width, device=device) * 255
+    image2 = torch.roll(image1, shifts=(2, 3), dims=(2, 3))
+
+    def run(m):
+        return m(image1, image2, iters=iters, test_mode=True)[1]
+
+    results = {}
+    eager_time, reference = _time_call(lambda: run(model), runs)
+    results["eager"] = {"mean_ms": round(eager_time * 1000, 2), "speedup": 1.0, "max_abs_diff": 0.0}
+    results["folded"] = bench_folded(model, run, eager_time, reference, runs)
+    for backend in backends:
+        optimized = copy.deepcopy(model)
+        RAFT_optimize(optimized, backend, (1, 3, height, width), device)
+        elapsed, output = _time_call(lambda: run(optimized), runs)
+        results[backend] = {
+            "mean_ms": round(elapsed * 1000, 2),
+            "speedup": round(eager_time / elapsed, 3),
+            "max_abs_diff": float((output - reference).abs().max()),
+        }
+    return results
+
+
+def print_results(title, results):
+    print(f"\n=== {title} ===")
+    print(f"{'后端':<10}{'平均(ms)':>12}{'加速比':>10}{'最大误差':>14}")
+    for backend, stats in results.items():
+        print(f"{backend:<10}{stats['mean_ms']:>12.2f}{stats['speedup']:>10.3f}{stats['max_abs_diff']:>14.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理优化后端对比")
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=192)
+    parser.add_argument("--backends", type=str, nargs="+", default=["script"],
+                        choices=[b for b in INFERENCE_BACKENDS if b != "eager"])
+    parser.add_argument("--ngf", type=int, default=32, help="CycleGAN生成器的通道数（正式模型为64）")
+    parser.add_argument("--netG", type=str, default="resnet_9blocks", help="CycleGAN生成器结构")
+    parser.add_argument("--norm", type=str, default="instance", choices=["instance", "batch", "none"],
+                        help="CycleGAN生成器的归一化层")
+    parser.add_argument("--raft-full", action="store_true", help="测试完整RAFT而不是RAFT small")
+    parser.add_argument("--iters", type=int, default=20, help="RAFT迭代次数")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    print(f"🔍 推理优化基准: {args.width}x{args.height}, 设备={args.device}, 后端={args.backends}")
+
+    print_results(f"CycleGAN {args.netG} ({args.norm})",
+                  bench_cyclegan(args.backends, args.width, args.height, args.ngf, args.device, args.runs,
+                                 args.netG, args.norm))
+    print_results("RAFT" if args.raft_full else "RAFT small",
+                  bench_raft(args.backends, args.width, args.height, not args.raft_full,
+                             args.device, args.runs, args.iters))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+端到端合成基准测试
+生成合成视频，用随机初始化的替身模型跑完整的处理流程（拆帧 -> 逐帧处理 -> 合成视频），
+报告每种处理模式的帧率和各阶段耗时。可在无GPU、无网络的机器上运行，用于上线前发现性能回退。
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_pipeline --frames 8 --width 320 --height 192 --motion pan
+    python -m benchmarks.bench_pipeline --modes "CycleGAN Only" --json bench_result.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import cv2
+import torch
+
+from run_report import RunReport
+from inference_opt import INFERENCE_BACKENDS, QUANTIZATION_MODES
+import run_v2v_v2_with_lora as pipeline
+from core.local_flow_utils import RAFT_clear_memory
+from benchmarks.synthetic_video import MOTION_PATTERNS, generate_synthetic_frames, write_synthetic_video
+from benchmarks.stub_models import (
+    StubDiffusionPipeline,
+    StubLineartDetector,
+    build_stub_cyclegan,
+    build_stub_raft_checkpoint,
+)
+
+PROCESSING_MODES = ("CycleGAN Only", "Stable Diffusion Only", "CycleGAN + Stable Diffusion")
+
+
+def run_mode(processing_mode, video_path, work_dir, args):
+    """用替身模型跑一遍完整流程，返回运行报告字典"""
+    config = pipeline.build_job_config(
+        0.75,
+        output_folder=os.path.join(work_dir, processing_mode.replace(" ", "_").replace("+", "and")),
+        width=args.width,
+        height=args.height,
+        steps=args.steps,
+        raft_model_path=args.raft_checkpoint,
+        flow_backend=args.flow_backend,
+        raft_variant=args.raft_variant,
+        inference_backend=args.inference_backend,
+        flow_chunk_size=args.flow_chunk_size,
+        raft_memory_budget_mb=args.raft_memory_budget_mb,
+        flow_cache_dir=os.path.join(work_dir, "flow_cache") if args.flow_cache else None,
+        motion_roi=not args.full_frame_inpaint,
+        skip_diffusion_coverage=args.skip_coverage,
+        max_consecutive_skips=args.max_skips,
+        cyclegan_batch_size=args.cyclegan_batch_size,
+    )
+    report = RunReport(enabled=True, sync_cuda=args.sync_cuda)
+    report.set_info("processing_mode", processing_mode)
+    report.set_info("inference_backend", args.inference_backend)
+    report.set_info("flow_backend", args.flow_backend)
+    report.set_info("raft_variant", args.raft_variant)
+
+    input_frames_dir, output_frames_dir = pipeline.setup_directories(config["output_folder"])
+    with report.stage("decode"):
+        fps, frame_total, frames_list = pipeline.extract_frames(video_path, input_frames_dir)
+    frames = [cv2.resize(frame, (config["width"], config["height"])) for frame in frames_list]
+
+    cyclegan_processor = None
+    pipe = None
+    preprocessor = None
+    if "CycleGAN" in processing_mode:
+        with report.model_load("cyclegan"):
+            cyclegan_processor = build_stub_cyclegan(
+                work_dir, ngf=args.ngf, device=args.device,
+                inference_backend=args.inference_backend, warmup_size=(config["width"], config["height"]),
+                batch_size=config["cyclegan_batch_size"]
+            )
+        with report.model_load("cyclegan_quantization"):
+            quantization = cyclegan_processor.quantize(frames, args.cyclegan_quantization)
+        if quantization is not None:
+            report.set_info("cyclegan_quantization", quantization["mode"])
+            report.set_info("cyclegan_quantization_psnr", quantization["psnr"])
+            report.set_info("cyclegan_quantization_cached", quantization["cached"])
+    if "Stable Diffusion" in processing_mode:
+        with report.model_load("stable_diffusion"):
+            pipe = StubDiffusionPipeline(device=args.device)
+        preprocessor = StubLineartDetector()
+
+    flow_cache = pipeline.open_flow_cache(video_path, processing_mode, config)
+    try:
+        pipeline.process_frames(
+            frames, processing_mode, cyclegan_processor, pipe, preprocessor,
+            "benchmark", config, args.device, None, output_frames_dir, report=report, flow_cache=flow_cache
+        )
+    finally:
+        pipeline.close_flow_cache(flow_cache, report)
+    if pipeline.OPTICAL_FLOW_AVAILABLE and "Stable Diffusion" in processing_mode and not args.keep_raft:
+        # 流程中RAFT常驻、空闲超时后才卸载；默认每次运行后立即卸载，使各次运行都包含模型加载
+        RAFT_clear_memory()
+
+    with report.stage("encode"):
+        pipeline.create_video(output_frames_dir, os.path.join(config["output_folder"], "final_video.mp4"), fps)
+
+    summary = report.summary()
+    frame_time = summary["frames"].get("total_s", 0.0)
+    summary["fps"] = round(frame_total / frame_time, 3) if frame_time > 0 else None
+    return summary
+
+
+def print_summary(processing_mode, summary):
+    """打印单个模式的帧率和阶段耗时表"""
+    print(f"\n=== {processing_mode} ===")
+    print(f"帧率: {summary['fps']} fps  (共 {summary['frames']['count']} 帧)")
+    if "raft_pairs_per_s" in summary["info"]:
+        print(f"RAFT ({summary['info']['raft_variant']}): {summary['info']['raft_pairs_per_s']} 帧对/s")
+    if "cyclegan_quantization_psnr" in summary["info"]:
+        print(f"CycleGAN {summary['info']['cyclegan_quantization']}: 相对fp32 PSNR "
+              f"{summary['info']['cyclegan_quantization_psnr']} dB")
+    print(f"{'阶段':<14}{'次数':>6}{'总计(s)':>10}{'平均(ms)':>10}{'p95(ms)':>10}")
+    for name, stats in summary["stages"].items():
+        print(f"{name:<14}{stats['count']:>6}{stats['total_s']:>10.3f}"
+              f"{stats['mean_s'] * 1000:>10.1f}{stats['p95_s'] * 1000:>10.1f}")
+    for name, seconds in summary["model_load_s"].items():
+        print(f"模型加载 {name}: {seconds:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PrismFlow 端到端合成基准测试")
+    parser.add_argument("--frames", type=int, default=8, help="合成视频帧数")
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=192)
+    parser.add_argument("--motion", type=str, default="pan", choices=MOTION_PATTERNS)
+    parser.add_argument("--modes", type=str, nargs="+", default=list(PROCESSING_MODES), choices=PROCESSING_MODES)
+    parser.add_argument("--steps", type=int, default=4, help="替身扩散模型的推理步数")
+    parser.add_argument("--ngf", type=int, default=8, help="替身CycleGAN生成器的通道数")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--inference-backend", type=str, default="eager", choices=INFERENCE_BACKENDS,
+                        help="CycleGAN生成器和RAFT的推理优化后端")
+    parser.add_argument("--cyclegan-batch-size", type=int, default=4, help="CycleGAN每批处理的帧数")
+    parser.add_argument("--cyclegan-quantization", type=str, default="none", choices=QUANTIZATION_MODES,
+                        help="CPU上CycleGAN生成器的量化推理（int8 不支持时回退 bf16）")
+    parser.add_argument("--flow-backend", type=str, default="raft", choices=["raft", "dis", "farneback"],
+                        help="光流估计后端")
+    parser.add_argument("--raft-variant", type=str, default="small", choices=["full", "small"],
+                        help="替身RAFT的变体")
+    parser.add_argument("--raft-memory-budget-mb", type=float, default=None,
+                        help="RAFT单次调用的内存上限（MB），超出时分块估计光流")
+    parser.add_argument("--flow-chunk-size", type=int, default=16, help="批量光流每块的帧对数，0 表示逐帧估计")
+    parser.add_argument("--full-frame-inpaint", action="store_true",
+                        help="关闭运动区域裁剪，始终对整帧做inpainting")
+    parser.add_argument("--skip-coverage", type=float, default=0.0,
+                        help="遮罩覆盖率不超过该值时跳过扩散（如0.01），默认0表示不跳过")
+    parser.add_argument("--max-skips", type=int, default=4, help="最多连续跳过扩散的帧数")
+    parser.add_argument("--flow-cache", action="store_true",
+                        help="启用光流磁盘缓存（缓存在工作目录内，用 --repeat 观察命中后的提速）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个模式重复运行的次数")
+    parser.add_argument("--keep-raft", action="store_true",
+                        help="重复运行之间保留常驻的RAFT模型（与服务中多个任务共用模型的情形一致）")
+    parser.add_argument("--sync-cuda", action="store_true",
+                        help="每个阶段进入和退出时同步CUDA，使GPU耗时归属到正确的阶段（会拖慢流程）")
+    parser.add_argument("--json", type=str, default=None, help="把结果写入JSON文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    work_dir = tempfile.mkdtemp(prefix="prismflow_bench_")
+    print(f"🔍 合成基准测试: {args.frames}帧 {args.width}x{args.height}, 运动={args.motion}, 设备={args.device}")
+    print(f"📁 工作目录: {work_dir}")
+
+    results = {"settings": vars(args).copy(), "modes": {}}
+    try:
+        frames = generate_synthetic_frames(args.frames, args.width, args.height, args.motion)
+        video_path = write_synthetic_video(os.path.join(work_dir, "synthetic.mp4"), frames)
+        args.raft_checkpoint = build_stub_raft_checkpoint(work_dir, small=args.raft_variant == "small")
+
+        for processing_mode in args.modes:
+            runs = []
+            for run_index in range(args.repeat):
+                summary = run_mode(processing_mode, video_path, work_dir, args)
+                runs.append(summary)
+                print_summary(processing_mode if args.repeat == 1 else f"{processing_mode} #{run_index + 1}", summary)
+            results["modes"][processing_mode] = runs[0] if args.repeat == 1 else runs
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n📊 结果已保存至: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+RAFT光流估计基准测试
+在合成视频上对比不同的光流估计方式的耗时与结果差异（以逐对 RAFT.forward 的结果为参考）:
+- legacy:  每个帧对调用两次 RAFT.forward（前向 + 后向），每帧特征被编码4次
+- cached:  RAFT_estimate_flow，逐帧编码缓存 + 前后向共用编码
+- clip:    RAFT_estimate_clip_flows，整段批量估计
+- warm:    RAFT_estimate_flow + 时域热启动（上一帧对光流投影为初值，迭代 --warm-iters 次）
+- adaptive: RAFT_estimate_flow + 自适应迭代（delta_flow 收敛后提前结束）
+- bilinear: RAFT_estimate_flow，跳过凸组合上采样，直接双线性放大1/8分辨率光流
+- local:   RAFT_estimate_flow + 局部相关体（alternate_corr，不构建全局相关体）
+
+--variants 可同时测试完整RAFT和RAFT-small，每个变体输出一张表（含每秒帧对数）。
+
+另外对比凸组合上采样的 unfold 写法（原实现）与逐邻域累加写法的耗时，
+以及热启动每个帧对的投影开销与它省下的迭代（--iters 减 --warm-iters 次）的耗时。
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_raft_flow --frames 8 --width 320 --height 192
+    python -m benchmarks.bench_raft_flow --variants full small --methods legacy clip
+    python -m benchmarks.bench_raft_flow --methods legacy warm --warm-iters 6 --raft-checkpoint models/RAFT/raft-sintel.pth --variants full
+
+随机初始化的权重只能用来比较耗时；要评估热启动等近似方法的精度，请用 --raft-checkpoint 指定真实权重。
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import MOTION_PATTERNS, generate_synthetic_frames
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow', 'scripts'))
+from core import local_flow_utils
+from RAFT.raft import RAFT
+
+
+def _to_tensor(frame, device):
+    return torch.from_numpy(frame).permute(2, 0, 1).float()[None].to(device)
+
+
+def flows_legacy(frames, args, stats):
+    """逐对调用两次 RAFT.forward，即优化前 RAFT_estimate_flow 的做法"""
+    model = local_flow_utils.RAFT_load_model(args.device, args.raft_checkpoint, args.small)
+    flows = []
+    for frame1, frame2 in zip(frames[:-1], frames[1:]):
+        image1, image2 = _to_tensor(frame1, args.device), _to_tensor(frame2, args.device)
+        _, next_flow = model(image1, image2, iters=args.iters, test_mode=True)
+        _, prev_flow = model(image2, image1, iters=args.iters, test_mode=True)
+        flows.append((next_flow[0].permute(1, 2, 0).cpu().numpy(), prev_flow[0].permute(1, 2, 0).cpu().numpy()))
+    return flows
+
+
+def flows_cached(frames, args, stats):
+    flows = []
+    for frame1, frame2 in zip(frames[:-1], frames[1:]):
+        next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+            frame1, frame2, device=args.device, model_path=args.raft_checkpoint, small=args.small,
+            iteration_stats=stats
+        )
+        flows.append((next_flow, prev_flow))
+    return flows
+
+
+def flows_warm(frames, args, stats):
+    flows = []
+    for frame1, frame2 in zip(frames[:-1], frames[1:]):
+        next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+            frame1, frame2, device=args.device, model_path=args.raft_checkpoint, small=args.small,
+            warm_start_iters=args.warm_iters, iteration_stats=stats
+        )
+        flows.append((next_flow, prev_flow))
+    return flows
+
+
+def flows_adaptive(frames, args, stats):
+    early_exit = {"min_iters": args.min_iters, "delta_mean_tol": args.delta_mean_tol,
+                  "delta_max_tol": args.delta_max_tol}
+    flows = []
+    for frame1, frame2 in zip(frames[:-1], frames[1:]):
+        next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+            frame1, frame2, device=args.device, model_path=args.raft_checkpoint, small=args.small,
+            early_exit=early_exit, iteration_stats=stats
+        )
+        flows.append((next_flow, prev_flow))
+    return flows
+
+
+def flows_bilinear(frames, args, stats):
+    flows = []
+    for frame1, frame2 in zip(frames[:-1], frames[1:]):
+        next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+            frame1, frame2, device=args.device, model_path=args.raft_checkpoint, small=args.small,
+            upsample='bilinear', iteration_stats=stats
+        )
+        flows.append((next_flow, prev_flow))
+    return flows
+
+
+def flows_local(frames, args, stats):
+    flows = []
+    for frame1, frame2 in zip(frames[:-1], frames[1:]):
+        next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+            frame1, frame2, device=args.device, model_path=args.raft_checkpoint, small=args.small,
+            alternate_corr=True, iteration_stats=stats
+        )
+        flows.append((next_flow, prev_flow))
+    return flows
+
+
+def flows_clip(frames, args, stats):
+    clip_flows = local_flow_utils.RAFT_estimate_clip_flows(
+        frames, device=args.device, model_path=args.raft_checkpoint, small=args.small,
+        batch_size=args.batch_size, iters=args.iters, iteration_stats=stats
+    )
+    return [local_flow_utils.clip_flow_pair(clip_flows, i)[:2] for i in range(len(clip_flows.next_flows))]
+
+
+METHODS = {
+    "legacy": flows_legacy,
+    "cached": flows_cached,
+    "clip": flows_clip,
+    "warm": flows_warm,
+    "adaptive": flows_adaptive,
+    "bilinear": flows_bilinear,
+    "local": flows_local,
+}
+
+
+def upsample_flow_unfold(flow, mask):
+    """优化前的凸组合上采样实现（F.unfold），作为参考"""
+    N, _, H, W = flow.shape
+    mask = torch.softmax(mask.view(N, 1, 9, 8, 8, H, W), dim=2)
+    up_flow = F.unfold(8 * flow, [3, 3], padding=1).view(N, 2, 9, 1, 1, H, W)
+    up_flow = torch.sum(mask * up_flow, dim=2).permute(0, 1, 4, 2, 5, 3)
+    return up_flow.reshape(N, 2, 8 * H, 8 * W)
+
+
+def check_convex_upsample(args, runs=5):
+    """对比两种凸组合上采样写法的耗时，返回 (unfold耗时, 逐邻域累加耗时)；两者的一致性见 tests/test_raft_encode_refine.py"""
+    torch.manual_seed(0)
+    h8, w8 = args.height // 16 * 2, args.width // 16 * 2
+    flow = torch.randn(2, 2, h8, w8, device=args.device) * 4
+    mask = torch.randn(2, 576, h8, w8, device=args.device)
+
+    results = []
+    # upsample_flow 不依赖模型状态，这里不实例化RAFT
+    for fn in (upsample_flow_unfold, lambda f, m: RAFT.upsample_flow(None, f, m)):
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn(flow, mask)
+        results.append((time.perf_counter() - start) / runs)
+    return tuple(results)
+
+
+def warm_start_cost(model, frames, args, runs=5):
+    """
+    返回 (热启动投影耗时, 省下的 iters - warm_iters 次迭代的耗时)，均为每个帧对的平均值
+
+    投影为 RAFT_warm_start_init（在光流所在设备上完成），迭代耗时为从零光流迭代 iters 次与
+    从投影初值迭代 warm_iters 次的精炼耗时之差
+    """
+    padder = local_flow_utils.InputPadder((1, 3) + frames[0].shape[:2])
+    encodings = [local_flow_utils.RAFT_encode_frame(model, frame, padder, args.device) for frame in frames[:3]]
+    encoding1 = local_flow_utils.cat_encodings([encodings[0], encodings[1]])
+    encoding2 = local_flow_utils.cat_encodings([encodings[1], encodings[0]])
+    flow_low, _, _ = local_flow_utils.RAFT_refine_pairs(model, encoding1, encoding2, args.iters)
+
+    def timed(fn):
+        fn()  # 预热
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return (time.perf_counter() - start) / runs
+
+    flow_init = local_flow_utils.RAFT_warm_start_init(flow_low[0:1], flow_low[1:2])
+    encoding1 = local_flow_utils.cat_encodings([encodings[1], encodings[2]])
+    encoding2 = local_flow_utils.cat_encodings([encodings[2], encodings[1]])
+    projection = timed(lambda: local_flow_utils.RAFT_warm_start_init(flow_low[0:1], flow_low[1:2]))
+    cold = timed(lambda: local_flow_utils.RAFT_refine_pairs(model, encoding1, encoding2, args.iters))
+    warm = timed(lambda: local_flow_utils.RAFT_refine_pairs(model, encoding1, encoding2, args.warm_iters,
+                                                            flow_init=flow_init))
+    return projection, cold - warm
+
+
+def run_method(name, frames, args):
+    """返回 (耗时秒, 光流列表, 平均每帧对迭代次数)，每次运行前清空模型和编码缓存"""
+    local_flow_utils.RAFT_clear_memory()
+    local_flow_utils.RAFT_load_model(args.device, args.raft_checkpoint, args.small, alternate_corr=name == "local")
+    stats = local_flow_utils.RAFTIterationStats()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    flows = METHODS[name](frames, args, stats)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    stats = stats.pop()
+    mean_iters = stats["iterations"] / stats["pairs"] if stats["pairs"] else float(args.iters)
+    return elapsed, flows, mean_iters
+
+
+def endpoint_error(flows, reference):
+    """与参考光流的平均端点误差（前向和后向取平均）"""
+    errors = [np.linalg.norm(flow - ref, axis=-1).mean()
+              for pair, ref_pair in zip(flows, reference) for flow, ref in zip(pair, ref_pair)]
+    return float(np.mean(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAFT光流估计方式对比")
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=192)
+    parser.add_argument("--motion", type=str, default="pan", choices=MOTION_PATTERNS)
+    parser.add_argument("--methods", type=str, nargs="+", default=list(METHODS), choices=list(METHODS))
+    parser.add_argument("--variants", type=str, nargs="+", default=["small"], choices=["full", "small"],
+                        help="要测试的RAFT变体")
+    parser.add_argument("--raft-checkpoint", type=str, default=None,
+                        help="RAFT权重（只能配合单个变体使用），默认使用随机初始化的权重")
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--warm-iters", type=int, default=8, help="warm方式热启动后的迭代次数")
+    parser.add_argument("--min-iters", type=int, default=4, help="adaptive方式的最少迭代次数")
+    parser.add_argument("--delta-mean-tol", type=float, default=0.01, help="adaptive方式 |delta_flow| 均值阈值")
+    parser.add_argument("--delta-max-tol", type=float, default=0.2, help="adaptive方式 |delta_flow| 最大值阈值")
+    parser.add_argument("--batch-size", type=int, default=None, help="clip方式每次调用的帧对数，默认自动")
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+    if args.raft_checkpoint is not None and len(args.variants) > 1:
+        parser.error("--raft-checkpoint 只能配合单个 --variants 使用")
+
+    torch.set_grad_enabled(False)
+    work_dir = tempfile.mkdtemp(prefix="prismflow_raft_bench_")
+    checkpoint = args.raft_checkpoint
+    # 分辨率取16的倍数，与 RAFT_estimate_flow 的处理分辨率一致，避免缩放带来的差异
+    frames = generate_synthetic_frames(args.frames, args.width // 16 * 16, args.height // 16 * 16, args.motion)
+    num_pairs = len(frames) - 1
+    for variant in args.variants:
+        args.small = variant == "small"
+        args.raft_checkpoint = checkpoint or build_stub_raft_checkpoint(work_dir, small=args.small)
+        print(f"\n🔍 RAFT基准: {args.frames}帧 {args.width}x{args.height}, "
+              f"{'RAFT small' if args.small else 'RAFT'}, 设备={args.device}")
+
+        _, reference, _ = run_method("legacy", frames, args)
+        legacy_time = None
+        print(f"{'方式':<10}{'总计(s)':>10}{'每帧对(ms)':>12}{'帧对/s':>10}{'加速比':>10}{'平均迭代':>10}{'EPE':>10}")
+        for name in args.methods:
+            elapsed, flows, mean_iters = run_method(name, frames, args)
+            if legacy_time is None:
+                legacy_time = elapsed if name == "legacy" else run_method("legacy", frames, args)[0]
+            print(f"{name:<10}{elapsed:>10.3f}{elapsed / num_pairs * 1000:>12.1f}{num_pairs / elapsed:>10.2f}"
+                  f"{legacy_time / elapsed:>10.3f}{mean_iters:>10.1f}{endpoint_error(flows, reference):>10.4f}")
+        if "warm" in args.methods:
+            model = local_flow_utils.RAFT_load_model(args.device, args.raft_checkpoint, args.small)
+            projection, saved = warm_start_cost(model, frames, args)
+            print(f"热启动: 投影 {projection * 1000:.2f}ms/帧对, "
+                  f"省下 {args.iters - args.warm_iters} 次迭代 {saved * 1000:.1f}ms/帧对")
+        local_flow_utils.RAFT_clear_memory()
+
+    unfold_time, lean_time = check_convex_upsample(args)
+    print(f"\n凸组合上采样: unfold {unfold_time * 1000:.2f}ms, 逐邻域累加 {lean_time * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
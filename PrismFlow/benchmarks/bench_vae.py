@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+VAE解码速度基准测试
+对比完整SD VAE与TAESD小型自编码器的每帧解码耗时（随机初始化权重，无需下载模型）
+
+用法:
+    python -m benchmarks.bench_vae --width 768 --height 512 --frames 5
+"""
+
+import argparse
+import time
+
+import torch
+from diffusers import AutoencoderKL, AutoencoderTiny
+
+# Stable Diffusion v1.5 VAE结构配置
+SD15_VAE_CONFIG = {
+    "in_channels": 3,
+    "out_channels": 3,
+    "down_block_types": ["DownEncoderBlock2D"] * 4,
+    "up_block_types": ["UpDecoderBlock2D"] * 4,
+    "block_out_channels": [128, 256, 512, 512],
+    "layers_per_block": 2,
+    "latent_channels": 4,
+    "sample_size": 512,
+}
+
+
+def build_vaes():
+    """构建随机初始化的完整VAE和TAESD"""
+    full_vae = AutoencoderKL(**SD15_VAE_CONFIG).eval()
+    tiny_vae = AutoencoderTiny().eval()
+    return full_vae, tiny_vae
+
+
+@torch.no_grad()
+def time_decode(vae, latents, frames, warmup=1):
+    """返回每帧平均解码耗时（秒）"""
+    for _ in range(warmup):
+        vae.decode(latents, return_dict=False)
+    start = time.perf_counter()
+    for _ in range(frames):
+        vae.decode(latents, return_dict=False)
+    return (time.perf_counter() - start) / frames
+
+
+@torch.no_grad()
+def time_encode(vae, images, frames, warmup=1):
+    """返回每帧平均编码耗时（秒）"""
+    for _ in range(warmup):
+        vae.encode(images, return_dict=False)
+    start = time.perf_counter()
+    for _ in range(frames):
+        vae.encode(images, return_dict=False)
+    return (time.perf_counter() - start) / frames
+
+
+def run_vae_benchmark(width=768, height=512, frames=3, device="cpu"):
+    """运行VAE基准测试，返回结果字典"""
+    full_vae, tiny_vae = build_vaes()
+    full_vae.to(device)
+    tiny_vae.to(device)
+
+    latents = torch.randn(1, 4, height // 8, width // 8, device=device)
+    images = torch.rand(1, 3, height, width, device=device) * 2 - 1
+
+    results = {
+        "full_decode": time_decode(full_vae, latents, frames),
+        "tiny_decode": time_decode(tiny_vae, latents, frames),
+        "full_encode": time_encode(full_vae, images, frames),
+        "tiny_encode": time_encode(tiny_vae, images, frames),
+    }
+    results["decode_speedup"] = results["full_decode"] / results["tiny_decode"]
+    results["encode_speedup"] = results["full_encode"] / results["tiny_encode"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VAE解码速度基准测试")
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--frames", type=int, default=3)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    print(f"🔍 VAE基准测试: {args.width}x{args.height}, {args.frames}帧, 设备={args.device}")
+    results = run_vae_benchmark(args.width, args.height, args.frames, args.device)
+
+    print(f"完整VAE解码: {results['full_decode'] * 1000:.1f} ms/帧")
+    print(f"TAESD解码:   {results['tiny_decode'] * 1000:.1f} ms/帧  (加速 {results['decode_speedup']:.1f}x)")
+    print(f"完整VAE编码: {results['full_encode'] * 1000:.1f} ms/帧")
+    print(f"TAESD编码:   {results['tiny_encode'] * 1000:.1f} ms/帧  (加速 {results['encode_speedup']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
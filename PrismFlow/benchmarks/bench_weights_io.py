@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+权重加载基准测试
+对比 .pth（torch.load + 修补键名/去前缀 + load_state_dict）与 convert_weights.py 转换后的 safetensors
+（mmap + load_state_dict(assign=True)）的加载耗时和每个进程的私有内存（USS）。
+每种方式在 --workers 个独立子进程中各加载一次，模拟服务的多个 worker；mmap 加载的权重在页缓存中共享，
+不计入各进程的私有内存。两种方式加载结果的一致性见 tests/test_weights_io.py。
+
+文件刚写完时在页缓存中，这里测到的是热启动；冷启动（清空页缓存后）时 mmap 只读取用到的页，差距更大。
+
+用法（在 PrismFlow 目录下）:
+    python -m benchmarks.bench_weights_io
+    python -m benchmarks.bench_weights_io --models raft --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import psutil
+import torch
+
+from cyclegan_lib.models import networks
+from benchmarks.stub_models import RAFT, build_stub_raft_checkpoint
+from weights_io import load_safetensors, load_weights, save_safetensors, safetensors_path, strip_prefix
+
+
+def build_model(name):
+    torch.manual_seed(0)
+    if name == "cyclegan":
+        return networks.define_G(3, 3, 64, 'resnet_9blocks', norm='instance', use_dropout=False)
+    return RAFT(argparse.Namespace(small=False, mixed_precision=False, alternate_corr=False, dropout=0))
+
+
+def load_worker(name, path, queue):
+    """子进程：加载一次权重，返回 (耗时, 加载后USS增量MB)；两种方式都用 assign=True，区别只在权重的来源"""
+    torch.set_num_threads(1)
+    process = psutil.Process()
+    uss = process.memory_full_info().uss
+    with torch.device("meta"):
+        # 在meta设备上建模型，不为随机初始化的参数分配内存，USS增量只反映加载的权重
+        model = build_model(name)
+    start = time.perf_counter()
+    if path.endswith(".safetensors"):
+        model.load_state_dict(load_safetensors(path), assign=True)
+    else:
+        model.load_state_dict(strip_prefix(load_weights(path), "module."), assign=True)
+    elapsed = time.perf_counter() - start
+    uss_delta = (process.memory_full_info().uss - uss) / (1024 * 1024)
+    queue.put((elapsed, uss_delta))
+
+
+def run_workers(name, path, workers):
+    """在 workers 个子进程中同时加载，返回各进程的结果列表"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=load_worker, args=(name, path, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=".pth 与 mmap safetensors 的权重加载对比")
+    parser.add_argument("--models", type=str, nargs="+", default=["cyclegan", "raft"], choices=["cyclegan", "raft"])
+    parser.add_argument("--workers", type=int, default=2, help="同时加载的子进程数")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="prismflow_weights_bench_")
+    try:
+        for name in args.models:
+            if name == "raft":
+                pth_path = build_stub_raft_checkpoint(work_dir, small=False)
+            else:
+                pth_path = os.path.join(work_dir, "latest_net_G_A.pth")
+                torch.save(build_model(name).state_dict(), pth_path)
+            model = build_model(name)
+            model.load_state_dict(strip_prefix(load_weights(pth_path), "module."))
+            sf_path = save_safetensors(model.state_dict(), safetensors_path(pth_path))
+            size_mb = os.path.getsize(sf_path) / (1024 * 1024)
+
+            print(f"\n🔍 {name}: {size_mb:.1f} MB, {args.workers} 个进程")
+            print(f"{'方式':<14}{'平均耗时(ms)':>14}{'每进程USS增量(MB)':>20}")
+            for label, path in (("pth", pth_path), ("safetensors", sf_path)):
+                results = run_workers(name, path, args.workers)
+                mean_time = sum(r[0] for r in results) / len(results)
+                mean_uss = sum(r[1] for r in results) / len(results)
+                print(f"{label:<14}{mean_time * 1000:>14.1f}{mean_uss:>20.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+基准测试用的替身模型
+全部使用随机初始化的权重，在CPU上离线运行，只用于测量吞吐量而非画质:
+- 小型 ResnetGenerator（通过真实的 CycleGANProcessor 加载路径加载）
+- RAFT small（随机权重，通过 RAFT_estimate_flow 的真实加载路径加载）
+- 替代 StableDiffusionControlNetPipeline 的可调用对象
+- 替代 LineartAnimeDetector 的边缘检测器
+"""
+
+import argparse
+import os
+import sys
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from cyclegan_lib.cyclegan_processor import CycleGANProcessor
+from cyclegan_lib.models import networks
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'optical_flow'))
+from RAFT.raft import RAFT
+
+STUB_CYCLEGAN_NAME = "stub_cyclegan"
+
+
+def build_stub_cyclegan(work_dir, ngf=8, netG='resnet_6blocks', device='cpu', seed=0,
+                        inference_backend='eager', warmup_size=None, batch_size=1):
+    """
+    保存一个随机初始化的小型生成器checkpoint，并通过 CycleGANProcessor 加载
+
+    Returns:
+        CycleGANProcessor 实例
+    """
+    torch.manual_seed(seed)
+    checkpoints_dir = os.path.join(work_dir, "checkpoints")
+    save_dir = os.path.join(checkpoints_dir, STUB_CYCLEGAN_NAME)
+    os.makedirs(save_dir, exist_ok=True)
+
+    net = networks.define_G(3, 3, ngf, netG, norm='instance', use_dropout=False)
+    torch.save(net.state_dict(), os.path.join(save_dir, "latest_net_G_A.pth"))
+
+    gpu_ids = '-1' if device == 'cpu' else str(torch.device(device).index or 0)
+    return CycleGANProcessor(
+        model_name=STUB_CYCLEGAN_NAME,
+        netG=netG,
+        norm='instance',
+        no_dropout=True,
+        gpu_ids=gpu_ids,
+        generator_suffix='_A',
+        preserve_resolution=True,
+        checkpoints_dir=checkpoints_dir,
+        ngf=ngf,
+        inference_backend=inference_backend,
+        warmup_size=warmup_size,
+        batch_size=batch_size,
+    )
+
+
+def build_stub_raft_checkpoint(work_dir, small=True, seed=0):
+    """
+    保存一个随机初始化的RAFT checkpoint（与官方checkpoint一样带 module. 前缀）
+
+    Returns:
+        checkpoint路径
+    """
+    torch.manual_seed(seed)
+    args = argparse.Namespace(small=small, mixed_precision=False, alternate_corr=False, dropout=0)
+    model = torch.nn.DataParallel(RAFT(args))
+    path = os.path.join(work_dir, "raft-small-random.pth" if small else "raft-random.pth")
+    torch.save(model.state_dict(), path)
+    return path
+
+
+class StubDiffusionPipeline:
+    """
+    StableDiffusionControlNetPipeline 的替身
+
+    每个推理步执行一次小型卷积网络前向，使耗时与 num_inference_steps 成正比，
+    输出为对输入图像的简单色调处理。
+    """
+
+    def __init__(self, device='cpu', channels=32, seed=0):
+        torch.manual_seed(seed)
+        self.device = device
+        self.net = torch.nn.Sequential(
+            torch.nn.Conv2d(4, channels, 3, padding=1),
+            torch.nn.SiLU(),
+            torch.nn.Conv2d(channels, 4, 3, padding=1),
+        ).to(device).eval()
+
+    @torch.no_grad()
+    def __call__(self, prompt=None, negative_prompt=None, image=None, control_image=None,
+                 num_inference_steps=20, strength=0.75, guidance_scale=7.5, generator=None,
+                 mask_image=None, **kwargs):
+        width, height = image.size
+        latents = torch.randn(1, 4, height // 8, width // 8, device=self.device)
+        for _ in range(max(int(num_inference_steps * strength), 1)):
+            latents = latents - 0.1 * self.net(latents)
+
+        styled = (np.asarray(image, dtype=np.float32) // 32) * 32 + 16
+        return SimpleNamespace(images=[Image.fromarray(np.clip(styled, 0, 255).astype(np.uint8))])
+
+
+class StubLineartDetector:
+    """LineartAnimeDetector 的替身，使用Canny边缘"""
+
+    def __call__(self, image):
+        gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        return Image.fromarray(cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB))
@@ -0,0 +1,98 @@
+"""
+合成测试视频生成
+生成带纹理的画面并施加可配置的运动模式，用于离线基准测试（无需真实素材）
+"""
+
+import cv2
+import numpy as np
+
+MOTION_PATTERNS = ("static", "pan", "zoom", "rotate", "objects")
+
+
+def make_texture(width, height, seed=0):
+    """生成多尺度随机纹理并叠加若干几何图形，保证光流估计有足够的特征"""
+    rng = np.random.RandomState(seed)
+    texture = np.zeros((height, width, 3), dtype=np.float32)
+    for scale in (4, 16, 64):
+        noise = rng.rand(max(height // scale, 2), max(width // scale, 2), 3).astype(np.float32)
+        texture += cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    texture = texture / 3.0 * 255.0
+
+    for _ in range(12):
+        color = tuple(int(c) for c in rng.randint(0, 256, 3))
+        center = (int(rng.randint(0, width)), int(rng.randint(0, height)))
+        if rng.rand() < 0.5:
+            cv2.circle(texture, center, int(rng.randint(8, max(min(width, height) // 6, 9))), color, -1)
+        else:
+            size = rng.randint(8, max(min(width, height) // 5, 9), 2)
+            cv2.rectangle(texture, center, (center[0] + int(size[0]), center[1] + int(size[1])), color, -1)
+
+    return np.clip(texture, 0, 255).astype(np.uint8)
+
+
+def _affine_for_frame(motion, index, width, height, speed):
+    """返回第index帧相对首帧的仿射矩阵"""
+    cx, cy = width / 2.0, height / 2.0
+    if motion == "pan":
+        return np.float32([[1, 0, -speed * index], [0, 1, -0.5 * speed * index]])
+    if motion == "zoom":
+        return cv2.getRotationMatrix2D((cx, cy), 0, 1.0 + 0.01 * speed * index)
+    if motion == "rotate":
+        return cv2.getRotationMatrix2D((cx, cy), 0.5 * speed * index, 1.0)
+    return np.float32([[1, 0, 0], [0, 1, 0]])
+
+
+def generate_synthetic_frames(num_frames=16, width=320, height=192, motion="pan", speed=2.0, seed=0):
+    """
+    生成合成帧序列
+
+    Args:
+        num_frames: 帧数
+        width, height: 分辨率
+        motion: 运动模式，见 MOTION_PATTERNS
+        speed: 运动速度（像素/帧 或 对应的缩放/旋转步长）
+        seed: 随机种子
+
+    Returns:
+        RGB帧列表 (uint8, HxWx3)
+    """
+    if motion not in MOTION_PATTERNS:
+        raise ValueError(f"未知的运动模式: {motion}，可选: {', '.join(MOTION_PATTERNS)}")
+
+    # 背景纹理比画面大一圈，平移时不会露出空白边缘
+    margin = int(speed * num_frames) + 16
+    background = make_texture(width + 2 * margin, height + 2 * margin, seed)
+    rng = np.random.RandomState(seed + 1)
+    sprites = [
+        (rng.randint(0, width), rng.randint(0, height), rng.uniform(-speed, speed) * 2,
+         rng.uniform(-speed, speed) * 2, tuple(int(c) for c in rng.randint(0, 256, 3)))
+        for _ in range(4)
+    ]
+
+    frames = []
+    for i in range(num_frames):
+        matrix = _affine_for_frame(motion, i, width, height, speed).copy()
+        matrix[:, 2] += margin
+        frame = cv2.warpAffine(
+            background, matrix, (width, height),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REFLECT
+        )
+        if motion == "objects":
+            for x, y, vx, vy, color in sprites:
+                px = int((x + vx * i) % width)
+                py = int((y + vy * i) % height)
+                cv2.rectangle(frame, (px, py), (px + width // 10, py + height // 10), color, -1)
+        frames.append(frame)
+    return frames
+
+
+def write_synthetic_video(path, frames, fps=24):
+    """把RGB帧写成mp4视频，返回输出路径"""
+    height, width = frames[0].shape[:2]
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not out.isOpened():
+        raise IOError(f"无法创建视频文件: {path}")
+    for frame in frames:
+        out.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    out.release()
+    return path
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+权重转换工具
+把 CycleGAN / RAFT 的 .pth checkpoint 转换为 safetensors（见 weights_io），写在 .pth 旁边。
+转换后 CycleGANProcessor 和 RAFT 加载时自动优先使用 .safetensors（.pth 更新后会自动回到 .pth）。
+
+用法（在 PrismFlow 目录下）:
+    python convert_weights.py cyclegan own_cyclegan --netG resnet_9blocks --norm instance
+    python convert_weights.py raft models/RAFT/raft-sintel.pth models/RAFT/raft-small.pth
+"""
+
+import argparse
+import os
+import sys
+
+import torch
+
+from weights_io import load_safetensors, load_weights, save_safetensors, safetensors_path, strip_prefix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'optical_flow'))
+
+
+def convert_cyclegan(args):
+    """加载（并修补）CycleGAN生成器后，把网络自身的 state_dict 保存为 safetensors"""
+    from cyclegan_lib.cyclegan_processor import CycleGANProcessor
+    from cyclegan_lib.models import create_model
+
+    opt = CycleGANProcessor._get_test_options(
+        args.name, args.netG, args.norm, not args.dropout, '-1', args.suffix, args.checkpoints_dir, args.ngf
+    )
+    opt.epoch = args.epoch
+    model = create_model(opt)
+    model.setup(opt)
+    for path in model.export_networks(args.epoch):
+        print(f"✅ 已保存: {path}")
+
+
+def convert_raft(args):
+    """去掉 DataParallel 的 "module." 前缀，确认能载入 RAFT 或 RAFT-small 后保存为 safetensors"""
+    from RAFT.raft import RAFT
+
+    for path in args.checkpoints:
+        print(f"\n🔄 转换: {path}")
+        state_dict = strip_prefix(load_weights(path), "module.")
+        variant = None
+        for small in (False, True):
+            model = RAFT(argparse.Namespace(small=small, mixed_precision=False, alternate_corr=False, dropout=0))
+            try:
+                model.load_state_dict(state_dict)
+            except RuntimeError:
+                continue
+            variant = "RAFT-small" if small else "RAFT"
+            break
+        if variant is None:
+            print("❌ 不是RAFT或RAFT-small的checkpoint，跳过")
+            continue
+
+        output = save_safetensors(state_dict, safetensors_path(path), metadata={"variant": variant})
+        reloaded = load_safetensors(output)
+        assert all(torch.equal(reloaded[name], tensor) for name, tensor in state_dict.items())
+        print(f"✅ {variant}: 已保存 {output} ({os.path.getsize(output) / (1024 * 1024):.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 CycleGAN / RAFT checkpoint 转换为 safetensors")
+    subparsers = parser.add_subparsers(dest="model", required=True)
+
+    cyclegan = subparsers.add_parser("cyclegan", help="转换 CycleGAN 生成器")
+    cyclegan.add_argument("name", type=str, help="checkpoints 目录下的模型名称")
+    cyclegan.add_argument("--checkpoints-dir", type=str, default=None, help="默认为 cyclegan_lib/checkpoints")
+    cyclegan.add_argument("--netG", type=str, default="resnet_9blocks")
+    cyclegan.add_argument("--norm", type=str, default="instance")
+    cyclegan.add_argument("--ngf", type=int, default=64)
+    cyclegan.add_argument("--dropout", action="store_true", help="生成器带dropout（与训练时的 --no_dropout 相反）")
+    cyclegan.add_argument("--suffix", type=str, default="_A", help="生成器后缀，如 _A 或 _B")
+    cyclegan.add_argument("--epoch", type=str, default="latest")
+    cyclegan.set_defaults(func=convert_cyclegan)
+
+    raft = subparsers.add_parser("raft", help="转换 RAFT / RAFT-small 权重")
+    raft.add_argument("checkpoints", type=str, nargs="+", help=".pth 文件")
+    raft.set_defaults(func=convert_raft)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
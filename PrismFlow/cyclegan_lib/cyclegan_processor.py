@@ -1,14 +1,26 @@
 import torch
+import torch.nn.functional as F
 import torchvision.transforms as transforms
 from PIL import Image
 import os
 import argparse
+import hashlib
+import numpy as np
 from .models import create_model
 from .options.test_options import TestOptions
 from . import util
+from inference_opt import (
+    AutocastModule, QUANTIZATION_MODES, ShapeCachedModule, int8_engine, optimize_module, prepare_for_inference,
+    quantize_int8,
+)
+from weights_io import resolve_weights
+
+# 量化输出与fp32逐位一致时PSNR为无穷大，报告中按该值封顶（json.dump 会把 inf 写成非标准的 Infinity）
+QUANTIZATION_PSNR_CAP = 100.0
 
 class CycleGANProcessor:
-    def __init__(self, model_name, netG='resnet_9blocks', norm='instance', no_dropout=True, gpu_ids='0', generator_suffix='_A', preserve_resolution=True):
+    def __init__(self, model_name, netG='resnet_9blocks', norm='instance', no_dropout=True, gpu_ids='0', generator_suffix='_A', preserve_resolution=True,
+                 checkpoints_dir=None, ngf=64, inference_backend='eager', warmup_size=None, batch_size=1):
         """
         初始化CycleGAN处理器，加载模型到内存中。
         参数:
@@ -19,20 +31,120 @@ class CycleGANProcessor:
         - gpu_ids (str): 使用的GPU ID, '0', '1', '-1' for CPU.
         - generator_suffix (str): 要使用的生成器后缀, 如 '_A' (用于A->B) 或 '_B' (用于B->A).
         - preserve_resolution (bool): 是否保持原始分辨率，如果False则缩放到256x256
+        - checkpoints_dir (str): 模型checkpoints目录，None时使用本库下的 checkpoints 目录
+        - ngf (int): 生成器最后一层卷积的通道数，需与checkpoint一致
+        - inference_backend (str): 推理优化后端 'eager' | 'compile' | 'script'，非eager时同时启用channels_last
+        - warmup_size (tuple): 预热用的输入尺寸 (width, height)，在加载阶段生成对应形状的编译产物
+        - batch_size (int): process_batch 每次送入生成器的帧数，预热时也按该批大小生成编译产物
         """
         self.preserve_resolution = preserve_resolution
-        opt = self._get_test_options(model_name, netG, norm, no_dropout, gpu_ids, generator_suffix)
+        self.batch_size = batch_size
+        opt = self._get_test_options(model_name, netG, norm, no_dropout, gpu_ids, generator_suffix, checkpoints_dir, ngf)
         self.opt = opt
         self.device = torch.device('cuda:{}'.format(opt.gpu_ids[0])) if opt.gpu_ids else torch.device('cpu')
         self.model = create_model(opt)
         self.model.setup(opt)
         self.model.eval()
+        # 去掉恒等层和dropout，折叠BatchNorm（--norm batch）。折叠会生成新的卷积权重，
+        # 这部分不再是 safetensors 文件映射的视图，不在进程间共享；InstanceNorm 的生成器不受影响
+        self.model.netG = prepare_for_inference(self.model.netG)
         self._setup_transform()
+        self.inference_backend = inference_backend
+        if inference_backend != 'eager':
+            self._optimize_generator(inference_backend)
+            if warmup_size is not None:
+                self.process_batch(np.zeros((batch_size, warmup_size[1], warmup_size[0], 3), dtype=np.uint8))
         
         print(f"CycleGAN model '{model_name}' (netG: {netG}, norm: {norm}) with generator 'G{generator_suffix}' loaded successfully.")
         print(f"分辨率保持模式: {'开启' if preserve_resolution else '关闭 (固定256x256)'}")
 
-    def _get_test_options(self, model_name, netG, norm, no_dropout, gpu_ids, generator_suffix):
+    def _optimize_generator(self, backend):
+        """用编译后的生成器替换模型中的netG（按输入形状缓存编译产物）"""
+        net = self.model.netG
+        if isinstance(net, torch.nn.DataParallel):
+            net = net.module
+        self.model.netG = optimize_module(net, backend=backend, channels_last=True)
+        print(f"CycleGAN生成器推理优化: {backend} + channels_last")
+
+    def _generator(self):
+        """未经编译包装的生成器模块"""
+        net = self.model.netG
+        if isinstance(net, (torch.nn.DataParallel, ShapeCachedModule)):
+            net = net.module
+        return net
+
+    def _checkpoint_path(self):
+        """当前生成器的checkpoint路径（与 BaseModel.load_networks 的命名一致）"""
+        epoch = 'iter_%d' % self.opt.load_iter if self.opt.load_iter > 0 else self.opt.epoch
+        return os.path.join(self.model.save_dir, '%s_net_G%s.pth' % (epoch, self.opt.model_suffix))
+
+    def _quantized_cache_path(self, engine):
+        """
+        INT8模型缓存在checkpoint旁边，文件名带实际加载的权重文件（.pth 或转换后的 .safetensors）内容的哈希
+        和量化引擎，权重更新后自动失效
+        """
+        checkpoint = self._checkpoint_path()
+        h = hashlib.blake2b(digest_size=8)
+        with open(resolve_weights(checkpoint), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return f"{os.path.splitext(checkpoint)[0]}.{h.hexdigest()}.{engine}.int8.pt"
+
+    @torch.no_grad()
+    def quantize(self, frames, mode='int8', num_calibration=8, use_cache=True):
+        """
+        把生成器切换为CPU量化推理（opt-in），返回 {"mode", "psnr", "cached"}，未启用时返回None
+
+        frames: 本任务的输入帧（RGB uint8数组），从中均匀抽取 num_calibration 帧用于INT8校准和质量评估
+        mode: 'int8' 为静态INT8量化，当前PyTorch不支持INT8卷积或量化失败时回退为 'bf16'（bf16自动混合精度）
+        use_cache: INT8模型缓存在checkpoint旁边，下次加载直接复用（不再校准）
+        psnr: 量化输出相对fp32输出的平均PSNR（dB），在抽取的帧上计算，每帧封顶为 QUANTIZATION_PSNR_CAP
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"未知的量化模式: {mode}，可选: {', '.join(QUANTIZATION_MODES)}")
+        if mode == 'none':
+            return None
+        if self.device.type != 'cpu':
+            print(f"ℹ️ CycleGAN量化推理只用于CPU，当前设备为 {self.device}，保持fp32")
+            return None
+
+        net = self._generator()
+        indices = np.linspace(0, len(frames) - 1, min(num_calibration, len(frames))).round().astype(int)
+        inputs = [self._frames_to_tensor(np.asarray(frames[i])[None])[0] for i in sorted(set(indices))]
+        references = [net(x) for x in inputs]
+
+        quantized, cached = None, False
+        if mode == 'int8':
+            engine = int8_engine()
+            if engine is None:
+                print("⚠️ 当前PyTorch不支持INT8卷积，CycleGAN改用bf16推理")
+            else:
+                try:
+                    cache_path = self._quantized_cache_path(engine) if use_cache else None
+                    if cache_path is not None and os.path.isfile(cache_path):
+                        torch.backends.quantized.engine = engine
+                        quantized, cached = torch.jit.load(cache_path), True
+                    else:
+                        quantized = quantize_int8(net, inputs)
+                        if cache_path is not None:
+                            torch.jit.save(quantized, cache_path)
+                except Exception as e:
+                    print(f"⚠️ CycleGAN INT8量化失败，改用bf16推理: {e}")
+                    quantized = None
+            if quantized is None:
+                mode = 'bf16'
+        if mode == 'bf16':
+            quantized = AutocastModule(net, 'cpu', torch.bfloat16)
+
+        psnr = float(np.mean([min(util.psnr(util.tensor2im(reference), util.tensor2im(quantized(x))),
+                                  QUANTIZATION_PSNR_CAP)
+                              for x, reference in zip(inputs, references)]))
+        self.model.netG = quantized
+        print(f"CycleGAN量化推理: {mode}{' (缓存)' if cached else ''}，相对fp32 PSNR {psnr:.2f} dB")
+        return {"mode": mode, "psnr": round(psnr, 3), "cached": cached}
+
+    @staticmethod
+    def _get_test_options(model_name, netG, norm, no_dropout, gpu_ids, generator_suffix, checkpoints_dir=None, ngf=64):
         """内部函数，用于手动构建一个options对象以加载模型"""
         parser = argparse.ArgumentParser()
         opt_parser = TestOptions().initialize(parser)
@@ -43,6 +155,7 @@ class CycleGANProcessor:
         opt.netG = netG
         opt.norm = norm
         opt.no_dropout = no_dropout
+        opt.ngf = ngf
 
         opt.model = 'test'
         opt.dataset_mode = 'single'
@@ -50,8 +163,10 @@ class CycleGANProcessor:
         
         # 【修复】使用绝对路径确保无论在什么目录下运行都能找到模型
         # 获取当前文件所在目录的绝对路径
-        current_file_dir = os.path.dirname(os.path.abspath(__file__))
-        opt.checkpoints_dir = os.path.join(current_file_dir, 'checkpoints')
+        if checkpoints_dir is None:
+            current_file_dir = os.path.dirname(os.path.abspath(__file__))
+            checkpoints_dir = os.path.join(current_file_dir, 'checkpoints')
+        opt.checkpoints_dir = checkpoints_dir
         
         opt.gpu_ids = [int(id) for id in gpu_ids.split(',')] if gpu_ids != '-1' else []
         opt.direction = 'AtoB'
@@ -102,6 +217,66 @@ class CycleGANProcessor:
         paste_x, paste_y, orig_width, orig_height = crop_info
         return img.crop((paste_x, paste_y, paste_x + orig_width, paste_y + orig_height))
 
+    def _to_input_tensor(self, pil_image):
+        """把PIL图像转换为生成器的输入张量，返回 (张量, 填充信息)；保持分辨率时填充到4的倍数"""
+        if self.preserve_resolution:
+            padded_image, crop_info = self._pad_to_multiple_of_4(pil_image.convert('RGB'))
+            return self.transform_no_resize(padded_image).unsqueeze(0).to(self.device), crop_info
+        return self.transform(pil_image.convert('RGB')).unsqueeze(0).to(self.device), None
+
+    def _frames_to_tensor(self, frames):
+        """
+        把 (N, H, W, 3) uint8 数组转换为生成器的输入张量（在目标设备上完成归一化和填充），返回 (张量, 填充信息)
+
+        保持分辨率时与 _to_input_tensor 的结果一致（四周居中填充黑色到4的倍数）；
+        否则缩放到256x256，插值在张量上完成，与PIL的bicubic略有差异。
+        """
+        x = torch.from_numpy(np.ascontiguousarray(frames)).to(self.device, non_blocking=True)
+        x = x.permute(0, 3, 1, 2).float()
+        if not self.preserve_resolution:
+            x = F.interpolate(x, size=(256, 256), mode='bicubic', align_corners=False, antialias=True)
+            x = x.round_().clamp_(0, 255)
+        # 与 ToTensor + Normalize((0.5,) * 3, (0.5,) * 3) 相同
+        x = x.div_(255).sub_(0.5).div_(0.5)
+        if not self.preserve_resolution:
+            return x, None
+
+        height, width = x.shape[-2:]
+        pad_w, pad_h = (4 - width % 4) % 4, (4 - height % 4) % 4
+        if not pad_w and not pad_h:
+            return x, None
+        left, top = pad_w // 2, pad_h // 2
+        # 填充的黑色像素归一化后为 -1
+        x = F.pad(x, (left, pad_w - left, top, pad_h - top), value=-1.0)
+        return x, (left, top, width, height)
+
+    @staticmethod
+    def _tensor_to_frames(y, crop_info):
+        """把生成器输出裁掉填充并转换回 (N, H, W, 3) uint8 数组（与 util.tensor2im 的取整方式一致）"""
+        if crop_info is not None:
+            left, top, width, height = crop_info
+            y = y[:, :, top:top + height, left:left + width]
+        y = (y.float() + 1) / 2.0 * 255.0
+        return y.to(torch.uint8).permute(0, 2, 3, 1).contiguous().cpu().numpy()
+
+    @torch.no_grad()
+    def process_batch(self, frames, batch_size=None):
+        """
+        批量处理RGB帧，输入和输出都是 (N, H, W, 3) uint8 数组，不经过PIL
+
+        填充、归一化和反归一化都在目标设备上以张量运算完成，每 batch_size 帧（默认为构造时的 batch_size）
+        调用一次生成器。保持分辨率时输出与输入同尺寸，否则为 256x256（与 process_frame 相同）。
+        保持分辨率且 batch_size=1 时与 process_frame 逐位一致；批大小大于1时卷积内核的累加顺序不同，
+        个别像素可能相差1（uint8取整边界）。
+        """
+        frames = np.asarray(frames)
+        batch_size = batch_size or self.batch_size
+        outputs = []
+        for start in range(0, len(frames), batch_size):
+            x, crop_info = self._frames_to_tensor(frames[start:start + batch_size])
+            outputs.append(self._tensor_to_frames(self.model.netG(x), crop_info))
+        return np.concatenate(outputs) if len(outputs) != 1 else outputs[0]
+
     @torch.no_grad()
     def process_frame(self, pil_image):
         """
@@ -110,12 +285,9 @@ class CycleGANProcessor:
         if self.preserve_resolution:
             # 保持原始分辨率的处理流程
             original_size = pil_image.size
-            rgb_image = pil_image.convert('RGB')
             
             # 填充到4的倍数以确保网络兼容
-            padded_image, crop_info = self._pad_to_multiple_of_4(rgb_image)
-            
-            tensor_image = self.transform_no_resize(padded_image).unsqueeze(0).to(self.device)
+            tensor_image, crop_info = self._to_input_tensor(pil_image)
             
             # CycleGAN处理
             self.model.set_input({'A': tensor_image, 'A_paths': ''})
@@ -133,7 +305,7 @@ class CycleGANProcessor:
             
             return result_pil
         else:
-            tensor_image = self.transform(pil_image.convert('RGB')).unsqueeze(0).to(self.device)
+            tensor_image, _ = self._to_input_tensor(pil_image)
             self.model.set_input({'A': tensor_image, 'A_paths': ''})
             self.model.test()
             visuals = self.model.get_current_visuals()
@@ -3,6 +3,7 @@ import torch
 from collections import OrderedDict
 from abc import ABC, abstractmethod
 from . import networks
+from weights_io import load_safetensors, load_weights, resolve_weights, save_safetensors
 
 
 class BaseModel(ABC):
@@ -186,18 +187,42 @@ class BaseModel(ABC):
                 net = getattr(self, 'net' + name)
                 if isinstance(net, torch.nn.DataParallel):
                     net = net.module
+                load_path = resolve_weights(load_path)
                 print('loading the model from %s' % load_path)
+                if load_path.endswith('.safetensors'):
+                    # converted by convert_weights.py: keys are already patched; assign the
+                    # memory-mapped tensors instead of copying them into the network
+                    net.load_state_dict(load_safetensors(load_path, device=str(self.device)), assign=True)
+                    continue
                 # if you are using PyTorch newer than 0.4 (e.g., built from
                 # GitHub source), you can remove str() on self.device
-                state_dict = torch.load(load_path, map_location=str(self.device))
-                if hasattr(state_dict, '_metadata'):
-                    del state_dict._metadata
+                state_dict = load_weights(load_path, device=str(self.device))
 
                 # patch InstanceNorm checkpoints prior to 0.4
                 for key in list(state_dict.keys()):  # need to copy keys here because we mutate in loop
                     self.__patch_instance_norm_state_dict(state_dict, net, key.split('.'))
                 net.load_state_dict(state_dict)
 
+    def export_networks(self, epoch):
+        """Save the loaded networks as safetensors next to their .pth files (see weights_io).
+
+        The saved state dicts are those of the networks themselves, i.e. with InstanceNorm keys already patched.
+
+        Parameters:
+            epoch (int) -- current epoch; used in the file name '%s_net_%s.safetensors' % (epoch, name)
+
+        Returns the list of written paths.
+        """
+        paths = []
+        for name in self.model_names:
+            if isinstance(name, str):
+                save_path = os.path.join(self.save_dir, '%s_net_%s.safetensors' % (epoch, name))
+                net = getattr(self, 'net' + name)
+                if isinstance(net, torch.nn.DataParallel):
+                    net = net.module
+                paths.append(save_safetensors(net.state_dict(), save_path))
+        return paths
+
     def print_networks(self, verbose):
         """Print the total number of parameters in the network and (if verbose) network architecture
 
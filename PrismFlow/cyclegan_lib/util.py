@@ -27,6 +27,19 @@ def tensor2im(input_image, imtype=np.uint8):
     return image_numpy.astype(imtype)
 
 
+def psnr(image_a, image_b, data_range=255.0):
+    """Peak signal-to-noise ratio (dB) between two numpy images of the same shape
+
+    Parameters:
+        image_a, image_b (numpy array) -- images to compare, e.g. outputs of tensor2im
+        data_range (float)             -- the maximum possible pixel value
+    """
+    mse = np.mean((image_a.astype(np.float64) - image_b.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float('inf')
+    return float(10 * np.log10(data_range ** 2 / mse))
+
+
 def diagnose_network(net, name='network'):
     """Calculate and print the mean of average absolute(gradients)
 
@@ -14,11 +14,14 @@ import json
 # 导入真实的视频处理函数
 try:
     from run_v2v_v2_with_lora import process_video_entrypoint
+    from tiny_vae import VAE_MODES
     PROCESSING_AVAILABLE = True
     print("✅ 视频处理模块加载成功")
 except ImportError as e:
     print(f"❌ 视频处理模块加载失败: {e}")
     PROCESSING_AVAILABLE = False
+    # 处理模块不可用时 start_processing 直接返回错误，这里只保证名称有定义
+    VAE_MODES = ()
 
 app = Flask(__name__)
 CORS(app)  # 启用跨域支持
@@ -120,6 +123,7 @@ def process_video_async(task_id, input_path, params):
         lora_weight = float(params.get('loraWeight', 0.8))
         style_strength = float(params.get('styleStrength', 0.75))
         random_seed = int(params.get('randomSeed', -1))
+        vae_mode = params.get('vaeMode', 'full')
         
         # 映射处理模式到内部格式
         mode_mapping = {
@@ -160,6 +164,7 @@ def process_video_async(task_id, input_path, params):
             processing_mode=internal_mode,
             lora_model_name=lora_model,
             lora_weight=lora_weight,
+            vae_mode=vae_mode,
             progress=mock_progress
         )
         
@@ -259,12 +264,15 @@ def start_processing():
             lora_weight = float(data.get('loraWeight', 0.8)) if data.get('loraWeight') is not None else 0.8
             style_strength = float(data.get('styleStrength', 0.75)) if data.get('styleStrength') is not None else 0.75
             random_seed = int(data.get('randomSeed', -1)) if data.get('randomSeed') is not None else -1
+            vae_mode = data.get('vaeMode') or 'full'
             
             # 参数范围验证
             if not (0.0 <= lora_weight <= 2.0):
                 return jsonify({'error': 'LoRA权重必须在0.0-2.0范围内'}), 400
             if not (0.0 <= style_strength <= 1.0):
                 return jsonify({'error': '风格强度必须在0.0-1.0范围内'}), 400
+            if vae_mode not in VAE_MODES:
+                return jsonify({'error': f'VAE模式必须是 {", ".join(VAE_MODES)} 之一'}), 400
                 
         except (ValueError, TypeError) as e:
             return jsonify({'error': f'参数类型错误: {str(e)}'}), 400
@@ -281,7 +289,8 @@ def start_processing():
                 'loraModel': data.get('loraModel', 'none'),
                 'loraWeight': lora_weight,
                 'styleStrength': style_strength,
-                'randomSeed': random_seed
+                'randomSeed': random_seed,
+                'vaeMode': vae_mode
             },
             'startTime': time.time(),
             'completed': False,
@@ -0,0 +1,281 @@
+"""
+推理优化模块 - 对PyTorch模块进行可选的图编译与内存布局优化
+
+CPU上还可以用 quantize_int8（FX静态INT8量化）或 AutocastModule（bf16自动混合精度）降低卷积网络的开销。
+
+另外提供 prepare_for_inference：把eval模式的BatchNorm折叠进前面的卷积、去掉恒等层和dropout，
+可选地把 Conv2d+ReLU 合并为融合模块，在任何后端之前使用。
+
+支持的后端:
+- "eager":   不做任何处理（默认）
+- "compile": torch.compile，失败时回退到 "script"
+- "script":  torch.jit.trace + torch.jit.freeze，失败时回退到 eager
+
+编译产物按输入形状缓存（TorchScript的trace结果只对固定形状可靠，
+torch.compile 也会针对每个形状特化），并支持在模型加载时预热。
+"""
+
+import copy
+
+import torch
+import torch.nn as nn
+from torch.ao.nn.intrinsic import ConvReLU2d
+from torch.nn.modules.dropout import _DropoutNd
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+INFERENCE_BACKENDS = ("eager", "compile", "script")
+QUANTIZATION_MODES = ("none", "int8", "bf16")
+
+# INT8卷积可用的量化引擎，按优先顺序
+_INT8_ENGINES = ("x86", "fbgemm", "onednn")
+
+# 每个后端失败时依次尝试的回退顺序
+_FALLBACK_CHAIN = {
+    "compile": ("compile", "script", "eager"),
+    "script": ("script", "eager"),
+    "eager": ("eager",),
+}
+
+
+def _flatten_tensors(obj):
+    """展开嵌套的list/tuple，返回其中的所有张量"""
+    if isinstance(obj, torch.Tensor):
+        return [obj]
+    if isinstance(obj, (list, tuple)):
+        tensors = []
+        for item in obj:
+            tensors.extend(_flatten_tensors(item))
+        return tensors
+    return []
+
+
+def _map_tensors(obj, fn):
+    """对嵌套结构中的每个张量应用fn，保持结构不变"""
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    if isinstance(obj, list):
+        return [_map_tensors(item, fn) for item in obj]
+    if isinstance(obj, tuple):
+        return tuple(_map_tensors(item, fn) for item in obj)
+    return obj
+
+
+def _to_channels_last(t):
+    return t.contiguous(memory_format=torch.channels_last) if t.dim() == 4 else t
+
+
+def _to_contiguous(t):
+    # 下游代码（如RAFT的CorrBlock）会对输出做view，必须恢复为NCHW连续布局
+    return t.contiguous() if t.dim() == 4 else t
+
+
+class ShapeCachedModule(nn.Module):
+    """
+    按输入形状缓存编译结果的模块包装器
+
+    第一次遇到某个输入形状时构建编译产物，之后相同形状直接复用。
+    编译失败时按 compile -> script -> eager 的顺序回退，不会中断推理。
+    """
+
+    def __init__(self, module, backend="compile", channels_last=True):
+        super().__init__()
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"未知的推理后端: {backend}，可选: {', '.join(INFERENCE_BACKENDS)}")
+        self.module = module.eval()
+        self.backend = backend
+        self.channels_last = channels_last
+        self._cache = {}
+
+        if channels_last:
+            self.module.to(memory_format=torch.channels_last)
+
+    @staticmethod
+    def _shape_key(args):
+        return tuple((tuple(t.shape), t.dtype, t.device.type, torch.is_autocast_enabled())
+                     for t in _flatten_tensors(args))
+
+    def _build(self, backend, args):
+        if backend == "compile":
+            return torch.compile(self.module, dynamic=False)
+        if backend == "script":
+            traced = torch.jit.trace(self.module, args, check_trace=False)
+            return torch.jit.freeze(traced)
+        return self.module
+
+    def _build_and_run(self, key, args):
+        for backend in _FALLBACK_CHAIN[self.backend]:
+            try:
+                compiled = self._build(backend, args)
+                output = compiled(*args)
+            except Exception as e:
+                print(f"⚠️ {type(self.module).__name__} 的 {backend} 推理优化失败，尝试回退: {e}")
+                continue
+            self._cache[key] = compiled
+            return output
+        raise RuntimeError("eager 推理失败")
+
+    def forward(self, *args):
+        if self.channels_last:
+            args = _map_tensors(args, _to_channels_last)
+
+        key = self._shape_key(args)
+        compiled = self._cache.get(key)
+        if compiled is None:
+            output = self._build_and_run(key, args)
+        else:
+            output = compiled(*args)
+
+        if self.channels_last:
+            output = _map_tensors(output, _to_contiguous)
+        return output
+
+
+def optimize_module(module, backend="compile", channels_last=True):
+    """
+    对模块应用推理优化，backend为 "eager" 且不使用channels_last时原样返回
+    """
+    if backend == "eager" and not channels_last:
+        return module
+    return ShapeCachedModule(module, backend=backend, channels_last=channels_last)
+
+
+@torch.no_grad()
+def warmup(fn, *example_args, runs=1):
+    """用示例输入调用若干次，使编译产物在加载阶段而不是第一帧时生成"""
+    for _ in range(runs):
+        fn(*example_args)
+
+
+# 不是 nn.Sequential 的模块里，forward 中紧接着的 (卷积, 归一化) 属性对，以及只在训练时使用的dropout属性
+# （RAFT特征编码器及其残差块；CycleGAN生成器全部由 nn.Sequential 组成，不需要登记）
+_CONV_NORM_ATTRS = {
+    "BasicEncoder": [("conv1", "norm1")],
+    "SmallEncoder": [("conv1", "norm1")],
+    "ResidualBlock": [("conv1", "norm1"), ("conv2", "norm2")],
+    "BottleneckBlock": [("conv1", "norm1"), ("conv2", "norm2"), ("conv3", "norm3")],
+}
+# 只通过 downsample（nn.Sequential）使用、在其中被折叠后不再需要的归一化属性
+_DOWNSAMPLE_NORM_ATTRS = {
+    "ResidualBlock": "norm3",
+    "BottleneckBlock": "norm4",
+}
+_TRAINING_ONLY_DROPOUT_ATTRS = {
+    "BasicEncoder": "dropout",
+    "SmallEncoder": "dropout",
+}
+
+
+def _is_frozen_batchnorm(module):
+    return isinstance(module, nn.BatchNorm2d) and not module.training and module.running_mean is not None
+
+
+def has_frozen_batchnorm(module):
+    """模块中是否有可以被 prepare_for_inference 折叠的（eval模式的）BatchNorm2d"""
+    return any(_is_frozen_batchnorm(m) for m in module.modules())
+
+
+def _is_noop(module):
+    """推理时什么都不做的层: 恒等层（包括CycleGAN的 networks.Identity）、空的 nn.Sequential、eval模式的dropout"""
+    if isinstance(module, nn.Identity) or (isinstance(module, _DropoutNd) and not module.training):
+        return True
+    if type(module) is nn.Sequential and len(module) == 0:
+        return True
+    return type(module).__name__ == "Identity" and not any(True for _ in module.parameters())
+
+
+def _fold_batchnorm(conv, norm):
+    return fuse_conv_bn_eval(conv, norm, transpose=isinstance(conv, nn.ConvTranspose2d))
+
+
+def _simplify_sequential(sequential, fuse_relu):
+    layers = []
+    for layer in sequential:
+        previous = layers[-1] if layers else None
+        if _is_noop(layer):
+            continue
+        if _is_frozen_batchnorm(layer) and isinstance(previous, (nn.Conv2d, nn.ConvTranspose2d)):
+            layers[-1] = _fold_batchnorm(previous, layer)
+        elif fuse_relu and isinstance(layer, nn.ReLU) and type(previous) is nn.Conv2d:
+            layers[-1] = ConvReLU2d(previous, layer)
+        else:
+            layers.append(layer)
+    return nn.Sequential(*layers)
+
+
+@torch.no_grad()
+def prepare_for_inference(module, fuse_relu=False):
+    """
+    简化eval模式模块的推理图，返回简化后的模块（nn.Sequential 会被替换为新对象，其余模块原地修改）
+
+    - 把冻结的 BatchNorm2d 折叠进紧邻的前一个 Conv2d / ConvTranspose2d
+    - 去掉 nn.Sequential 中的恒等层、空 nn.Sequential 和dropout
+    - fuse_relu: 把 nn.Sequential 中的 Conv2d+ReLU 合并为 ConvReLU2d（eager下计算量不变，
+      供TorchScript冻结和静态量化识别融合模式）
+
+    结果与原模块在浮点误差内一致。模块必须已处于eval模式，训练中的BatchNorm不会被折叠。
+    """
+    for name, child in list(module.named_children()):
+        setattr(module, name, prepare_for_inference(child, fuse_relu))
+
+    for conv_name, norm_name in _CONV_NORM_ATTRS.get(type(module).__name__, ()):
+        conv, norm = getattr(module, conv_name), getattr(module, norm_name)
+        if isinstance(conv, nn.Conv2d) and _is_frozen_batchnorm(norm):
+            setattr(module, conv_name, _fold_batchnorm(conv, norm))
+            setattr(module, norm_name, nn.Identity())
+    norm_name = _DOWNSAMPLE_NORM_ATTRS.get(type(module).__name__)
+    if norm_name is not None and _is_frozen_batchnorm(getattr(module, norm_name, None)) \
+            and not any(m is getattr(module, norm_name) for m in module.downsample):
+        setattr(module, norm_name, nn.Identity())
+    dropout_name = _TRAINING_ONLY_DROPOUT_ATTRS.get(type(module).__name__)
+    if dropout_name is not None and not module.training:
+        setattr(module, dropout_name, None)
+
+    if type(module) is nn.Sequential:
+        return _simplify_sequential(module, fuse_relu)
+    return module
+
+
+def int8_engine():
+    """返回当前PyTorch构建中可用于INT8卷积的量化引擎，不支持时返回None"""
+    supported = torch.backends.quantized.supported_engines
+    return next((engine for engine in _INT8_ENGINES if engine in supported), None)
+
+
+@torch.no_grad()
+def quantize_int8(module, calibration_inputs):
+    """
+    对CPU上的卷积网络做FX静态INT8量化（权重和激活都量化），返回冻结后的TorchScript模块
+
+    calibration_inputs: 用于统计激活范围的输入张量列表，应来自实际要处理的数据
+    返回的模块可直接 torch.jit.save / torch.jit.load，对不同输入尺寸通用。
+    不支持INT8卷积或模块无法被FX追踪时抛出 RuntimeError。
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = int8_engine()
+    if engine is None:
+        raise RuntimeError("当前PyTorch不支持INT8卷积")
+    torch.backends.quantized.engine = engine
+
+    example = calibration_inputs[0]
+    prepared = prepare_fx(copy.deepcopy(module).cpu().eval(), get_default_qconfig_mapping(engine), (example,))
+    for x in calibration_inputs:
+        prepared(x)
+    quantized = convert_fx(prepared)
+    return torch.jit.freeze(torch.jit.trace(quantized, (example,), check_trace=False))
+
+
+class AutocastModule(nn.Module):
+    """在 torch.autocast 下运行被包装的模块，输出转换回float32（CPU上通常为bf16，作为INT8不可用时的回退）"""
+
+    def __init__(self, module, device_type="cpu", dtype=torch.bfloat16):
+        super().__init__()
+        self.module = module
+        self.device_type = device_type
+        self.dtype = dtype
+
+    def forward(self, *args):
+        with torch.autocast(self.device_type, dtype=self.dtype):
+            output = self.module(*args)
+        return _map_tensors(output, lambda t: t.float())
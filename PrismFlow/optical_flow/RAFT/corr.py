@@ -4,15 +4,52 @@ from RAFT.utils.utils import bilinear_sampler, coords_grid
 
 try:
     import alt_cuda_corr
+    ALT_CUDA_CORR_AVAILABLE = True
 except:
     # alt_cuda_corr is not compiled
-    pass
+    ALT_CUDA_CORR_AVAILABLE = False
+
+
+def _lookup_delta(radius, device):
+    """ (2r+1, 2r+1, 2) lookup offsets, in the (dy, dx) meshgrid layout CorrBlock has always used """
+    r = radius
+    dx = torch.linspace(-r, r, 2*r+1, device=device)
+    dy = torch.linspace(-r, r, 2*r+1, device=device)
+    return torch.stack(torch.meshgrid(dy, dx, indexing='ij'), axis=-1)
+
+
+def _pyramid_grid_terms(level_shapes, radius, device):
+    """ Per-level terms mapping a centroid straight to normalised grid_sample coordinates
+
+    For level i of size (h, w), bilinear_sampler samples at c / 2**i + delta, normalised by
+    2 / (size - 1) - 1. Folding the stride and the normalisation into one scale and one offset
+    per level gives, for all levels at once:
+        grid = c * scale + offset      scale: (levels, 1, 1, 1, 2), offset: (levels, 1, 2r+1, 2r+1, 2)
+    """
+    delta = _lookup_delta(radius, device)
+    scale, offset = [], []
+    for i, (h, w) in enumerate(level_shapes):
+        norm = torch.tensor([2 / max(w - 1, 1), 2 / max(h - 1, 1)], device=device)
+        scale.append(norm / 2**i)
+        offset.append(delta * norm - 1)
+    num_levels = len(level_shapes)
+    return torch.stack(scale).view(num_levels, 1, 1, 1, 2), torch.stack(offset)[:, None]
 
 
 class CorrBlock:
-    def __init__(self, fmap1, fmap2, num_levels=4, radius=4):
+    """ All-pairs correlation pyramid
+
+    With fused=True (default) the sampling grids of all pyramid levels are computed in a single
+    op from offset terms built once per CorrBlock (i.e. once per refine, not per iteration), so each
+    lookup is one grid_sample per level instead of rebuilding the offsets and normalising
+    coordinates level by level. The levels are still sampled separately since their sizes differ.
+    fused=False keeps the original lookup (lookup_levels), used as the reference in equivalence
+    checks and micro-benchmarks.
+    """
+    def __init__(self, fmap1, fmap2, num_levels=4, radius=4, fused=True):
         self.num_levels = num_levels
         self.radius = radius
+        self.fused = fused
         self.corr_pyramid = []
 
         # all pairs correlation
@@ -26,7 +63,26 @@ class CorrBlock:
             corr = F.avg_pool2d(corr, 2, stride=2)
             self.corr_pyramid.append(corr)
 
+        shapes = tuple(tuple(corr.shape[-2:]) for corr in self.corr_pyramid)
+        self.grid_terms = _pyramid_grid_terms(shapes, radius, fmap1.device)
+
     def __call__(self, coords):
+        if not self.fused:
+            return self.lookup_levels(coords)
+
+        batch, _, h1, w1 = coords.shape
+        scale, offset = self.grid_terms
+
+        centroid = coords.permute(0, 2, 3, 1).reshape(1, batch*h1*w1, 1, 1, 2)
+        grid = torch.addcmul(offset, centroid, scale)    # (levels, batch*h1*w1, 2r+1, 2r+1, 2)
+
+        out = torch.cat([F.grid_sample(corr, grid[i], align_corners=True)
+                         for i, corr in enumerate(self.corr_pyramid)], dim=1)
+        out = out.view(batch, h1, w1, -1)
+        return out.permute(0, 3, 1, 2).contiguous().float()
+
+    def lookup_levels(self, coords):
+        """ Original lookup: one bilinear_sampler call per pyramid level """
         r = self.radius
         coords = coords.permute(0, 2, 3, 1)
         batch, h1, w1, _ = coords.shape
@@ -89,3 +145,64 @@ class AlternateCorrBlock:
         corr = torch.stack(corr_list, dim=1)
         corr = corr.reshape(B, -1, H, W)
         return corr / torch.sqrt(torch.tensor(dim).float())
+
+
+class LocalCorrBlock:
+    """ Pure PyTorch on-the-fly correlation lookup, numerically equivalent to CorrBlock
+
+    Pooling the all-pairs volume over the second image equals correlating fmap1 with the
+    pooled fmap2, so only the pooled fmap2 pyramid is kept. At lookup time the pixels are
+    processed in chunks of rows: each chunk is correlated (one matmul) with the band of fmap2
+    rows its (2r+1)^2 neighbourhoods actually reach, and the neighbourhoods are then sampled
+    from that partial volume exactly like CorrBlock samples the full one.
+
+    Memory is O(H*W*C) for the pyramid plus one partial volume of at most
+    batch * chunk_rows*W * H*W floats, instead of O((H*W)^2) for the full pyramid.
+    """
+    def __init__(self, fmap1, fmap2, num_levels=4, radius=4, chunk_rows=8):
+        self.num_levels = num_levels
+        self.radius = radius
+        self.chunk_rows = chunk_rows
+        self.delta = _lookup_delta(radius, fmap1.device).view(1, 2*radius+1, 2*radius+1, 2)
+
+        dim = fmap1.shape[1]
+        self.fmap1 = fmap1.float().permute(0, 2, 3, 1) / torch.sqrt(torch.tensor(dim).float())
+        self.pyramid = [fmap2.float()]
+        for i in range(self.num_levels-1):
+            self.pyramid.append(F.avg_pool2d(self.pyramid[-1], 2, stride=2))
+
+    def _lookup(self, fmap1, fmap2, centroid, delta):
+        """ fmap1: (batch, n, dim), centroid: (batch, n, 2) in fmap2 pixels -> (batch, n, (2r+1)^2) """
+        r = self.radius
+        batch, n, dim = fmap1.shape
+        h2, w2 = fmap2.shape[-2:]
+
+        # rows of fmap2 touched by the bilinear taps of all neighbourhoods in this chunk
+        y = centroid[..., 1]
+        y0 = int(torch.floor(y.min()).clamp(-r, h2 + r)) - r
+        y1 = int(torch.floor(y.max()).clamp(-r - 1, h2 + r)) + r + 2
+        y0, y1 = max(min(y0, h2 - 2), 0), min(max(y1, y0 + 2), h2)
+
+        band = fmap2[:, :, y0:y1].reshape(batch, dim, -1)
+        corr = torch.matmul(fmap1, band).view(batch * n, 1, y1 - y0, w2)
+
+        shift = centroid.new_tensor([0, y0])
+        coords = (centroid - shift).reshape(batch * n, 1, 1, 2) + delta
+        corr = bilinear_sampler(corr, coords)
+        return corr.view(batch, n, -1)
+
+    def __call__(self, coords):
+        r = self.radius
+        batch, h1, w1, dim = self.fmap1.shape
+
+        out = coords.new_empty(batch, h1, w1, self.num_levels, (2*r+1)**2, dtype=torch.float32)
+        coords = coords.permute(0, 2, 3, 1).float()
+        for row in range(0, h1, self.chunk_rows):
+            rows = slice(row, min(row + self.chunk_rows, h1))
+            fmap1 = self.fmap1[:, rows].reshape(batch, -1, dim)
+            centroid = coords[:, rows].reshape(batch, -1, 2)
+            for i in range(self.num_levels):
+                corr = self._lookup(fmap1, self.pyramid[i], centroid / 2**i, self.delta)
+                out[:, rows, :, i] = corr.view(batch, -1, w1, (2*r+1)**2)
+
+        return out.view(batch, h1, w1, -1).permute(0, 3, 1, 2).contiguous()
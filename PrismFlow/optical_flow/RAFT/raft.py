@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -5,7 +7,7 @@ import torch.nn.functional as F
 
 from RAFT.update import BasicUpdateBlock, SmallUpdateBlock
 from RAFT.extractor import BasicEncoder, SmallEncoder
-from RAFT.corr import CorrBlock, AlternateCorrBlock
+from RAFT.corr import CorrBlock, AlternateCorrBlock, LocalCorrBlock, ALT_CUDA_CORR_AVAILABLE
 from RAFT.utils.utils import bilinear_sampler, coords_grid, upflow8
 
 try:
@@ -20,6 +22,9 @@ except:
         def __exit__(self, *args):
             pass
 
+# Per-frame RAFT encoding: feature map (for correlation) and context features (hidden state / input)
+Encoding = namedtuple('Encoding', ['fmap', 'net', 'inp'])
+
 
 class RAFT(nn.Module):
     def __init__(self, args):
@@ -70,55 +75,93 @@ class RAFT(nn.Module):
         return coords0, coords1
 
     def upsample_flow(self, flow, mask):
-        """ Upsample flow field [H/8, W/8, 2] -> [H, W, 2] using convex combination """
+        """ Upsample flow field [H/8, W/8, 2] -> [H, W, 2] using convex combination
+
+        Accumulates the 3x3 neighbourhood one offset at a time instead of materialising the
+        unfolded [N, 2, 9, 8, 8, H, W] product; same result as the unfold formulation.
+        """
         N, _, H, W = flow.shape
         mask = mask.view(N, 1, 9, 8, 8, H, W)
         mask = torch.softmax(mask, dim=2)
 
-        up_flow = F.unfold(8 * flow, [3,3], padding=1)
-        up_flow = up_flow.view(N, 2, 9, 1, 1, H, W)
+        # zero padding, as F.unfold(..., padding=1)
+        flow = F.pad(8 * flow, [1, 1, 1, 1])
+        up_flow = 0
+        for k in range(9):
+            dy, dx = divmod(k, 3)
+            up_flow = up_flow + mask[:, :, k] * flow[:, :, None, None, dy:dy+H, dx:dx+W]
 
-        up_flow = torch.sum(mask * up_flow, dim=2)
         up_flow = up_flow.permute(0, 1, 4, 2, 5, 3)
         return up_flow.reshape(N, 2, 8*H, 8*W)
 
+    def _upsample(self, flow, up_mask):
+        if up_mask is None:
+            return upflow8(flow)
+        return self.upsample_flow(flow, up_mask)
 
-    def forward(self, image1, image2, iters=12, flow_init=None, upsample=True, test_mode=False):
-        """ Estimate optical flow between pair of frames """
 
-        image1 = 2 * (image1 / 255.0) - 1.0
-        image2 = 2 * (image2 / 255.0) - 1.0
+    @staticmethod
+    def normalize_image(image):
+        """ Map uint8-range images [0, 255] to [-1, 1] """
+        return (2 * (image / 255.0) - 1.0).contiguous()
 
-        image1 = image1.contiguous()
-        image2 = image2.contiguous()
+    def encode(self, image, context=True):
+        """ Encode a batch of frames once so they can be paired with any other encoded frame
 
-        hdim = self.hidden_dim
-        cdim = self.context_dim
+        Returns an Encoding(fmap, net, inp). net/inp come from the context network and are
+        only needed when the frame is the first image of a pair; they are None if context=False.
+        """
+        image = self.normalize_image(image)
 
-        # run the feature network
         with autocast(enabled=self.args.mixed_precision):
-            fmap1, fmap2 = self.fnet([image1, image2])        
-        
-        fmap1 = fmap1.float()
-        fmap2 = fmap2.float()
+            fmap = self.fnet(image)
+        fmap = fmap.float()
+
+        net = inp = None
+        if context:
+            with autocast(enabled=self.args.mixed_precision):
+                net, inp = self._split_context(self.cnet(image))
+        return Encoding(fmap, net, inp)
+
+    def _split_context(self, cnet):
+        net, inp = torch.split(cnet, [self.hidden_dim, self.context_dim], dim=1)
+        return torch.tanh(net), torch.relu(inp)
+
+    def refine(self, encoding1, encoding2, iters=12, flow_init=None, upsample=True, test_mode=False,
+               min_iters=None, delta_mean_tol=None, delta_max_tol=None, return_iters=False):
+        """ Estimate optical flow from encoding1 to encoding2 (see encode)
+
+        In test_mode only the final flow is upsampled; with upsample=False it is not upsampled at
+        all and (flow_low, None) is returned.
+
+        Adaptive iterations: if delta_mean_tol and/or delta_max_tol are given, refinement stops
+        once the mean / max magnitude of delta_flow (1/8 resolution pixels, over the whole batch)
+        fall below them, after at least min_iters iterations; iters is the upper bound.
+        With return_iters=True the number of iterations actually run is appended to the output.
+        """
+        adaptive = delta_mean_tol is not None or delta_max_tol is not None
+        min_iters = 1 if min_iters is None else min_iters
+        fmap1, fmap2 = encoding1.fmap, encoding2.fmap
+        net, inp = encoding1.net, encoding1.inp
+
         if self.args.alternate_corr:
-            corr_fn = AlternateCorrBlock(fmap1, fmap2, radius=self.args.corr_radius)
+            # memory efficient correlation: CUDA extension if compiled, pure PyTorch otherwise
+            if ALT_CUDA_CORR_AVAILABLE and fmap1.is_cuda:
+                corr_fn = AlternateCorrBlock(fmap1, fmap2, radius=self.args.corr_radius)
+            else:
+                corr_fn = LocalCorrBlock(fmap1, fmap2, radius=self.args.corr_radius)
         else:
             corr_fn = CorrBlock(fmap1, fmap2, radius=self.args.corr_radius)
 
-        # run the context network
-        with autocast(enabled=self.args.mixed_precision):
-            cnet = self.cnet(image1)
-            net, inp = torch.split(cnet, [hdim, cdim], dim=1)
-            net = torch.tanh(net)
-            inp = torch.relu(inp)
-
-        coords0, coords1 = self.initialize_flow(image1)
+        N, _, H, W = fmap1.shape
+        coords0 = coords_grid(N, H, W, device=fmap1.device)
+        coords1 = coords_grid(N, H, W, device=fmap1.device)
 
         if flow_init is not None:
             coords1 = coords1 + flow_init
 
         flow_predictions = []
+        iters_used = 0
         for itr in range(iters):
             coords1 = coords1.detach()
             corr = corr_fn(coords1) # index correlation volume
@@ -129,16 +172,50 @@ class RAFT(nn.Module):
 
             # F(t+1) = F(t) + \Delta(t)
             coords1 = coords1 + delta_flow
+            iters_used += 1
 
-            # upsample predictions
-            if up_mask is None:
-                flow_up = upflow8(coords1 - coords0)
-            else:
-                flow_up = self.upsample_flow(coords1 - coords0, up_mask)
-            
-            flow_predictions.append(flow_up)
+            # upsample predictions (inference only needs the final one)
+            if not test_mode:
+                flow_predictions.append(self._upsample(coords1 - coords0, up_mask))
+
+            if adaptive and itr + 1 >= min_iters and self._converged(delta_flow, delta_mean_tol, delta_max_tol):
+                break
 
         if test_mode:
-            return coords1 - coords0, flow_up
+            flow_low = coords1 - coords0
+            flow_up = self._upsample(flow_low, up_mask) if upsample else None
+            return (flow_low, flow_up, iters_used) if return_iters else (flow_low, flow_up)
             
-        return flow_predictions
+        return (flow_predictions, iters_used) if return_iters else flow_predictions
+
+    @staticmethod
+    def _converged(delta_flow, delta_mean_tol, delta_max_tol):
+        # mean and max in one reduction so each check costs a single device -> host sync
+        magnitude = delta_flow.float().norm(dim=1)
+        mean, peak = torch.stack([magnitude.mean(), magnitude.max()]).tolist()
+        if delta_mean_tol is not None and mean >= delta_mean_tol:
+            return False
+        if delta_max_tol is not None and peak >= delta_max_tol:
+            return False
+        return True
+
+    def forward(self, image1, image2, iters=12, flow_init=None, upsample=True, test_mode=False, **refine_kwargs):
+        """ Estimate optical flow between pair of frames """
+
+        image1 = self.normalize_image(image1)
+        image2 = self.normalize_image(image2)
+
+        # run the feature network
+        with autocast(enabled=self.args.mixed_precision):
+            fmap1, fmap2 = self.fnet([image1, image2])        
+        
+        fmap1 = fmap1.float()
+        fmap2 = fmap2.float()
+
+        # run the context network
+        with autocast(enabled=self.args.mixed_precision):
+            net, inp = self._split_context(self.cnet(image1))
+
+        return self.refine(Encoding(fmap1, net, inp), Encoding(fmap2, None, None),
+                           iters=iters, flow_init=flow_init, upsample=upsample, test_mode=test_mode,
+                           **refine_kwargs)
@@ -24,6 +24,69 @@ class InputPadder:
         return x[..., c[0]:c[1], c[2]:c[3]]
 
 def forward_interpolate(flow):
+    """ Project a (2, H, W) flow field forward along itself, on the flow's device
+
+    Like forward_interpolate_griddata, every pixel takes the flow of the source point that lands nearest
+    to it. Each pixel is seeded with the nearest point landing within its 3x3 neighbourhood, then a jump
+    flood propagates the index of the nearest seed to the pixels further away. Ties between equally
+    distant points may be broken differently than griddata.
+    """
+    flow = flow.detach().float()
+    ht, wd = flow.shape[-2:]
+    y0, x0 = torch.meshgrid(torch.arange(ht, device=flow.device), torch.arange(wd, device=flow.device),
+                            indexing='ij')
+    x1 = x0 + flow[0]
+    y1 = y0 + flow[1]
+
+    valid = (x1 > 0) & (x1 < wd) & (y1 > 0) & (y1 < ht)
+    if not valid.any():
+        return torch.zeros_like(flow)
+    x1, y1, flow = x1[valid], y1[valid], flow[:, valid]
+    # seed every pixel with the nearest point landing within its 3x3 neighbourhood (the last one on ties)
+    xi, yi = torch.round(x1).long(), torch.round(y1).long()
+    source = torch.arange(x1.numel(), device=flow.device)
+    xn, yn, sn = [], [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            inside = (xi + dx >= 0) & (xi + dx < wd) & (yi + dy >= 0) & (yi + dy < ht)
+            xn.append(xi[inside] + dx)
+            yn.append(yi[inside] + dy)
+            sn.append(source[inside])
+    xn, yn, source = torch.cat(xn), torch.cat(yn), torch.cat(sn)
+    index = yn * wd + xn
+    dist = (x1[source] - xn) ** 2 + (y1[source] - yn) ** 2
+    best = dist.new_full((ht * wd,), float('inf')).scatter_reduce(0, index, dist, reduce='amin')
+    source = torch.where(dist <= best[index], source, -1)
+    nearest = torch.full((ht * wd,), -1, device=flow.device).scatter_reduce(0, index, source, reduce='amax')
+    nearest = nearest.view(ht, wd)
+
+    # jump flood (JFA+1): take the nearest of the seeds of the 8 neighbours at step k, halving k down to 1,
+    # then one more pass at step 1. The seed positions are carried along with the seed index
+    inf = float('inf')
+    x1 = torch.where(nearest >= 0, x1[nearest], inf)
+    y1 = torch.where(nearest >= 0, y1[nearest], inf)
+    x0, y0 = x0.float(), y0.float()
+    step = 1 << (max(ht, wd) - 1).bit_length()
+    steps = []
+    while step > 1:
+        step //= 2
+        steps.append(step)
+    slots = torch.arange(1, 10, dtype=torch.float32, device=flow.device).view(9, 1, 1)
+    for step in steps + [1]:
+        pad = [step, step, step, step]
+        padded = F.pad(nearest, pad, value=-1), F.pad(x1, pad, value=inf), F.pad(y1, pad, value=inf)
+        cand_index, cand_x, cand_y = (torch.stack([t[step + dy:step + dy + ht, step + dx:step + dx + wd]
+                                                   for dy in (-step, 0, step) for dx in (-step, 0, step)])
+                                      for t in padded)
+        cand_dist = (cand_x - x0) ** 2 + (cand_y - y0) ** 2
+        # amin/amax are much cheaper than argmin along the candidate axis on CPU
+        slot = torch.where(cand_dist == cand_dist.amin(0), slots, 0).amax(0, keepdim=True).long() - 1
+        nearest, x1, y1 = (t.gather(0, slot)[0] for t in (cand_index, cand_x, cand_y))
+
+    return flow[:, nearest]
+
+def forward_interpolate_griddata(flow):
+    """ Original scipy griddata (nearest) implementation of forward_interpolate, CPU only """
     flow = flow.detach().cpu().numpy()
     dx, dy = flow[0], flow[1]
 
@@ -39,6 +102,8 @@ def forward_interpolate(flow):
     dy = dy.reshape(-1)
 
     valid = (x1 > 0) & (x1 < wd) & (y1 > 0) & (y1 < ht)
+    if not valid.any():
+        return torch.zeros(2, ht, wd)
     x1 = x1[valid]
     y1 = y1[valid]
     dx = dx[valid]
@@ -55,11 +120,15 @@ def forward_interpolate(flow):
 
 
 def bilinear_sampler(img, coords, mode='bilinear', mask=False):
-    """ Wrapper for grid_sample, uses pixel coordinates """
+    """ Wrapper for grid_sample, uses pixel coordinates
+
+    A single-pixel axis is normalised by 1 instead of 0 (as CorrBlock's fused lookup does), so
+    coarse pyramid levels of small inputs sample that pixel instead of producing NaN.
+    """
     H, W = img.shape[-2:]
     xgrid, ygrid = coords.split([1,1], dim=-1)
-    xgrid = 2*xgrid/(W-1) - 1
-    ygrid = 2*ygrid/(H-1) - 1
+    xgrid = 2*xgrid/max(W-1, 1) - 1
+    ygrid = 2*ygrid/max(H-1, 1) - 1
 
     grid = torch.cat([xgrid, ygrid], dim=-1)
     img = F.grid_sample(img, grid, align_corners=True)
@@ -0,0 +1,147 @@
+"""
+光流磁盘缓存
+
+同一段视频换提示词重跑时，输入帧完全相同，RAFT光流无需重新计算。
+每个缓存容器对应 (源视频内容, 光流分辨率, RAFT权重及参数)，是一个目录，
+每个帧对一个不压缩的 .npz 文件（前向光流、后向光流、遮挡图），文件名为两帧内容的哈希。
+
+每个帧对先写临时文件再 os.replace 到最终文件名，写入是原子的:
+- 多个任务（线程或进程）同时处理同一段视频时，各自写入的都是完整文件，最多重复写入同样的内容
+- 写入中途退出只会留下临时文件，已经写好的帧对不受影响；读取失败时只丢弃出错的那个帧对
+
+光流的存储格式:
+- "fp16":  float16
+- "kitti": 与 writeFlowKITTI 相同的16位量化 (64 * uv + 2**15)，精度1/64像素，范围约±512像素
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import zipfile
+
+import numpy as np
+
+FLOW_CACHE_CODECS = ("fp16", "kitti")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """分块读取文件并计算内容哈希"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def pair_key(frame1, frame2):
+    """帧对的缓存键：两帧（RAFT处理分辨率下）内容的哈希"""
+    h = hashlib.blake2b(digest_size=16)
+    for frame in (frame1, frame2):
+        h.update(str(frame.shape).encode())
+        h.update(np.ascontiguousarray(frame).data)
+    return h.hexdigest()
+
+
+def encode_flow(flow, codec):
+    if codec == "kitti":
+        return np.clip(np.rint(64.0 * flow + 2 ** 15), 0, 2 ** 16 - 1).astype(np.uint16)
+    return flow.astype(np.float16)
+
+
+def decode_flow(data, codec):
+    if codec == "kitti":
+        return (data.astype(np.float32) - 2 ** 15) / 64.0
+    return data.astype(np.float32)
+
+
+class FlowCache:
+    """
+    单个视频的光流缓存容器
+
+    用法:
+        cache = FlowCache.for_video(cache_dir, video_path, (768, 512), raft_model_path, small=False)
+        flows = cache.get(frame1, frame2)       # 未命中时返回None
+        cache.put(frame1, frame2, next_flow, prev_flow, occlusion)
+        cache.close()
+    """
+
+    def __init__(self, path, codec="fp16"):
+        if codec not in FLOW_CACHE_CODECS:
+            raise ValueError(f"未知的光流缓存格式: {codec}，可选: {', '.join(FLOW_CACHE_CODECS)}")
+        self.path = path
+        self.codec = codec
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def for_video(cls, cache_dir, video_path, resolution, model_path, small=False, codec="fp16", options=None):
+        """
+        按 (视频内容, 分辨率, RAFT权重及参数, 存储格式) 打开对应的缓存容器
+
+        options: 其他影响光流结果的估计参数（迭代次数、热启动、上采样方式等），参与缓存键
+        """
+        key = hashlib.blake2b(digest_size=16)
+        key.update(file_digest(video_path).encode())
+        key.update(f"{resolution[0]}x{resolution[1]}".encode())
+        key.update(file_digest(model_path).encode())
+        key.update(f"small={small},codec={codec},options={sorted((options or {}).items())}".encode())
+        return cls(os.path.join(cache_dir, f"{key.hexdigest()}.flowcache"), codec=codec)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.npz")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, frame1, frame2):
+        """
+        返回 (next_flow, prev_flow, occlusion) float32，均为RAFT处理分辨率；未命中返回None
+        occlusion 为单通道的前后向不一致程度
+        """
+        path = self._entry_path(pair_key(frame1, frame2))
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                flows = (decode_flow(entry["next"], self.codec),
+                         decode_flow(entry["prev"], self.codec),
+                         entry["occlusion"].astype(np.float32))
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            # 只丢弃损坏的这一个帧对，重新计算后会被覆盖
+            print(f"⚠️ 光流缓存条目损坏，重新计算: {path} ({e})")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        return flows
+
+    def put(self, frame1, frame2, next_flow, prev_flow, occlusion):
+        path = self._entry_path(pair_key(frame1, frame2))
+        if os.path.isfile(path):
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, next=encode_flow(next_flow, self.codec), prev=encode_flow(prev_flow, self.codec),
+                         occlusion=occlusion.astype(np.float16))
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        """每个帧对写入时已经落盘，这里没有需要写出的内容；保留以便任务结束时统一调用"""
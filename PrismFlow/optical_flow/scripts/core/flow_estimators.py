@@ -0,0 +1,184 @@
+"""
+光流估计后端
+
+所有实现都遵循 RAFT_estimate_flow 的约定，供 compute_flow_blend / compute_diff_map 使用:
+    next_flow, prev_flow, occlusion_mask = estimator.estimate(frame1, frame2)
+- next_flow / prev_flow: (H, W, 2) float32，frame1 -> frame2 / frame2 -> frame1，原始分辨率
+- occlusion_mask: (H, W, 3) 前后向光流不一致程度（像素）
+估计失败时三者均为None。三者一般为numpy数组；RAFT 在 return_tensors=True 时为留在 device 上的张量，
+compute_flow_blend 直接在该设备上使用，不经过CPU。
+
+可选后端:
+- "raft":      RAFT / RAFT-small（见 RAFTFlowEstimator），需要权重文件，支持批量估计和磁盘缓存
+- "dis":       OpenCV DIS光流，CPU上实时，适合预览
+- "farneback": OpenCV Farneback稠密光流
+"""
+
+import cv2
+import numpy as np
+
+from core.local_flow_utils import (
+    ClipFlows,
+    RAFTIterationStats,
+    RAFT_estimate_flow,
+    RAFT_iter_clip_flows,
+    RAFT_model_handle,
+    RAFT_resize_flow,
+)
+
+FLOW_BACKENDS = ("raft", "dis", "farneback")
+
+
+class FlowEstimator:
+    """光流估计后端的基类，子类实现 estimate"""
+
+    name = None
+    # 累计的迭代统计（RAFTIterationStats），不按迭代估计的后端为None
+    iteration_stats = None
+
+    def estimate(self, frame1, frame2):
+        """估计 frame1 -> frame2 的 (next_flow, prev_flow, occlusion_mask)，见模块说明"""
+        raise NotImplementedError
+
+    def iter_clip_flows(self, frames, chunk_size=16):
+        """
+        把整段视频按 chunk_size 个帧对分块估计光流，逐块产出 (起始帧对索引, ClipFlows)，
+        格式与 RAFT_iter_clip_flows 相同。默认实现逐对调用 estimate。
+        """
+        for start in range(0, len(frames) - 1, chunk_size):
+            chunk = frames[start:start + chunk_size + 1]
+            num_pairs = len(chunk) - 1
+            h, w = chunk[0].shape[:2]
+            next_flows = np.empty((num_pairs, h, w, 2), dtype=np.float16)
+            prev_flows = np.empty_like(next_flows)
+            occlusion_masks = np.empty((num_pairs, h, w), dtype=np.float16)
+            for i in range(num_pairs):
+                next_flow, prev_flow, occlusion_mask = self.estimate(chunk[i], chunk[i + 1])
+                if next_flow is None:
+                    yield start, None
+                    return
+                next_flows[i], prev_flows[i], occlusion_masks[i] = next_flow, prev_flow, occlusion_mask[..., 0]
+            yield start, ClipFlows(next_flows, prev_flows, occlusion_masks)
+
+
+class RAFTFlowEstimator(FlowEstimator):
+    """
+    RAFT / RAFT-small，参数同 RAFT_estimate_flow
+
+    模型由全进程共享的 RAFTModelHandle 持有：同样配置的多个估计器（并发任务）共用一个常驻模型，
+    推理时加锁，空闲后自动卸载（见 RAFT_set_idle_timeout），估计器本身可以随任务创建和丢弃。
+    迭代统计按估计器（任务）各自累计在 iteration_stats 中，并发任务互不影响。
+
+    return_tensors: True 时光流留在 device 上（张量），见 RAFT_estimate_flow
+    flow_options: warm_start_iters、early_exit、upsample、flow_scale 等估计参数
+    """
+
+    name = "raft"
+
+    def __init__(self, device='cuda', model_path=None, small=False, inference_backend='eager',
+                 alternate_corr=False, batch_size=None, flow_cache=None, return_tensors=False, **flow_options):
+        self.device = device
+        self.handle = RAFT_model_handle(device, model_path, small, inference_backend, alternate_corr)
+        self.model_options = {
+            "model_path": model_path,
+            "small": small,
+            "inference_backend": inference_backend,
+            "alternate_corr": alternate_corr,
+        }
+        self.batch_size = batch_size
+        self.flow_cache = flow_cache
+        self.flow_options = dict(flow_options, return_tensors=return_tensors)
+        self.iteration_stats = RAFTIterationStats()
+
+    def load(self, example_size=None):
+        """提前加载模型（任务开始时调用，避免第一帧等待加载），失败时返回None"""
+        return self.handle.load(example_size)
+
+    def estimate(self, frame1, frame2):
+        return RAFT_estimate_flow(frame1, frame2, device=self.device, flow_cache=self.flow_cache,
+                                  iteration_stats=self.iteration_stats, **self.model_options, **self.flow_options)
+
+    def iter_clip_flows(self, frames, chunk_size=16):
+        return RAFT_iter_clip_flows(
+            frames, chunk_size=chunk_size, device=self.device, batch_size=self.batch_size,
+            flow_cache=self.flow_cache, iteration_stats=self.iteration_stats, **self.model_options,
+            **self.flow_options
+        )
+
+
+class OpenCVFlowEstimator(FlowEstimator):
+    """
+    OpenCV 稠密光流的公共部分：灰度化、可选的降分辨率估计、前后向各算一次
+
+    flow_scale: 在 原始分辨率*flow_scale 上估计，再放大回原始分辨率
+    """
+
+    def __init__(self, flow_scale=1.0):
+        self.flow_scale = flow_scale
+
+    def _calc(self, gray1, gray2):
+        """返回 gray1 -> gray2 的 (H, W, 2) float32 光流"""
+        raise NotImplementedError
+
+    def estimate(self, frame1, frame2):
+        org_size = frame1.shape[1], frame1.shape[0]
+        gray1 = cv2.cvtColor(frame1, cv2.COLOR_RGB2GRAY)
+        gray2 = cv2.cvtColor(frame2, cv2.COLOR_RGB2GRAY)
+        if self.flow_scale != 1.0:
+            size = (max(int(org_size[0] * self.flow_scale), 8), max(int(org_size[1] * self.flow_scale), 8))
+            gray1 = cv2.resize(gray1, size, interpolation=cv2.INTER_AREA)
+            gray2 = cv2.resize(gray2, size, interpolation=cv2.INTER_AREA)
+
+        next_flow = self._calc(gray1, gray2)
+        prev_flow = self._calc(gray2, gray1)
+        fb_norm = np.linalg.norm(next_flow + prev_flow, axis=2)
+        if self.flow_scale != 1.0:
+            next_flow = RAFT_resize_flow(next_flow, org_size)
+            prev_flow = RAFT_resize_flow(prev_flow, org_size)
+            fb_norm = cv2.resize(fb_norm, org_size) / self.flow_scale
+
+        occlusion_mask = fb_norm[..., None].repeat(3, axis=-1)
+        return next_flow, prev_flow, occlusion_mask
+
+
+class DISFlowEstimator(OpenCVFlowEstimator):
+    """OpenCV DIS (Dense Inverse Search) 光流"""
+
+    name = "dis"
+
+    def __init__(self, preset=cv2.DISOPTICAL_FLOW_PRESET_MEDIUM, flow_scale=1.0):
+        super().__init__(flow_scale)
+        # DISOpticalFlow 对象带内部状态，不能在线程间共享，每个估计器单独创建
+        self._dis = cv2.DISOpticalFlow_create(preset)
+
+    def _calc(self, gray1, gray2):
+        return self._dis.calc(gray1, gray2, None)
+
+
+class FarnebackFlowEstimator(OpenCVFlowEstimator):
+    """OpenCV Farneback 稠密光流，参数为 OpenCV 文档中的常用取值"""
+
+    name = "farneback"
+
+    def __init__(self, flow_scale=1.0, pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2):
+        super().__init__(flow_scale)
+        self.params = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, 0)
+
+    def _calc(self, gray1, gray2):
+        return cv2.calcOpticalFlowFarneback(gray1, gray2, None, *self.params)
+
+
+def create_flow_estimator(backend, device='cuda', flow_scale=1.0, **raft_options):
+    """
+    按名称创建光流估计后端
+
+    backend: FLOW_BACKENDS 之一
+    raft_options: 只对 "raft" 生效，见 RAFTFlowEstimator
+    """
+    if backend == "raft":
+        return RAFTFlowEstimator(device=device, flow_scale=flow_scale, **raft_options)
+    if backend == "dis":
+        return DISFlowEstimator(flow_scale=flow_scale)
+    if backend == "farneback":
+        return FarnebackFlowEstimator(flow_scale=flow_scale)
+    raise ValueError(f"未知的光流后端: {backend}，可选: {', '.join(FLOW_BACKENDS)}")
@@ -3,92 +3,850 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 import numpy as np
 import cv2
-from collections import namedtuple
+import hashlib
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
 import torch
 import argparse
-from RAFT.raft import RAFT
-from RAFT.utils.utils import InputPadder
+from RAFT.raft import RAFT, Encoding
+from RAFT.update import SmallUpdateBlock
+from RAFT.utils.utils import InputPadder, forward_interpolate, upflow8
 import gc
+import time
+import contextlib
+import threading
 from local_modules import paths as local_paths
-
-RAFT_model = None
-fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)
-
-def background_subtractor(frame, fgbg):
-    fgmask = fgbg.apply(frame)
-    return cv2.bitwise_and(frame, frame, mask=fgmask)
+from inference_opt import has_frozen_batchnorm, optimize_module, prepare_for_inference
+from weights_io import load_safetensors, load_weights, resolve_weights, strip_prefix
+from core.flow_cache import FlowCache
+
+# 可选的RAFT变体: 名称 -> (models/RAFT 下的默认权重文件, 是否为RAFT-small)
+RAFT_VARIANTS = {
+    "full": ("raft-sintel.pth", False),
+    "small": ("raft-small.pth", True),
+}
+# 常驻模型句柄（RAFTModelHandle），键为 (权重路径, small, 推理后端, 设备, alternate_corr)
+RAFT_models = {}
+RAFT_models_lock = threading.Lock()
+# 模型空闲多少秒后自动卸载（全进程的设置，见 RAFT_set_idle_timeout）
+RAFT_IDLE_TIMEOUT = 300
+
+class RAFTIterationStats:
+    """
+    一组RAFT调用的迭代统计，每个任务（估计器）各自累计，见 RAFT_estimate_flow 的 iteration_stats 参数
+
+    帧对数、实际迭代次数、按固定迭代次数本应运行的次数（每个帧对的前向和后向在同一个batch里迭代，按一次计），
+    以及RAFT计算耗时（秒，不含模型加载和缓存命中）。预取线程写入、任务线程读取，加锁累计。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = self._empty()
+
+    @staticmethod
+    def _empty():
+        return {"pairs": 0, "iterations": 0, "iteration_budget": 0, "seconds": 0.0}
+
+    def record(self, pairs, iterations, iteration_budget, seconds=0.0):
+        with self._lock:
+            self._stats["pairs"] += pairs
+            self._stats["iterations"] += pairs * iterations
+            self._stats["iteration_budget"] += pairs * iteration_budget
+            self._stats["seconds"] += seconds
+
+    def pop(self):
+        """返回并清零累计的统计"""
+        with self._lock:
+            stats, self._stats = self._stats, self._empty()
+        return stats
+
+class RAFTEncodingCache:
+    """
+    按帧内容缓存最近几帧的RAFT编码（特征图 + 上下文特征）
+
+    相邻帧对共享中间帧，前向/后向光流共享两帧，缓存后每帧只需编码一次。
+    流程中只在 RAFTModelHandle.use() 内访问；RAFT_load_model 直接返回模型时不经过句柄的锁，这里另外加锁。
+    """
+
+    def __init__(self, max_frames=4):
+        self.max_frames = max_frames
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def frame_key(frame):
+        return frame.shape, hashlib.blake2b(np.ascontiguousarray(frame).data, digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            encoding = self._entries.get(key)
+            if encoding is not None:
+                self._entries.move_to_end(key)
+            return encoding
+
+    def put(self, key, encoding):
+        with self._lock:
+            self._entries[key] = encoding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_frames:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def cat_encodings(encodings):
+    """沿batch维拼接多个 Encoding"""
+    return Encoding(*(torch.cat(parts) for parts in zip(*encodings)))
+
+def slice_encoding(encoding, index):
+    """按batch维切片 Encoding"""
+    return Encoding(*(t[index] for t in encoding))
 
 def RAFT_clear_memory():
-    global RAFT_model
-    if RAFT_model is not None:
-        del RAFT_model
-        gc.collect()
-        torch.cuda.empty_cache()
-        RAFT_model = None
-
-def RAFT_estimate_flow(frame1, frame2, device='cuda'):
-    global RAFT_model
-
-    org_size = frame1.shape[1], frame1.shape[0]
-    size = frame1.shape[1] // 16 * 16, frame1.shape[0] // 16 * 16
-    frame1 = cv2.resize(frame1, size)
-    frame2 = cv2.resize(frame2, size)
-
-    model_path = local_paths.models_path + '/RAFT/raft-sintel.pth'
-    
-    print(f"查找RAFT模型: {model_path}")
-
+    """立即卸载所有RAFT模型（会等待正在进行的推理结束）"""
+    with RAFT_models_lock:
+        handles = list(RAFT_models.values())
+        RAFT_models.clear()
+    for handle in handles:
+        handle.unload()
+
+class _SmallUpdateTensors(torch.nn.Module):
+    """SmallUpdateBlock 只返回张量输出 (net, delta_flow) 的视图，可以被 trace / compile"""
+
+    def __init__(self, block):
+        super().__init__()
+        self.block = block
+
+    def forward(self, net, inp, corr, flow):
+        net, _, delta_flow = self.block(net, inp, corr, flow)
+        return net, delta_flow
+
+class _OptimizedSmallUpdateBlock(torch.nn.Module):
+    """
+    RAFT-small 的更新块没有上采样掩码，返回 (net, None, delta_flow)；None 不能作为 trace 的输出，
+    因此只优化其中的张量部分，调用时再补回 None
+    """
+
+    def __init__(self, block, backend):
+        super().__init__()
+        self.tensors = optimize_module(_SmallUpdateTensors(block), backend=backend)
+
+    def forward(self, net, inp, corr, flow):
+        net, delta_flow = self.tensors(net, inp, corr, flow)
+        return net, None, delta_flow
+
+def RAFT_optimize(model, backend, example_shape, device):
+    """
+    对RAFT的fnet/cnet/update_block应用推理优化，并用示例输入预热
+
+    预热走与 RAFT_estimate_flow 相同的路径：逐帧编码 (1, 3, H, W)，前向+后向一起精炼（batch 2），
+    之后同尺寸的估计不会再触发编译/trace
+    """
+    model.fnet = optimize_module(model.fnet, backend=backend)
+    model.cnet = optimize_module(model.cnet, backend=backend)
+    if isinstance(model.update_block, SmallUpdateBlock):
+        model.update_block = _OptimizedSmallUpdateBlock(model.update_block, backend)
+    else:
+        model.update_block = optimize_module(model.update_block, backend=backend)
+    with torch.no_grad():
+        encoding = model.encode(torch.zeros(example_shape, device=device))
+        pair = cat_encodings([encoding, encoding])
+        model.refine(pair, pair, iters=1, test_mode=True)
+    print(f"RAFT推理优化: {backend} + channels_last")
+
+def RAFT_resolve_model_path(model_path=None, small=False):
+    """None 表示对应变体的默认权重: models/RAFT/raft-sintel.pth 或 models/RAFT/raft-small.pth"""
+    if model_path is None:
+        return local_paths.models_path + '/RAFT/' + RAFT_VARIANTS["small" if small else "full"][0]
+    return model_path
+
+def RAFT_open_flow_cache(cache_dir, video_path, resolution, model_path=None, small=False, codec='fp16',
+                         **flow_options):
+    """
+    为一个视频打开光流磁盘缓存，RAFT权重不存在时返回None
+
+    flow_options: 与传给 RAFT_estimate_flow 相同的估计参数（warm_start_iters、early_exit、upsample 等），
+        参数不同的结果存放在不同的缓存容器里
+    """
+    model_path = RAFT_resolve_model_path(model_path, small)
     if not os.path.isfile(model_path):
-        print(f"错误: 找不到RAFT模型文件: {model_path}")
-        print("请确保模型文件位于正确路径")
-        return None, None, None
-
-    if RAFT_model is None:
-        print("正在加载RAFT模型...")
+        return None
+    options = {key: repr(value) for key, value in flow_options.items()}
+    return FlowCache.for_video(cache_dir, video_path, resolution, model_path, small=small, codec=codec,
+                               options=options)
+
+class RAFTModelHandle:
+    """
+    一个常驻的RAFT模型：第一次使用时加载，之后所有任务（线程）共用
+
+    use() 在推理期间持有锁，并发任务按顺序使用同一个模型；
+    最后一次使用 idle_timeout 秒后仍无人使用时自动卸载，下次使用时重新加载。
+    idle_timeout 为None时不自动卸载；它是句柄（全进程）的设置，不随任务变化，见 RAFT_set_idle_timeout。
+    空闲检查由模型加载期间常驻的一个后台线程完成，use() 只记录使用时间。
+    """
+
+    def __init__(self, device, model_path, small=False, inference_backend='eager', alternate_corr=False,
+                 idle_timeout=RAFT_IDLE_TIMEOUT):
+        self.device = device
+        self.model_path = model_path
+        self.small = small
+        self.inference_backend = inference_backend
+        self.alternate_corr = alternate_corr
+        self.idle_timeout = idle_timeout
+        self.model = None
+        self.last_used = time.monotonic()
+        self._lock = threading.RLock()
+        # 空闲卸载线程的停止信号，模型未加载时为None
+        self._reaper_stop = None
+
+    def load(self, example_size=None):
+        """
+        加载（或复用已加载的）模型，失败时返回None
+        example_size: (宽, 高)，非eager后端在加载时用该尺寸预热
+        """
+        with self._lock:
+            if self.model is None:
+                self.model = self._load(example_size)
+                self.last_used = time.monotonic()
+                self._start_reaper()
+            return self.model
+
+    def _load(self, example_size):
+        print(f"查找RAFT模型: {self.model_path}")
+
+        # 存在由 convert_weights.py 转换的 .safetensors 时优先加载
+        weights_path = resolve_weights(self.model_path)
+        if not os.path.isfile(weights_path):
+            print(f"错误: 找不到RAFT模型文件: {self.model_path}")
+            print("请确保模型文件位于正确路径")
+            return None
+
+        print(f"正在加载RAFT模型{' (small)' if self.small else ''}: {weights_path}")
         args = argparse.Namespace(**{
-            'model': model_path,
+            'model': self.model_path,
             'mixed_precision': True,
-            'small': False,
-            'alternate_corr': False,
+            'small': self.small,
+            'alternate_corr': self.alternate_corr,
             'path': ""
         })
 
         try:
-            RAFT_model = torch.nn.DataParallel(RAFT(args))
-            RAFT_model.load_state_dict(torch.load(args.model, map_location=device))
-            RAFT_model = RAFT_model.module
-            RAFT_model.to(device)
-            RAFT_model.eval()
+            model = RAFT(args)
+            if weights_path.endswith('.safetensors'):
+                # convert_weights.py 已去掉 "module." 前缀；直接使用映射的张量，多个进程共享页缓存
+                model.load_state_dict(load_safetensors(weights_path, self.device), assign=True)
+            else:
+                model.load_state_dict(strip_prefix(load_weights(weights_path, self.device), "module."))
+            model.to(self.device)
+            model.eval()
+            # 把编码器中冻结的BatchNorm折叠进卷积。只处理含BatchNorm的编码器（RAFT的cnet）：
+            # 其余部分（RAFT-small 全部）没有可折叠的层，保持加载的原样。
+            # 折叠后的卷积权重是新张量，不再共享 safetensors 的mmap页缓存；fnet和更新块仍然共享
+            for name in ("fnet", "cnet"):
+                encoder = getattr(model, name)
+                if has_frozen_batchnorm(encoder):
+                    setattr(model, name, prepare_for_inference(encoder))
+            if self.inference_backend != 'eager' and example_size is not None:
+                # size 已是16的倍数，InputPadder不会再填充
+                RAFT_optimize(model, self.inference_backend, (1, 3, example_size[1], example_size[0]), self.device)
+            # 每个模型各自的逐帧编码缓存和热启动状态
+            model.encoding_cache = RAFTEncodingCache()
+            # 热启动状态: (上一帧对第二帧的内容键, 上一帧对1/8分辨率的前向光流, 后向光流)
+            model.warm_state = None
             print("RAFT模型加载成功")
         except Exception as e:
             print(f"RAFT模型加载失败: {e}")
-            return None, None, None
-
-    with torch.no_grad():
-        frame1_torch = torch.from_numpy(frame1).permute(2, 0, 1).float()[None].to(device)
-        frame2_torch = torch.from_numpy(frame2).permute(2, 0, 1).float()[None].to(device)
-
-        padder = InputPadder(frame1_torch.shape)
-        image1, image2 = padder.pad(frame1_torch, frame2_torch)
-
-        # estimate optical flow
-        _, next_flow = RAFT_model(image1, image2, iters=20, test_mode=True)
-        _, prev_flow = RAFT_model(image2, image1, iters=20, test_mode=True)
-
-        next_flow = next_flow[0].permute(1, 2, 0).cpu().numpy()
-        prev_flow = prev_flow[0].permute(1, 2, 0).cpu().numpy()
-
-        fb_flow = next_flow + prev_flow
-        fb_norm = np.linalg.norm(fb_flow, axis=2)
+            return None
+
+        return model
+
+    @contextlib.contextmanager
+    def use(self, example_size=None):
+        """在 with 块内独占使用模型（加载失败时为None），退出后开始空闲计时"""
+        with self._lock:
+            self.last_used = time.monotonic()
+            try:
+                yield self.load(example_size)
+            finally:
+                self.last_used = time.monotonic()
+
+    def _start_reaper(self):
+        if self.model is None or self.idle_timeout is None or self._reaper_stop is not None:
+            return
+        self._reaper_stop = threading.Event()
+        threading.Thread(target=self._reap, args=(self._reaper_stop,), daemon=True).start()
+
+    def _reap(self, stop):
+        """模型加载期间常驻：等到最后一次使用 idle_timeout 秒后，仍然空闲则卸载并退出"""
+        while True:
+            idle_timeout = self.idle_timeout
+            if idle_timeout is None:
+                remaining = None
+            else:
+                remaining = self.last_used + idle_timeout - time.monotonic()
+            if remaining is None or remaining > 0:
+                # 没有超时设置时等待 unload / RAFT_set_idle_timeout 唤醒
+                if stop.wait(remaining):
+                    return
+                continue
+            # 正在使用时这里等到使用结束，last_used 随之更新，重新计时
+            with self._lock:
+                if stop.is_set():
+                    return
+                if self.idle_timeout is not None and time.monotonic() - self.last_used >= self.idle_timeout:
+                    print(f"RAFT模型空闲超过 {self.idle_timeout}s，已卸载")
+                    self.unload()
+                    return
+
+    def set_idle_timeout(self, idle_timeout):
+        with self._lock:
+            self.idle_timeout = idle_timeout
+            if self._reaper_stop is not None:
+                # 唤醒旧线程让它退出，按新的设置重新开始计时
+                self._reaper_stop.set()
+                self._reaper_stop = None
+            self._start_reaper()
+
+    def unload(self):
+        with self._lock:
+            if self._reaper_stop is not None:
+                self._reaper_stop.set()
+                self._reaper_stop = None
+            if self.model is not None:
+                self.model.encoding_cache.clear()
+                self.model = None
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
+def RAFT_model_handle(device='cuda', model_path=None, small=False, inference_backend='eager', alternate_corr=False):
+    """
+    返回 (权重, full/small, 推理后端, 设备, 相关体实现) 对应的常驻模型句柄，同一组合全进程只有一个
+
+    alternate_corr: 使用省内存的局部相关体（编译了alt_cuda_corr时在GPU上用CUDA扩展，否则用纯PyTorch实现），
+        不构建全局相关体，适合高分辨率或CPU
+    """
+    model_path = RAFT_resolve_model_path(model_path, small)
+    key = (model_path, small, inference_backend, str(device), alternate_corr)
+    with RAFT_models_lock:
+        if key not in RAFT_models:
+            RAFT_models[key] = RAFTModelHandle(device, model_path, small, inference_backend, alternate_corr,
+                                               idle_timeout=RAFT_IDLE_TIMEOUT)
+        return RAFT_models[key]
+
+def RAFT_set_idle_timeout(idle_timeout):
+    """
+    设置常驻RAFT模型的空闲卸载时间（秒，None 表示一直常驻），作用于已有和之后创建的所有模型句柄
+
+    模型由所有任务共用，这是服务进程的设置，在启动时配置，而不是每个任务各自指定。
+    """
+    global RAFT_IDLE_TIMEOUT
+    with RAFT_models_lock:
+        RAFT_IDLE_TIMEOUT = idle_timeout
+        handles = list(RAFT_models.values())
+    for handle in handles:
+        handle.set_idle_timeout(idle_timeout)
+
+def RAFT_load_model(device='cuda', model_path=None, small=False, inference_backend='eager', example_size=None,
+                    alternate_corr=False):
+    """
+    加载（或复用已加载的）RAFT模型，失败时返回None，参数见 RAFT_model_handle
+
+    直接返回模型、不加锁，供单线程的脚本和基准测试使用；流程中通过 RAFT_model_handle(...).use() 使用。
+    """
+    handle = RAFT_model_handle(device, model_path, small, inference_backend, alternate_corr)
+    return handle.load(example_size)
+
+def RAFT_encode_frame(model, frame, padder, device):
+    """编码单帧（已缩放的uint8 RGB），命中该模型的编码缓存时直接复用"""
+    cache = model.encoding_cache
+    key = cache.frame_key(frame)
+    encoding = cache.get(key)
+    if encoding is None:
+        image = padder.pad(torch.from_numpy(frame).permute(2, 0, 1).float()[None].to(device))[0]
+        encoding = model.encode(image)
+        cache.put(key, encoding)
+    return encoding
+
+def RAFT_warm_start_init(next_low, prev_low):
+    """
+    把上一帧对 (i-1 -> i) 的1/8分辨率光流投影到当前帧对 (i -> i+1)，作为 [前向, 后向] 的 flow_init
+
+    前向光流沿自身前向投影；后向光流假设匀速运动，沿反方向（即前向运动方向）投影。
+    投影在光流所在的设备上完成（最近邻填充，结果与上游RAFT的 griddata 实现相同），不经过CPU。
+    """
+    next_init = forward_interpolate(next_low[0])[None]
+    prev_init = -forward_interpolate(-prev_low[0])[None]
+    return torch.cat([next_init, prev_init])
+
+RAFT_UPSAMPLE_MODES = ('convex', 'bilinear')
+
+def RAFT_processing_size(org_size, flow_scale=1.0):
+    """
+    RAFT处理分辨率 (宽, 高): 原始尺寸乘以 flow_scale 后向下取16的倍数
+
+    缩小后每边至少保留128像素（1/8分辨率16格），否则相关金字塔最后一层会退化为1x1
+    """
+    return tuple(max(int(length * flow_scale) // 16 * 16, min(128, length // 16 * 16)) for length in org_size)
+
+def _resize_tensor(tensor, size):
+    """把 (..., h, w, C) 张量在所在设备上双线性缩放到 size=(宽, 高)，与 cv2.resize 的 INTER_LINEAR 相同的采样位置"""
+    h, w, c = tensor.shape[-3:]
+    flat = tensor.reshape(-1, h, w, c).permute(0, 3, 1, 2).float()
+    flat = torch.nn.functional.interpolate(flat, size=(size[1], size[0]), mode='bilinear', align_corners=False)
+    return flat.permute(0, 2, 3, 1).reshape(*tensor.shape[:-3], size[1], size[0], c)
+
+def RAFT_resize_flow(flow, size):
+    """
+    把 (h, w, 2) 光流缩放到 size=(宽, 高)，光流向量按两个方向的缩放比例同步缩放
+
+    flow 为张量时（可以带batch维 (..., h, w, 2)）在所在设备上缩放，返回float32张量
+    """
+    h, w = flow.shape[-3:-1]
+    if (w, h) == tuple(size):
+        return flow
+    if isinstance(flow, torch.Tensor):
+        return _resize_tensor(flow, size) * flow.new_tensor([size[0] / w, size[1] / h], dtype=torch.float32)
+    resized = cv2.resize(flow, size)
+    resized[..., 0] *= size[0] / w
+    resized[..., 1] *= size[1] / h
+    return resized
+
+def RAFT_resize_occlusion(fb_norm, size):
+    """
+    把前后向不一致程度（像素单位）缩放到 size=(宽, 高)，数值按平均缩放比例同步缩放
+
+    fb_norm 为张量时（可以带batch维 (..., h, w)）在所在设备上缩放，返回float32张量
+    """
+    h, w = fb_norm.shape[-2:]
+    if (w, h) == tuple(size):
+        return fb_norm
+    scale = (size[0] / w + size[1] / h) / 2
+    if isinstance(fb_norm, torch.Tensor):
+        return _resize_tensor(fb_norm[..., None], size)[..., 0] * scale
+    return cv2.resize(fb_norm, size) * scale
+
+def RAFT_refine_pairs(model, encoding1, encoding2, iters, flow_init=None, early_exit=None, upsample='convex'):
+    """
+    对成批的编码对做迭代精炼，返回 (1/8分辨率光流, 全分辨率光流, 实际迭代次数)
+
+    upsample: 'convex' 为RAFT的凸组合上采样（只在最后一次迭代后计算一次）；
+        'bilinear' 跳过凸组合上采样，直接双线性放大1/8分辨率光流，适合之后还会模糊/缩放遮罩的场合
+    """
+    if upsample not in RAFT_UPSAMPLE_MODES:
+        raise ValueError(f"未知的光流上采样方式: {upsample}，可选: {', '.join(RAFT_UPSAMPLE_MODES)}")
+    flow_low, flow_up, iters_used = model.refine(
+        encoding1, encoding2, iters=iters, flow_init=flow_init, test_mode=True,
+        upsample=(upsample == 'convex'), return_iters=True, **(early_exit or {})
+    )
+    if flow_up is None:
+        flow_up = upflow8(flow_low)
+    return flow_low, flow_up, iters_used
+
+def RAFT_pair_memory(size, small=False, alternate_corr=False):
+    """估算一个帧对（前向 + 后向两个样本）在 size=(宽, 高) 上运行RAFT所需的内存（字节）"""
+    pixels = (size[0] // 8) * (size[1] // 8)
+    if alternate_corr:
+        # 第二帧特征的池化金字塔，加上一块 chunk_rows 行像素对整幅图的部分相关体
+        corr_bytes = pixels * (128 if small else 256) * 4 * 4 / 3 + 8 * (size[0] // 8) * pixels * 4
+    else:
+        # 1/8分辨率上的全局相关体（float32）及其3层池化金字塔
+        corr_bytes = pixels * pixels * 4 * 4 / 3
+    # 编码器在1/2分辨率上的中间激活
+    activation_bytes = size[0] * size[1] * (32 if small else 64) * 4
+    return 2 * (corr_bytes + activation_bytes)
+
+def RAFT_plan_tiles(size, memory_budget=None, small=False, alternate_corr=False, overlap=64, min_tile=128):
+    """
+    把 size=(宽, 高) 的帧切成互相重叠、尺寸相同的分块，使单个帧对分块的RAFT内存不超过 memory_budget
+
+    返回 (分块列表 [(x0, y0, x1, y1)], 分块尺寸 (宽, 高))；整帧放得下或 memory_budget 为None时只有一个整帧分块。
+    分块尺寸为8的倍数，不小于 min_tile；到达 min_tile 仍超出预算时按 min_tile 切分。
+    """
+    w, h = size
+    if memory_budget is None or RAFT_pair_memory(size, small, alternate_corr) <= memory_budget:
+        return [(0, 0, w, h)], (w, h)
+
+    def tile_length(length, count):
+        # count 块、相邻重叠 overlap 时覆盖 length 所需的分块长度，向上取8的倍数
+        return min(-(-(length + (count - 1) * overlap) // (count * 8)) * 8, length)
+
+    nx = ny = 1
+    while True:
+        tile_w, tile_h = max(tile_length(w, nx), min(min_tile, w)), max(tile_length(h, ny), min(min_tile, h))
+        if RAFT_pair_memory((tile_w, tile_h), small, alternate_corr) <= memory_budget:
+            break
+        if tile_w <= min(min_tile, w) and tile_h <= min(min_tile, h):
+            print(f"⚠️ RAFT内存预算过小，按最小分块 {tile_w}x{tile_h} 估计")
+            break
+        # 优先切分较长的一边
+        if tile_w >= tile_h and tile_w > min(min_tile, w):
+            nx += 1
+        else:
+            ny += 1
+
+    def starts(length, tile, count):
+        count = max(count, -(-(length - overlap) // max(tile - overlap, 1)))
+        if count <= 1 or tile >= length:
+            return [0]
+        return sorted({round(i * (length - tile) / (count - 1)) for i in range(count)})
+
+    tiles = [(x0, y0, x0 + tile_w, y0 + tile_h)
+             for y0 in starts(h, tile_h, ny) for x0 in starts(w, tile_w, nx)]
+    return tiles, (tile_w, tile_h)
+
+def RAFT_tile_weights(tile, size, overlap):
+    """分块的羽化权重 (tile_h, tile_w)：与相邻分块重叠的边上在 overlap 内线性渐变，画面边缘不渐变"""
+    x0, y0, x1, y1 = tile
+    ramp = (np.arange(overlap, dtype=np.float32) + 1) / (overlap + 1)
+
+    def axis_weights(start, end, length):
+        weights = np.ones(end - start, dtype=np.float32)
+        n = min(overlap, end - start)
+        if start > 0:
+            weights[:n] = np.minimum(weights[:n], ramp[:n])
+        if end < length:
+            weights[-n:] = np.minimum(weights[-n:], ramp[:n][::-1])
+        return weights
+
+    return axis_weights(y0, y1, size[1])[:, None] * axis_weights(x0, x1, size[0])[None, :]
+
+def RAFT_tiled_flow(model, frame1, frame2, tiles, tile_size, device, memory_budget, small=False,
+                    alternate_corr=False, iters=20, early_exit=None, upsample='convex', overlap=64):
+    """
+    分块估计 frame1 <-> frame2 的光流，按 RAFT_tile_weights 羽化融合
+
+    分块按内存预算成批送入RAFT（每批内前向和后向一起精炼），在 device 上融合。
+    返回 (next_flow, prev_flow, 平均迭代次数)，光流为 device 上的 (H, W, 2) float32 张量
+    """
+    h, w = frame1.shape[:2]
+    batch = int(max(1, memory_budget // RAFT_pair_memory(tile_size, small, alternate_corr)))
+    padder = InputPadder((1, 3, tile_size[1], tile_size[0]))
+    flow_sum = torch.zeros((2, h, w, 2), device=device)
+    weight_sum = torch.zeros((h, w, 1), device=device)
+    iters_total = 0
+
+    def crops(frame, group):
+        images = np.stack([frame[y0:y1, x0:x1] for x0, y0, x1, y1 in group])
+        return torch.from_numpy(images).permute(0, 3, 1, 2).float().to(device)
+
+    for i in range(0, len(tiles), batch):
+        group = tiles[i:i + batch]
+        count = len(group)
+        images = padder.pad(torch.cat([crops(frame1, group), crops(frame2, group)]))[0]
+        encodings = model.encode(images)
+        first, second = slice_encoding(encodings, slice(0, count)), slice_encoding(encodings, slice(count, 2 * count))
+        _, flow, iters_used = RAFT_refine_pairs(
+            model, cat_encodings([first, second]), cat_encodings([second, first]),
+            iters, early_exit=early_exit, upsample=upsample
+        )
+        flow = padder.unpad(flow).permute(0, 2, 3, 1).float()
+        iters_total += iters_used * count
+        for j, (x0, y0, x1, y1) in enumerate(group):
+            weights = torch.from_numpy(RAFT_tile_weights((x0, y0, x1, y1), (w, h), overlap)[..., None]).to(device)
+            flow_sum[0, y0:y1, x0:x1] += flow[j] * weights
+            flow_sum[1, y0:y1, x0:x1] += flow[count + j] * weights
+            weight_sum[y0:y1, x0:x1] += weights
+
+    flow_sum /= weight_sum
+    return flow_sum[0], flow_sum[1], iters_total / len(tiles)
+
+def RAFT_estimate_flow(frame1, frame2, device='cuda', model_path=None, small=False, inference_backend='eager',
+                       flow_cache=None, warm_start_iters=None, early_exit=None, upsample='convex',
+                       flow_scale=1.0, alternate_corr=False, memory_budget=None, tile_overlap=64,
+                       iteration_stats=None, return_tensors=False):
+    """
+    估计 frame1 -> frame2 的前向光流和反向光流
+
+    返回的光流和遮挡图都是原始分辨率；遮挡图为3通道的前后向不一致程度（像素）
+    return_tensors: True 时光流和遮挡图为 device 上的float32张量，缩放也在 device 上完成，
+        不拷回CPU（供 compute_flow_blend 直接使用）；False 时为numpy数组
+
+    flow_cache: 可选的 FlowCache，命中时直接返回缓存结果，未命中时把结果写入缓存
+    warm_start_iters: 启用时域热启动时的迭代次数，None 表示每对都从零光流开始迭代20次。
+        当 frame1 正是上一次调用的 frame2 时，用上一帧对的光流投影作为初值，只迭代 warm_start_iters 次
+    early_exit: 自适应迭代参数 {"min_iters", "delta_mean_tol", "delta_max_tol"}（见 RAFT.refine），
+        delta_flow 收敛后提前结束；None 表示固定迭代次数。实际迭代次数计入 iteration_stats
+    upsample: 'convex' | 'bilinear'，见 RAFT_refine_pairs
+    flow_scale: 在 原始分辨率*flow_scale（如0.5、0.25）上估计光流，再放大回原始分辨率。
+        相关体内存随分辨率的四次方下降，适合之后还会模糊的遮罩
+    alternate_corr: 使用局部相关体（见 RAFT_model_handle），结果与全局相关体一致
+    memory_budget: RAFT单次调用的内存上限（字节）。整帧估计超出时把帧切成互相重叠的分块，
+        分块成批估计后羽化融合（见 RAFT_plan_tiles），峰值内存与输入分辨率无关；此时不使用热启动。
+        None 表示始终整帧估计
+    tile_overlap: 相邻分块的重叠宽度（RAFT处理分辨率下的像素），应不小于画面中的最大运动幅度
+    iteration_stats: 可选的 RAFTIterationStats，累计本次调用的迭代次数和耗时
+    """
+    org_size = frame1.shape[1], frame1.shape[0]
+    size = RAFT_processing_size(org_size, flow_scale)
+    frame1 = cv2.resize(frame1, size)
+    frame2 = cv2.resize(frame2, size)
+    tiles, tile_size = RAFT_plan_tiles(size, memory_budget, small, alternate_corr, tile_overlap)
 
-        occlusion_mask = fb_norm[..., None].repeat(3, axis=-1)
+    cached = flow_cache.get(frame1, frame2) if flow_cache is not None else None
+    if cached is not None:
+        if return_tensors:
+            cached = [torch.from_numpy(array).to(device) for array in cached]
+        return _flow_outputs(*cached, org_size)
 
-    next_flow = cv2.resize(next_flow, org_size)
-    prev_flow = cv2.resize(prev_flow, org_size)
+    handle = RAFT_model_handle(device, model_path, small, inference_backend, alternate_corr)
+    with handle.use(tile_size) as model, torch.no_grad():
+        if model is None:
+            return None, None, None
 
-    return next_flow, prev_flow, occlusion_mask
+        start = time.perf_counter()
+        if len(tiles) > 1:
+            iters = 20
+            next_flow, prev_flow, iters_used = RAFT_tiled_flow(
+                model, frame1, frame2, tiles, tile_size, device, memory_budget, small, alternate_corr,
+                iters=iters, early_exit=early_exit, upsample=upsample, overlap=tile_overlap
+            )
+        else:
+            padder = InputPadder((1, 3, size[1], size[0]))
+            encoding1 = RAFT_encode_frame(model, frame1, padder, device)
+            encoding2 = RAFT_encode_frame(model, frame2, padder, device)
+
+            iters, flow_init = 20, None
+            if warm_start_iters:
+                key1, key2 = RAFTEncodingCache.frame_key(frame1), RAFTEncodingCache.frame_key(frame2)
+                if model.warm_state is not None and model.warm_state[0] == key1:
+                    iters, flow_init = warm_start_iters, RAFT_warm_start_init(*model.warm_state[1:])
+
+            # estimate optical flow: 前向和后向在同一个batch里精炼，编码结果两个方向共用
+            flow_low, flow, iters_used = RAFT_refine_pairs(
+                model, cat_encodings([encoding1, encoding2]), cat_encodings([encoding2, encoding1]),
+                iters, flow_init=flow_init, early_exit=early_exit, upsample=upsample
+            )
+            flow = padder.unpad(flow)
+            if warm_start_iters:
+                model.warm_state = (key2, flow_low[0:1], flow_low[1:2])
+
+            next_flow = flow[0].permute(1, 2, 0).float()
+            prev_flow = flow[1].permute(1, 2, 0).float()
+
+        if not return_tensors:
+            next_flow, prev_flow = next_flow.cpu().numpy(), prev_flow.cpu().numpy()
+        if iteration_stats is not None:
+            iteration_stats.record(1, iters_used, iters, time.perf_counter() - start)
+
+    if return_tensors:
+        fb_norm = torch.linalg.vector_norm(next_flow + prev_flow, dim=-1)
+        if flow_cache is not None:
+            flow_cache.put(frame1, frame2, next_flow.cpu().numpy(), prev_flow.cpu().numpy(), fb_norm.cpu().numpy())
+    else:
+        fb_norm = np.linalg.norm(next_flow + prev_flow, axis=2)
+        if flow_cache is not None:
+            flow_cache.put(frame1, frame2, next_flow, prev_flow, fb_norm)
+
+    return _flow_outputs(next_flow, prev_flow, fb_norm, org_size)
+
+def _flow_outputs(next_flow, prev_flow, fb_norm, org_size):
+    """把RAFT处理分辨率的结果缩放回原始分辨率，返回 (next_flow, prev_flow, 3通道遮挡图)；张量留在所在设备上"""
+    occlusion = RAFT_resize_occlusion(fb_norm, org_size)[..., None]
+    if isinstance(occlusion, torch.Tensor):
+        occlusion_mask = occlusion.expand(*occlusion.shape[:-1], 3)
+    else:
+        occlusion_mask = occlusion.repeat(3, axis=-1)
+    return RAFT_resize_flow(next_flow, org_size), RAFT_resize_flow(prev_flow, org_size), occlusion_mask
+
+# 整段视频的光流结果，按帧对 i -> i+1 排列:
+# next_flows / prev_flows: (P, H, W, 2) float16，已缩放回原始分辨率
+# occlusion_masks: (P, h, w) float16，前后向光流不一致程度（RAFT处理分辨率，单通道；clip_flow_pair 会放大）
+# 三者为numpy数组，或 return_tensors=True 时为留在 device 上的张量
+ClipFlows = namedtuple('ClipFlows', ['next_flows', 'prev_flows', 'occlusion_masks'])
+
+def RAFT_auto_batch_size(size, device='cuda', small=False, max_batch=8, memory_fraction=0.5, alternate_corr=False,
+                         memory_budget=None):
+    """
+    根据可用内存估算一次RAFT调用能处理的帧对数（每个帧对包含前向和后向两个样本）
+
+    size: RAFT处理分辨率 (宽, 高)
+    memory_budget: 内存上限（字节），给定时按预算而不是可用内存计算
+    """
+    per_pair = RAFT_pair_memory(size, small, alternate_corr)
+    if memory_budget is not None:
+        return int(max(1, min(max_batch, memory_budget // per_pair)))
+
+    if str(device).startswith('cuda') and torch.cuda.is_available():
+        free_bytes = torch.cuda.mem_get_info(torch.device(device))[0]
+    else:
+        try:
+            import psutil
+            free_bytes = psutil.virtual_memory().available
+        except ImportError:
+            free_bytes = 2 * 1024 ** 3
+
+    return int(max(1, min(max_batch, free_bytes * memory_fraction // per_pair)))
+
+def RAFT_estimate_clip_flows(frames, device='cuda', model_path=None, small=False, inference_backend='eager',
+                             batch_size=None, iters=20, flow_cache=None, warm_start_iters=None, early_exit=None,
+                             upsample='convex', flow_scale=1.0, alternate_corr=False, memory_budget=None,
+                             tile_overlap=64, iteration_stats=None, return_tensors=False):
+    """
+    批量估计一段连续帧的前向/后向光流
+
+    frames: RGB帧列表或 (N, H, W, 3) uint8 数组
+    batch_size: 每次RAFT调用处理的帧对数，None时根据可用内存自动选择；显存不足时自动减半重试
+    flow_cache: 可选的 FlowCache，所有帧对都命中时不运行RAFT，否则整段重新估计并写入缓存
+    warm_start_iters: 启用时域热启动（见 RAFT_estimate_flow）。热启动依赖上一帧对的结果，
+        此时逐帧对顺序估计（batch_size 固定为1），每段的第一个帧对仍从零光流开始
+    early_exit: 自适应迭代参数（见 RAFT_estimate_flow），按整个batch判断收敛
+    upsample: 'convex' | 'bilinear'，见 RAFT_refine_pairs
+    flow_scale: 光流估计分辨率相对原始分辨率的比例（见 RAFT_estimate_flow）
+    alternate_corr: 使用局部相关体（见 RAFT_model_handle）
+    memory_budget / tile_overlap: 见 RAFT_estimate_flow。整帧放得下时按预算选择 batch_size，
+        需要分块时逐帧对分块估计
+    iteration_stats: 可选的 RAFTIterationStats（见 RAFT_estimate_flow）
+    return_tensors: True 时 ClipFlows 中为 device 上的float16张量，结果不拷回CPU（见 RAFT_estimate_flow）
+
+    Returns:
+        ClipFlows，共 N-1 个帧对；模型加载失败时返回None
+    """
+    org_size = frames[0].shape[1], frames[0].shape[0]
+    size = RAFT_processing_size(org_size, flow_scale)
+    num_pairs = max(len(frames) - 1, 0)
+
+    if return_tensors:
+        next_flows = torch.empty((num_pairs, org_size[1], org_size[0], 2), dtype=torch.float16, device=device)
+        prev_flows = torch.empty_like(next_flows)
+        occlusion_masks = torch.empty((num_pairs, size[1], size[0]), dtype=torch.float16, device=device)
+    else:
+        next_flows = np.empty((num_pairs, org_size[1], org_size[0], 2), dtype=np.float16)
+        prev_flows = np.empty_like(next_flows)
+        occlusion_masks = np.empty((num_pairs, size[1], size[0]), dtype=np.float16)
+    if num_pairs == 0:
+        return ClipFlows(next_flows, prev_flows, occlusion_masks)
+
+    if len(RAFT_plan_tiles(size, memory_budget, small, alternate_corr, tile_overlap)[0]) > 1:
+        for i in range(num_pairs):
+            next_flow, prev_flow, occlusion_mask = RAFT_estimate_flow(
+                frames[i], frames[i + 1], device, model_path, small, inference_backend, flow_cache=flow_cache,
+                early_exit=early_exit, upsample=upsample, flow_scale=flow_scale, alternate_corr=alternate_corr,
+                memory_budget=memory_budget, tile_overlap=tile_overlap, iteration_stats=iteration_stats,
+                return_tensors=return_tensors
+            )
+            if next_flow is None:
+                return None
+            next_flows[i], prev_flows[i] = next_flow, prev_flow
+            occlusion_masks[i] = RAFT_resize_occlusion(occlusion_mask[..., 0], size)
+        return ClipFlows(next_flows, prev_flows, occlusion_masks)
+
+    frames_resized = [cv2.resize(frame, size) for frame in frames]
+    if flow_cache is not None:
+        cached = [flow_cache.get(frames_resized[i], frames_resized[i + 1]) for i in range(num_pairs)]
+        if all(item is not None for item in cached):
+            for i, item in enumerate(cached):
+                if return_tensors:
+                    item = [torch.from_numpy(array).to(device) for array in item]
+                next_flow, prev_flow, fb_norm = item
+                next_flows[i] = RAFT_resize_flow(next_flow, org_size)
+                prev_flows[i] = RAFT_resize_flow(prev_flow, org_size)
+                occlusion_masks[i] = fb_norm
+            return ClipFlows(next_flows, prev_flows, occlusion_masks)
+
+    handle = RAFT_model_handle(device, model_path, small, inference_backend, alternate_corr)
+    with handle.use(size) as model, torch.no_grad():
+        if model is None:
+            return None
+
+        frames_torch = torch.from_numpy(np.stack(frames_resized)).permute(0, 3, 1, 2)
+        padder = InputPadder(frames_torch.shape)
+        if warm_start_iters:
+            batch_size = 1
+        elif batch_size is None:
+            batch_size = RAFT_auto_batch_size(size, device, small, alternate_corr=alternate_corr,
+                                              memory_budget=memory_budget)
+
+        start = 0
+        warm_low = None  # 热启动时上一帧对的1/8分辨率光流 [前向, 后向]
+        last_encoding = None  # 上一批最后一帧的编码，作为这一批的第一帧复用
+        while start < num_pairs:
+            end = min(start + batch_size, num_pairs)
+            count = end - start
+            batch_start = time.perf_counter()
+
+            try:
+                # 每帧只编码一次，再组合成 [i -> i+1 ..., i+1 -> i ...] 的前向+后向batch
+                first_new = start if last_encoding is None else start + 1
+                images = padder.pad(frames_torch[first_new:end + 1].to(device).float())[0]
+                encodings = model.encode(images)
+                if last_encoding is not None:
+                    encodings = cat_encodings([last_encoding, encodings])
+                first = slice_encoding(encodings, slice(0, count))
+                second = slice_encoding(encodings, slice(1, count + 1))
+                if warm_low is not None:
+                    pair_iters, flow_init = warm_start_iters, RAFT_warm_start_init(warm_low[0:1], warm_low[1:2])
+                else:
+                    pair_iters, flow_init = iters, None
+                flow_low, flow, iters_used = RAFT_refine_pairs(
+                    model, cat_encodings([first, second]), cat_encodings([second, first]),
+                    pair_iters, flow_init=flow_init, early_exit=early_exit, upsample=upsample
+                )
+            except torch.cuda.OutOfMemoryError:
+                if batch_size == 1:
+                    raise
+                images = encodings = first = second = None
+                torch.cuda.empty_cache()
+                batch_size = max(1, batch_size // 2)
+                print(f"⚠️ RAFT批量估计显存不足，batch_size 降为 {batch_size}")
+                continue
+
+            last_encoding = slice_encoding(encodings, slice(count, count + 1))
+            if warm_start_iters:
+                warm_low = flow_low
+            flow = padder.unpad(flow).permute(0, 2, 3, 1).float()
+            if iteration_stats is not None:
+                iteration_stats.record(count, iters_used, pair_iters, time.perf_counter() - batch_start)
+            if return_tensors:
+                next_flow, prev_flow = flow[:count], flow[count:]
+                fb_norm = torch.linalg.vector_norm(next_flow + prev_flow, dim=-1)
+                occlusion_masks[start:end] = fb_norm
+                next_flows[start:end] = RAFT_resize_flow(next_flow, org_size)
+                prev_flows[start:end] = RAFT_resize_flow(prev_flow, org_size)
+                if flow_cache is not None:
+                    # 磁盘缓存只能写CPU上的数据，只在启用缓存时拷回
+                    next_flow, prev_flow, fb_norm = (t.cpu().numpy() for t in (next_flow, prev_flow, fb_norm))
+            else:
+                flow = flow.cpu().numpy()
+                next_flow, prev_flow = flow[:count], flow[count:]
+                fb_norm = np.linalg.norm(next_flow + prev_flow, axis=-1)
+                occlusion_masks[start:end] = fb_norm
+                for j in range(count):
+                    next_flows[start + j] = RAFT_resize_flow(next_flow[j], org_size)
+                    prev_flows[start + j] = RAFT_resize_flow(prev_flow[j], org_size)
+            if flow_cache is not None:
+                for j in range(count):
+                    flow_cache.put(frames_resized[start + j], frames_resized[start + j + 1],
+                                   next_flow[j], prev_flow[j], fb_norm[j])
+            start = end
+
+    return ClipFlows(next_flows, prev_flows, occlusion_masks)
+
+def RAFT_iter_clip_flows(frames, chunk_size=16, **kwargs):
+    """
+    把整段视频按 chunk_size 个帧对分块批量估计光流，逐块产出 (起始帧对索引, ClipFlows)
+
+    相邻块共享边界帧，可以在风格化之前提前计算，也可以放在另一个线程中与风格化并行。
+    其余参数同 RAFT_estimate_clip_flows。
+    """
+    for start in range(0, len(frames) - 1, chunk_size):
+        yield start, RAFT_estimate_clip_flows(frames[start:start + chunk_size + 1], **kwargs)
+
+def clip_flow_pair(clip_flows, index):
+    """从 ClipFlows 取出第index个帧对，格式与 RAFT_estimate_flow 的返回值一致（张量留在所在设备上）"""
+    org_size = clip_flows.next_flows.shape[2], clip_flows.next_flows.shape[1]
+    if isinstance(clip_flows.next_flows, torch.Tensor):
+        occlusion = RAFT_resize_occlusion(clip_flows.occlusion_masks[index].float(), org_size)[..., None]
+        return (clip_flows.next_flows[index].float(), clip_flows.prev_flows[index].float(),
+                occlusion.expand(*occlusion.shape[:-1], 3))
+    occlusion_mask = RAFT_resize_occlusion(clip_flows.occlusion_masks[index].astype(np.float32), org_size)
+    return (clip_flows.next_flows[index].astype(np.float32),
+            clip_flows.prev_flows[index].astype(np.float32),
+            occlusion_mask[..., None].repeat(3, axis=-1))
 
 def compute_diff_map(next_flow, prev_flow, prev_frame, cur_frame, prev_frame_styled, args_dict):
+    """numpy参考实现（float64、3通道遮罩），流程中使用 compute_flow_blend，这里保留用于对比"""
     h, w = cur_frame.shape[:2]
     fl_w, fl_h = next_flow.shape[:2]
 
@@ -143,6 +901,102 @@ def compute_diff_map(next_flow, prev_flow, prev_frame, cur_frame, prev_frame_sty
 
     return alpha_mask, warped_frame_styled
 
+@lru_cache(maxsize=8)
+def _pixel_grid(h, w, device):
+    """(1, h, w, 2) 的像素坐标 (x, y)，按 (h, w, 设备) 缓存"""
+    grid_y, grid_x = torch.meshgrid(torch.arange(h, device=device), torch.arange(w, device=device), indexing='ij')
+    return torch.stack((grid_x, grid_y), dim=-1).float()[None]
+
+@lru_cache(maxsize=8)
+def _gaussian_kernel(ksize, sigma, device, dtype):
+    """与 cv2.GaussianBlur 相同的一维高斯核"""
+    return torch.from_numpy(cv2.getGaussianKernel(ksize, sigma).ravel()).to(device, dtype)
+
+def _gaussian_blur(mask, ksize, sigma):
+    """
+    可分离高斯模糊，与 cv2.GaussianBlur(mask, (ksize, ksize), sigma) 一致，
+    边界为cv2默认的 BORDER_REFLECT_101（不重复边缘像素，即 F.pad 的 'reflect'）；mask: (1, 1, H, W)
+    """
+    kernel = _gaussian_kernel(ksize, sigma, mask.device, mask.dtype)
+    p = ksize // 2
+    mask = torch.nn.functional.pad(mask, (p, p, p, p), mode='reflect')
+    mask = torch.nn.functional.conv2d(mask, kernel.view(1, 1, -1, 1))
+    return torch.nn.functional.conv2d(mask, kernel.view(1, 1, 1, -1))
+
+def _as_tensor(array, device):
+    if isinstance(array, torch.Tensor):
+        return array.to(device)
+    return torch.from_numpy(np.ascontiguousarray(array)).to(device)
+
+def compute_flow_blend(next_flow, prev_flow, prev_frame, cur_frame, prev_frame_styled, args_dict, device=None):
+    """
+    compute_diff_map + 遮罩混合的torch实现：扭曲、差异、遮罩和混合在同一个设备上一次完成
+
+    光流和帧可以是numpy数组或张量；RAFT以 return_tensors=True 估计的光流已在 device 上，不再上传。
+    device为None时使用 next_flow 所在的设备（numpy为CPU）。
+    遮罩为单通道，CUDA上用float16、CPU上用float32计算；采样网格按 (H, W, 设备) 缓存。
+
+    Returns:
+        (mask, blended, coverage)
+        mask: (H, W) uint8 遮罩，即 alpha_mask * 255
+        blended: (H, W, 3) uint8，cur_frame * alpha + 扭曲后的上一帧风格化结果 * (1 - alpha)
+        coverage: alpha_mask 的均值
+    """
+    if device is None:
+        device = next_flow.device if isinstance(next_flow, torch.Tensor) else 'cpu'
+    device = torch.device(device)
+    dtype = torch.float16 if device.type == 'cuda' else torch.float32
+    h, w = cur_frame.shape[:2]
+
+    next_flow = _as_tensor(next_flow, device).float()
+    prev_flow = _as_tensor(prev_flow, device).float()
+    fl_h, fl_w = next_flow.shape[:2]
+    # 与 compute_diff_map 一致：先按光流尺寸 (W, H) 归一化
+    scale = next_flow.new_tensor([fl_w, fl_h])
+    next_flow = next_flow / scale
+    prev_flow = prev_flow / scale
+
+    fb_norm = torch.linalg.vector_norm(next_flow + prev_flow, dim=-1)
+    zero_flow_mask = (1 - torch.linalg.vector_norm(prev_flow, dim=-1) * 20).clamp_(0, 1)
+    diff_mask_flow = (fb_norm * zero_flow_mask)[None, None]
+    if (fl_h, fl_w) != (h, w):
+        diff_mask_flow = torch.nn.functional.interpolate(diff_mask_flow, size=(h, w), mode='bilinear')
+        prev_flow = torch.nn.functional.interpolate(prev_flow.permute(2, 0, 1)[None], size=(h, w),
+                                                    mode='bilinear')[0].permute(1, 2, 0)
+    # 与 compute_diff_map 一致：归一化后的x分量乘以h、y分量乘以w（保持原有遮罩行为）
+    prev_flow = prev_flow * prev_flow.new_tensor([h, w])
+
+    flow_grid = _pixel_grid(h, w, device) + prev_flow[None]
+    flow_grid = 2 * flow_grid / flow_grid.new_tensor([w - 1, h - 1]) - 1
+
+    # 原始帧和风格化帧拼成6通道，一次采样；网格保持float32，避免最近邻采样取错像素
+    frames = torch.cat([_as_tensor(prev_frame, device), _as_tensor(prev_frame_styled, device)], dim=-1)
+    frames = frames.permute(2, 0, 1)[None].float()
+    warped = torch.nn.functional.grid_sample(frames, flow_grid, mode="nearest",
+                                             padding_mode="reflection", align_corners=True)[0].to(dtype)
+    cur = _as_tensor(cur_frame, device).permute(2, 0, 1).to(dtype)
+    warped_frame, warped_styled = warped[:3], warped[3:]
+
+    alpha_mask = (diff_mask_flow[0, 0] * (args_dict['occlusion_mask_flow_multiplier'] * 10)).to(dtype)
+    if args_dict['occlusion_mask_difo_multiplier'] > 0:
+        diff_mask_org = (warped_frame - cur).abs_().amax(dim=0) / 255
+        alpha_mask = torch.maximum(alpha_mask, diff_mask_org * args_dict['occlusion_mask_difo_multiplier'])
+    if args_dict['occlusion_mask_difs_multiplier'] > 0:
+        diff_mask_stl = (warped_styled - cur).abs_().amax(dim=0) / 255
+        alpha_mask = torch.maximum(alpha_mask, diff_mask_stl * args_dict['occlusion_mask_difs_multiplier'])
+
+    if args_dict['occlusion_mask_blur'] > 0:
+        blur_filter_size = min(w, h) // 15 | 1
+        # compute_diff_map 传给 GaussianBlur 的第4个位置参数是 dst 而不是 borderType，
+        # 实际用的是默认边界 BORDER_REFLECT_101；这里保持相同的结果
+        alpha_mask = _gaussian_blur(alpha_mask[None, None], blur_filter_size, args_dict['occlusion_mask_blur'])[0, 0]
+    alpha_mask = alpha_mask.clamp_(0, 1)
+
+    blended = cur * alpha_mask + warped_styled * (1 - alpha_mask)
+    mask = (alpha_mask * 255).to(torch.uint8)
+    blended = blended.permute(1, 2, 0).to(torch.uint8)
+    return mask.cpu().numpy(), blended.cpu().numpy(), float(alpha_mask.float().mean())
+
 def frames_norm(frame):
     return frame / 127.5 - 1
 
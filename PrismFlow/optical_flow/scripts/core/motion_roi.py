@@ -0,0 +1,125 @@
+"""
+运动区域（ROI）提取
+
+把背景建模（MOG2）得到的前景和 compute_flow_blend 的遮挡遮罩合并，
+找出变化区域的外接矩形，扩展为64的倍数，供扩散模型只对这些区域做inpainting:
+
+    roi = MotionROI()
+    roi.observe(frame)                      # 每一帧都要调用，维护背景模型
+    boxes, roi_mask = roi.extract(mask)     # mask 为 compute_flow_blend 返回的 (H, W) uint8 遮罩
+    crop = paste_roi(warped, crop_result, box, roi_mask)
+
+变化区域占画面比例过大时返回一个整帧矩形，调用方按整帧处理。
+"""
+
+import cv2
+import numpy as np
+
+
+def _align_span(start, end, length, align, min_size):
+    """把区间 [start, end) 扩展为 align 的倍数（至少 min_size），并平移到 [0, length) 之内"""
+    size = max(end - start, min(min_size, length))
+    size = min(-(-size // align) * align, length // align * align or length)
+    center = (start + end) // 2
+    start = min(max(center - size // 2, 0), length - size)
+    return start, start + size
+
+
+def _merge_boxes(boxes):
+    """合并相交的矩形 (x0, y0, x1, y1)，直到没有相交为止"""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+
+class MotionROI:
+    """
+    单个任务的运动区域提取器
+
+    MOG2背景模型带内部状态，需要按顺序看到每一帧，不能在任务（线程）间共享。
+
+    threshold: 合并后的遮罩二值化阈值（0-255）
+    min_area: 小于该面积（像素）的连通域视为噪声
+    pad: 矩形向外扩展的像素数，给扩散模型留出上下文
+    align: 矩形宽高对齐的倍数（SD的潜空间为1/8，UNet下采样到1/64）
+    min_size: 矩形的最小边长，太小的裁剪块扩散效果差
+    max_area_ratio: 所有矩形面积之和超过画面的这一比例时，直接按整帧处理
+    """
+
+    def __init__(self, history=500, var_threshold=16, threshold=32, min_area=64, pad=16, align=64,
+                 min_size=256, max_area_ratio=0.5):
+        self._subtractor = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=var_threshold,
+                                                              detectShadows=True)
+        self.threshold = threshold
+        self.min_area = min_area
+        self.pad = pad
+        self.align = align
+        self.min_size = min_size
+        self.max_area_ratio = max_area_ratio
+        self._foreground = None
+
+    def observe(self, frame):
+        """用当前帧更新背景模型，并记录其前景（阴影像素记为127，不算前景）"""
+        foreground = self._subtractor.apply(frame)
+        self._foreground = np.where(foreground == 255, foreground, 0).astype(np.uint8)
+        return self._foreground
+
+    def extract(self, mask):
+        """
+        合并最近一次 observe 的前景和遮挡遮罩，返回 (矩形列表 [(x0, y0, x1, y1)], 合并后的遮罩)
+
+        没有变化区域时矩形列表为空；变化区域过大时为一个整帧矩形。
+        """
+        h, w = mask.shape[:2]
+        roi_mask = mask if self._foreground is None else np.maximum(mask, self._foreground)
+        binary = (roi_mask > self.threshold).astype(np.uint8)
+        binary = cv2.dilate(binary, np.ones((3, 3), np.uint8), iterations=max(self.pad // 4, 1))
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        boxes = []
+        for x, y, bw, bh, area in stats[1:count]:
+            if area < self.min_area:
+                continue
+            boxes.append((max(x - self.pad, 0), max(y - self.pad, 0),
+                          min(x + bw + self.pad, w), min(y + bh + self.pad, h)))
+
+        # 对齐后可能再次相交，合并到稳定为止
+        previous = None
+        while boxes != previous:
+            previous = boxes
+            boxes = []
+            for x0, y0, x1, y1 in _merge_boxes(previous):
+                x0, x1 = _align_span(x0, x1, w, self.align, self.min_size)
+                y0, y1 = _align_span(y0, y1, h, self.align, self.min_size)
+                boxes.append((x0, y0, x1, y1))
+            boxes = _merge_boxes(boxes)
+
+        if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes) > self.max_area_ratio * w * h:
+            boxes = [(0, 0, w, h)]
+        return boxes, roi_mask
+
+
+def paste_roi(frame, crop, box, mask):
+    """
+    把处理后的裁剪块按遮罩贴回 frame（原地修改并返回）
+
+    crop: 与 box 同尺寸的 (h, w, 3) uint8；mask: 整帧 (H, W) uint8 遮罩，作为贴回时的透明度，
+    遮罩之外保持 frame 原样，避免裁剪块边缘出现接缝
+    """
+    x0, y0, x1, y1 = box
+    alpha = mask[y0:y1, x0:x1, None].astype(np.float32) / 255
+    region = frame[y0:y1, x0:x1].astype(np.float32)
+    frame[y0:y1, x0:x1] = (crop.astype(np.float32) * alpha + region * (1 - alpha)).astype(np.uint8)
+    return frame
@@ -0,0 +1,185 @@
+"""
+运行报告模块 - 轻量级的分阶段计时与资源统计
+
+用法:
+    report = RunReport()
+    with report.model_load("cyclegan"):
+        ...
+    with report.frame():
+        with report.stage("raft"):
+            ...
+    report.count("frames_skipped")
+    report.write(os.path.join(output_folder, "run_report.json"))
+
+关闭时（enabled=False）所有计时器都返回同一个空上下文管理器，几乎没有额外开销。
+"""
+
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Windows 下没有 resource 模块
+    RESOURCE_AVAILABLE = False
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class RunReport:
+    """收集每个阶段/每帧的耗时、计数器和峰值内存，并在任务结束时写出JSON报告"""
+
+    def __init__(self, enabled=True, sync_cuda=False):
+        """
+        参数:
+        - enabled (bool): 是否启用统计，关闭时所有接口都是空操作
+        - sync_cuda (bool): 每个阶段进入和退出时是否同步CUDA，使GPU耗时归属到正确的阶段。
+          同步会拖慢被统计的流程，默认关闭，只在分析阶段耗时时打开
+        """
+        self.enabled = enabled
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.stage_times = OrderedDict()
+        self.model_load_times = OrderedDict()
+        self.counters = OrderedDict()
+        self.info = OrderedDict()
+        self.frame_times = []
+        self._process = psutil.Process(os.getpid()) if (enabled and PSUTIL_AVAILABLE) else None
+        self._cuda = enabled and torch.cuda.is_available()
+        # 本任务的内存采样：开始时的基线和各阶段/帧结束时采样到的峰值。
+        # 不重置 CUDA 的全进程峰值计数器，服务中并发的其他任务不受影响
+        self._rss_start = self._rss() if self._process is not None else None
+        self._peak_rss = self._rss_start or 0
+        self._vram_start = torch.cuda.memory_allocated() if self._cuda else None
+        self._peak_vram = self._vram_start or 0
+        self._start_time = time.perf_counter()
+
+    def _now(self):
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _rss(self):
+        return self._process.memory_info().rss
+
+    def _sample_memory(self):
+        if self._process is not None:
+            self._peak_rss = max(self._peak_rss, self._rss())
+        if self._cuda:
+            self._peak_vram = max(self._peak_vram, torch.cuda.memory_allocated())
+
+    @contextlib.contextmanager
+    def _timed(self, store, name):
+        start = self._now()
+        try:
+            yield
+        finally:
+            store.setdefault(name, []).append(self._now() - start)
+            self._sample_memory()
+
+    def stage(self, name):
+        """对一个处理阶段计时（可多次进入，按调用次数累计）"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(self.stage_times, name)
+
+    def model_load(self, name):
+        """对模型加载计时"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(self.model_load_times, name)
+
+    @contextlib.contextmanager
+    def _timed_frame(self):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.frame_times.append(self._now() - start)
+            self._sample_memory()
+
+    def frame(self):
+        """对单帧的完整处理计时"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed_frame()
+
+    def count(self, name, n=1):
+        """累加计数器，例如跳过的帧数"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_info(self, key, value):
+        """记录任务级别的信息（模式、参数等）"""
+        if self.enabled:
+            self.info[key] = value
+
+    @staticmethod
+    def _summarize(durations):
+        values = np.asarray(durations, dtype=np.float64)
+        return {
+            "count": int(values.size),
+            "total_s": round(float(values.sum()), 4),
+            "mean_s": round(float(values.mean()), 4),
+            "p95_s": round(float(np.percentile(values, 95)), 4),
+        }
+
+    def peak_memory(self):
+        """
+        返回内存统计（字节）
+
+        peak_*: 本任务开始后各阶段/帧结束时采样到的峰值，*_at_start: 任务开始时的基线。
+        采样之间的瞬时峰值不计入；RSS 是整个进程的，服务中并发的任务会互相计入。
+        process_peak_*: 进程启动以来的峰值（全进程，包含之前和并发的任务），仅供参考
+        """
+        self._sample_memory()
+        memory = {
+            "peak_rss_bytes": int(self._peak_rss) if self._process is not None else None,
+            "rss_at_start_bytes": self._rss_start,
+        }
+        if RESOURCE_AVAILABLE:
+            # Linux 下 ru_maxrss 单位为KB，macOS 下为字节
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            memory["process_peak_rss_bytes"] = int(max_rss if sys.platform == "darwin" else max_rss * 1024)
+        if self._cuda:
+            memory["peak_vram_allocated_bytes"] = int(self._peak_vram)
+            memory["vram_allocated_at_start_bytes"] = int(self._vram_start)
+            memory["process_peak_vram_allocated_bytes"] = int(torch.cuda.max_memory_allocated())
+            memory["process_peak_vram_reserved_bytes"] = int(torch.cuda.max_memory_reserved())
+        return memory
+
+    def summary(self):
+        """生成报告字典"""
+        report = OrderedDict()
+        report["info"] = dict(self.info)
+        report["wall_time_s"] = round(time.perf_counter() - self._start_time, 4)
+        report["frames"] = self._summarize(self.frame_times) if self.frame_times else {"count": 0}
+        report["stages"] = {name: self._summarize(times) for name, times in self.stage_times.items()}
+        report["model_load_s"] = {name: round(float(sum(times)), 4) for name, times in self.model_load_times.items()}
+        report["counters"] = dict(self.counters)
+        report["memory"] = self.peak_memory()
+        return report
+
+    def write(self, path):
+        """把报告写到JSON文件，返回文件路径；未启用时返回None"""
+        if not self.enabled:
+            return None
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+        return path
+
+
+NULL_REPORT = RunReport(enabled=False)
@@ -12,16 +12,24 @@ from diffusers import StableDiffusionControlNetPipeline, ControlNetModel, UniPCM
 from controlnet_aux import LineartAnimeDetector
 import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
 import gradio as gr
 
 # 从我们创建的库中导入CycleGAN处理器
 from cyclegan_lib.cyclegan_processor import CycleGANProcessor
+from inference_opt import QUANTIZATION_MODES
+from tiny_vae import apply_vae_mode
+from run_report import RunReport, NULL_REPORT
 
 # 【新增】导入optical flow工具
 import sys
 sys.path.append('optical_flow/scripts')
 try:
-    from core.local_flow_utils import RAFT_estimate_flow, compute_diff_map, RAFT_clear_memory
+    from core.local_flow_utils import (
+        clip_flow_pair, compute_flow_blend, RAFT_open_flow_cache, RAFT_VARIANTS
+    )
+    from core.flow_estimators import FLOW_BACKENDS, create_flow_estimator
+    from core.motion_roi import MotionROI, paste_roi
     OPTICAL_FLOW_AVAILABLE = True
     print("✅ Optical Flow模块加载成功")
 except ImportError as e:
@@ -204,92 +212,127 @@ def unload_lora_from_pipeline(pipe):
     except Exception as e:
         print(f"⚠️ LoRA卸载时出错: {e}")
 
-# 【新增】optical flow处理函数
-def process_frame_with_optical_flow(
-    curr_frame, prev_frame, prev_frame_styled, 
-    pipe, preprocessor, prompt, config, 
-    device, generator
-):
+def run_diffusion(pipe, preprocessor, init_image, prompt, config, generator,
+                  strength, mask_image=None, report=NULL_REPORT, size=None):
     """
-    使用optical flow处理单帧
+    对单张初始图像执行一次ControlNet扩散（提取线稿 + pipeline调用）
+
+    size: 扩散分辨率 (宽, 高)，默认为任务的输出分辨率；对裁剪块做inpainting时为裁剪块尺寸
     """
-    if not OPTICAL_FLOW_AVAILABLE or prev_frame_styled is None:
-        # 如果optical flow不可用或是第一帧，使用常规处理
-        curr_frame_pil = Image.fromarray(curr_frame)
-        processed_init_image = curr_frame_pil.resize((config["width"], config["height"]))
+    size = size or (config["width"], config["height"])
+    processed_init_image = init_image.resize(size)
+    extra_args = {}
+    if mask_image is not None:
+        extra_args["mask_image"] = mask_image.resize(size)
+
+    with report.stage("lineart"):
         control_image = preprocessor(processed_init_image)
+    with report.stage("diffusion"):
         return pipe(
             prompt=prompt,
             negative_prompt=config["negative_prompt"],
             image=processed_init_image,
             control_image=control_image,
+            width=size[0],
+            height=size[1],
             num_inference_steps=config["steps"],
-            strength=config["strength"],
+            strength=strength,
             guidance_scale=config["cfg_scale"],
-            generator=generator
+            generator=generator,
+            **extra_args
         ).images[0]
+
+# 【新增】optical flow处理函数
+# optical flow遮罩参数
+FLOW_MASK_ARGS = {
+    'occlusion_mask_flow_multiplier': 5.0,  # 光流遮罩倍数
+    'occlusion_mask_difo_multiplier': 2.0,   # 原始差异倍数  
+    'occlusion_mask_difs_multiplier': 0.0,   # 风格化差异倍数
+    'occlusion_mask_blur': 3.0               # 遮罩模糊强度
+}
+
+def process_frame_with_optical_flow(
+    curr_frame, prev_frame, prev_frame_styled, 
+    pipe, preprocessor, prompt, config, 
+    device, generator, report=NULL_REPORT, flows=None, flow_estimator=None, motion_roi=None, skip_state=None
+):
+    """
+    使用optical flow处理单帧
+
+    flows: 预先批量计算好的 (next_flow, prev_flow, occlusion_mask)，为None时在这里逐对估计
+    flow_estimator: 逐对估计使用的光流后端（见 build_flow_estimator），为None时按任务配置创建
+    motion_roi: 任务的 MotionROI，每一帧都要传入以维护背景模型；为None时对整帧做inpainting。
+        遮罩中没有变化区域时不做inpainting，直接输出扭曲帧
+    skip_state: 跨帧的跳过计数 {"consecutive": int}，为None时不跳过扩散。
+        遮罩覆盖率不超过 config["skip_diffusion_coverage"] 时直接输出修复后的扭曲帧，
+        连续跳过 config["max_consecutive_skips"] 帧后强制扩散一次，避免误差累积
+    """
+    if motion_roi is not None:
+        with report.stage("motion_roi"):
+            motion_roi.observe(curr_frame)
+
+    if not OPTICAL_FLOW_AVAILABLE or prev_frame_styled is None:
+        # 如果optical flow不可用或是第一帧，使用常规处理
+        return run_diffusion(pipe, preprocessor, Image.fromarray(curr_frame), prompt, config,
+                             generator, config["strength"], report=report)
     
     try:
         # 估计optical flow
-        next_flow, prev_flow, occlusion_mask = RAFT_estimate_flow(
-            prev_frame, curr_frame, device=device
-        )
+        if flows is not None:
+            next_flow, prev_flow, occlusion_mask = flows
+        else:
+            if flow_estimator is None:
+                flow_estimator = build_flow_estimator(config, device)
+            with report.stage("flow"):
+                next_flow, prev_flow, occlusion_mask = flow_estimator.estimate(prev_frame, curr_frame)
         
         if next_flow is not None:
-            # 创建optical flow参数字典
-            flow_args = {
-                'occlusion_mask_flow_multiplier': 5.0,  # 光流遮罩倍数
-                'occlusion_mask_difo_multiplier': 2.0,   # 原始差异倍数  
-                'occlusion_mask_difs_multiplier': 0.0,   # 风格化差异倍数
-                'occlusion_mask_blur': 3.0               # 遮罩模糊强度
-            }
-            
-            alpha_mask, warped_styled_frame = compute_diff_map(
-                next_flow, prev_flow, prev_frame, curr_frame, 
-                prev_frame_styled, flow_args
-            )
-            
-            # 修复扭曲的风格化帧
-            warped_styled_frame = (curr_frame.astype(float) * alpha_mask + 
-                                 warped_styled_frame.astype(float) * (1 - alpha_mask))
+            with report.stage("flow_warp"):
+                # 扭曲上一帧风格化结果，并在遮罩区域用当前帧修复（uint8输出）
+                mask, warped_styled_frame, mask_coverage = compute_flow_blend(
+                    next_flow, prev_flow, prev_frame, curr_frame, 
+                    prev_frame_styled, FLOW_MASK_ARGS, device=device
+                )
             
             # 使用扭曲帧作为初始图像
-            init_image = Image.fromarray(warped_styled_frame.astype(np.uint8))
-            mask_coverage = np.mean(alpha_mask)
+            init_image = Image.fromarray(warped_styled_frame)
             print(f"🌊 使用optical flow处理，遮罩覆盖率: {mask_coverage:.3f}")
             
+            # 几乎没有变化时，扭曲后的风格化帧就是结果
+            if skip_state is not None:
+                max_skips = config["max_consecutive_skips"]
+                if (mask_coverage <= config["skip_diffusion_coverage"]
+                        and (max_skips is None or skip_state["consecutive"] < max_skips)):
+                    skip_state["consecutive"] += 1
+                    report.count("frames_diffusion_skipped")
+                    return init_image
+                skip_state["consecutive"] = 0
+
             # 根据遮罩覆盖率选择处理模式
             if mask_coverage > 0.1:  # 如果有足够的变化区域，使用inpainting
-                mask_image = Image.fromarray(np.clip(alpha_mask * 255, 0, 255).astype(np.uint8))
-                processed_init_image = init_image.resize((config["width"], config["height"]))
-                mask_resized = mask_image.resize((config["width"], config["height"]))
-                control_image = preprocessor(processed_init_image)
-                
-                return pipe(
-                    prompt=prompt,
-                    negative_prompt=config["negative_prompt"],
-                    image=processed_init_image,
-                    mask_image=mask_resized,
-                    control_image=control_image,
-                    num_inference_steps=config["steps"],
-                    strength=0.85,  # inpainting使用较高强度
-                    guidance_scale=config["cfg_scale"],
-                    generator=generator
-                ).images[0]
+                if motion_roi is not None:
+                    with report.stage("motion_roi"):
+                        boxes, roi_mask = motion_roi.extract(mask)
+                    if not boxes:
+                        # 遮罩中没有超过阈值的变化区域，没有需要重绘的部分，直接输出扭曲帧
+                        report.count("frames_roi_empty")
+                        return init_image
+                    if boxes != [(0, 0, config["width"], config["height"])]:
+                        report.count("frames_roi_inpainted")
+                        return inpaint_motion_regions(
+                            pipe, preprocessor, warped_styled_frame, roi_mask, boxes,
+                            prompt, config, generator, report=report
+                        )
+                mask_image = Image.fromarray(mask)
+                report.count("frames_inpainted")
+                # inpainting使用较高强度
+                return run_diffusion(pipe, preprocessor, init_image, prompt, config, generator,
+                                     0.85, mask_image=mask_image, report=report)
             else:
                 # 变化较小，使用常规img2img
-                processed_init_image = init_image.resize((config["width"], config["height"]))
-                control_image = preprocessor(processed_init_image)
-                return pipe(
-                    prompt=prompt,
-                    negative_prompt=config["negative_prompt"],
-                    image=processed_init_image,
-                    control_image=control_image,
-                    num_inference_steps=config["steps"],
-                    strength=config["strength"],
-                    guidance_scale=config["cfg_scale"],
-                    generator=generator
-                ).images[0]
+                report.count("frames_img2img")
+                return run_diffusion(pipe, preprocessor, init_image, prompt, config, generator,
+                                     config["strength"], report=report)
         else:
             print("⚠️ Optical flow估计失败，使用常规处理")
             
@@ -297,19 +340,300 @@ def process_frame_with_optical_flow(
         print(f"⚠️ Optical flow处理出错: {e}")
     
     # 回退到常规处理
-    curr_frame_pil = Image.fromarray(curr_frame)
-    processed_init_image = curr_frame_pil.resize((config["width"], config["height"]))
-    control_image = preprocessor(processed_init_image)
-    return pipe(
-        prompt=prompt,
-        negative_prompt=config["negative_prompt"],
-        image=processed_init_image,
-        control_image=control_image,
-        num_inference_steps=config["steps"],
-        strength=config["strength"],
-        guidance_scale=config["cfg_scale"],
-        generator=generator
-    ).images[0]
+    report.count("flow_fallbacks")
+    return run_diffusion(pipe, preprocessor, Image.fromarray(curr_frame), prompt, config,
+                         generator, config["strength"], report=report)
+
+def inpaint_motion_regions(pipe, preprocessor, warped_styled_frame, roi_mask, boxes,
+                           prompt, config, generator, report=NULL_REPORT):
+    """
+    只对运动区域的裁剪块做inpainting，并按遮罩贴回扭曲后的风格化帧
+
+    boxes: MotionROI.extract 返回的矩形，宽高均为64的倍数
+    """
+    result = warped_styled_frame.copy()
+    for x0, y0, x1, y1 in boxes:
+        crop = Image.fromarray(np.ascontiguousarray(warped_styled_frame[y0:y1, x0:x1]))
+        crop_mask = Image.fromarray(np.ascontiguousarray(roi_mask[y0:y1, x0:x1]))
+        styled_crop = run_diffusion(pipe, preprocessor, crop, prompt, config, generator,
+                                    0.85, mask_image=crop_mask, report=report, size=(x1 - x0, y1 - y0))
+        paste_roi(result, np.array(styled_crop.convert("RGB")), (x0, y0, x1, y1), roi_mask)
+        report.count("roi_crops")
+    return Image.fromarray(result)
+
+def raft_model_options(config):
+    """从任务配置中取出RAFT模型选择参数: 权重路径、是否为RAFT-small、推理后端、相关体实现"""
+    return {
+        "model_path": config["raft_model_path"],
+        "small": RAFT_VARIANTS[config["raft_variant"]][1],
+        "inference_backend": config["inference_backend"],
+        "alternate_corr": config["raft_alternate_corr"],
+    }
+
+def flow_options(config):
+    """从任务配置中取出影响光流结果的RAFT估计参数（也用作光流缓存键的一部分）"""
+    return {
+        "warm_start_iters": config["raft_warm_start_iters"],
+        "early_exit": config["raft_early_exit"],
+        "upsample": config["raft_upsample"],
+        "flow_scale": config["flow_scale"],
+        "memory_budget": config["raft_memory_budget_mb"] * 1024 ** 2 if config["raft_memory_budget_mb"] else None,
+        "tile_overlap": config["raft_tile_overlap"],
+    }
+
+def build_flow_estimator(config, device, flow_cache=None):
+    """按任务配置创建光流后端；flow_cache 只对RAFT生效，RAFT的光流留在 device 上直接用于 compute_flow_blend"""
+    if config["flow_backend"] == "raft":
+        return create_flow_estimator(
+            "raft", device=device, batch_size=config["raft_batch_size"], flow_cache=flow_cache,
+            return_tensors=True, **raft_model_options(config), **flow_options(config)
+        )
+    return create_flow_estimator(config["flow_backend"], flow_scale=config["flow_scale"])
+
+def build_job_config(strength, vae_mode="full", **overrides):
+    """
+    构建单个任务的参数配置，overrides 中的键会覆盖默认值
+    """
+    config = {
+        "output_folder": f"outputs/debug_run_v2_{int(time.time())}",
+        "base_model_path": "models/Stable-diffusion/v1-5-pruned-emaonly.safetensors",
+        "controlnet_model_path": "models/ControlNet/control_v11p_sd15_lineart.pth",
+        "negative_prompt": "low quality, worst quality, blurry, text, logo, watermark, signature",
+        "width": 768,
+        "height": 512,
+        "cfg_scale": 7.5,
+        "steps": 20,
+        "strength": strength,  
+        "vae_mode": vae_mode,
+        "taesd_path": "models/TAESD",
+        "flow_backend": "raft",  # 'raft' | 'dis' | 'farneback'，后两者为OpenCV光流，CPU上很快，适合预览
+        "raft_variant": "full",  # 'full' | 'small'，RAFT-small 约快2-3倍，适合预览和对遮罩精度要求不高的任务
+        "raft_model_path": None,  # None 表示使用变体的默认权重 models/RAFT/raft-sintel.pth 或 raft-small.pth
+        "raft_warm_start_iters": None,  # 时域热启动的迭代次数（如8），None 表示每对冷启动迭代20次
+        # 自适应迭代，如 {"min_iters": 4, "delta_mean_tol": 0.01, "delta_max_tol": 0.2}（1/8分辨率像素），None 表示固定迭代
+        "raft_early_exit": None,
+        "raft_upsample": "convex",  # 'convex' 为RAFT凸组合上采样，'bilinear' 更快（遮罩之后还会模糊）
+        "flow_scale": 1.0,  # 光流估计分辨率比例，0.5 / 0.25 可大幅降低RAFT耗时和显存
+        "raft_alternate_corr": False,  # True 时用局部相关体代替全局相关体，显存/内存占用低但更慢，适合高分辨率
+        # RAFT单次调用的内存上限（MB），超出时把帧切成重叠分块估计再融合（如4K输入），None 表示整帧估计
+        "raft_memory_budget_mb": None,
+        "raft_tile_overlap": 64,  # 分块之间的重叠像素（RAFT处理分辨率），应覆盖画面中的最大运动幅度
+        "inference_backend": "eager",  # 'eager' | 'compile' | 'script'，作用于CycleGAN生成器和RAFT
+        # CPU上CycleGAN生成器的量化推理: 'none' | 'int8'（用本任务的帧校准，不支持时回退bf16）| 'bf16'
+        "cyclegan_quantization": "none",
+        "cyclegan_batch_size": 4,  # CycleGAN每次批量处理的帧数（帧间无依赖，整批送入生成器）
+        "flow_chunk_size": 16,  # 批量光流每块的帧对数，0 表示逐帧估计
+        "raft_batch_size": None,  # 每次RAFT调用的帧对数，None 表示按可用内存自动选择
+        "flow_cache_dir": "cache/flow",  # 光流磁盘缓存目录，None 表示不缓存
+        "flow_cache_codec": "fp16",  # 'fp16' | 'kitti'（16位量化，1/64像素精度）
+        # 只对运动区域（背景建模前景 + 遮挡遮罩）的裁剪块做inpainting；变化区域过大时仍按整帧处理
+        "motion_roi": True,
+        # 遮罩覆盖率不超过该值时跳过扩散，直接输出扭曲帧（如0.01，需要时开启）；默认0，每帧都扩散
+        "skip_diffusion_coverage": 0,
+        "max_consecutive_skips": 4,  # 开启跳过时最多连续跳过的帧数，None 表示不限制
+    }
+    config.update(overrides)
+    return config
+
+class PrefetchedFlows:
+    """
+    在后台线程中提前一块批量估计光流，按帧对顺序产出 (next_flow, prev_flow, occlusion_mask)
+
+    第i个产出对应 frames[i] -> frames[i+1]。只适用于光流只依赖原始帧的模式。
+    第一块在创建时立即开始计算；批量估计失败时，剩余帧对产出None，由调用方逐对估计。
+    用完或中途出错时必须调用 close()：等待后台线程结束并关闭分块生成器，释放其占用的RAFT模型和显存。
+    """
+
+    def __init__(self, frames, flow_estimator, chunk_size, report=NULL_REPORT):
+        self._chunks = flow_estimator.iter_clip_flows(frames, chunk_size=chunk_size)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = self._executor.submit(next, self._chunks, None)
+        self._num_pairs = max(len(frames) - 1, 0)
+        self._report = report
+        self._pairs = self._iterate()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._pairs)
+
+    def _iterate(self):
+        produced = 0
+        while produced < self._num_pairs:
+            try:
+                # 主线程只统计等待光流的时间，计算本身与风格化重叠
+                with self._report.stage("flow"):
+                    item = self._future.result()
+            except Exception as e:
+                print(f"⚠️ 批量光流估计出错，改为逐帧估计: {e}")
+                item = None
+            if item is None or item[1] is None:
+                break
+
+            self._future = self._executor.submit(next, self._chunks, None)
+            clip_flows = item[1]
+            self._report.count("flow_batches")
+            for j in range(len(clip_flows.next_flows)):
+                produced += 1
+                yield clip_flow_pair(clip_flows, j)
+        self._shutdown()
+
+        for _ in range(produced, self._num_pairs):
+            yield None
+
+    def _shutdown(self):
+        self._future.cancel()
+        self._executor.shutdown(wait=True)
+        # 后台线程已结束，分块生成器不再运行，可以安全关闭
+        self._chunks.close()
+
+    def close(self):
+        self._pairs.close()
+        self._shutdown()
+
+def iter_prefetched_flows(frames, flow_estimator, chunk_size, report=NULL_REPORT):
+    """创建 PrefetchedFlows，见其说明"""
+    return PrefetchedFlows(frames, flow_estimator, chunk_size, report=report)
+
+def iter_cyclegan_frames(frames, cyclegan_processor, batch_size, report=NULL_REPORT):
+    """
+    按 batch_size 帧一批调用 CycleGANProcessor.process_batch，逐帧产出 (H, W, 3) uint8 的风格化结果
+
+    CycleGAN的输出只依赖当前帧，可以在逐帧循环中按需整批计算；一批的耗时记在该批第一帧的 "cyclegan" 阶段。
+    """
+    for start in range(0, len(frames), batch_size):
+        with report.stage("cyclegan"):
+            outputs = cyclegan_processor.process_batch(np.stack(frames[start:start + batch_size]), batch_size)
+        report.count("cyclegan_batches")
+        yield from outputs
+
+def process_frames(
+    frames, processing_mode, cyclegan_processor, pipe, preprocessor,
+    prompt, config, device, generator, output_frames_dir,
+    report=NULL_REPORT, progress=None, flow_cache=None
+):
+    """
+    核心处理循环：按处理模式逐帧风格化，并把结果帧保存到 output_frames_dir
+
+    参数说明:
+    - frames (list[np.ndarray]): 已缩放到目标尺寸的RGB帧
+    - cyclegan_processor / pipe / preprocessor: 按模式加载的模型，未使用的可以为None
+    - progress: 可选的Gradio进度条对象，为None时使用tqdm
+    - flow_cache: 可选的光流磁盘缓存（FlowCache），见 open_flow_cache
+    """
+    desc = f"正在按模式 [{processing_mode}] 处理每一帧"
+    frame_iter = progress.tqdm(frames, desc=desc) if progress is not None else tqdm(frames, desc=desc)
+    prev_frame_styled = None  # 【新增】用于optical flow的前一帧风格化结果
+
+    flow_estimator = None
+    motion_roi = None
+    skip_state = {"consecutive": 0} if config["skip_diffusion_coverage"] > 0 else None
+    if OPTICAL_FLOW_AVAILABLE and "Stable Diffusion" in processing_mode:
+        flow_estimator = build_flow_estimator(config, device, flow_cache)
+        if config["motion_roi"]:
+            motion_roi = MotionROI()
+
+    # Stable Diffusion Only 模式的光流只依赖原始帧，可以整段分块批量提前计算；
+    # CycleGAN + SD 模式依赖逐帧的CycleGAN输出，仍逐帧估计
+    flow_iter = None
+    if (processing_mode == "Stable Diffusion Only" and flow_estimator is not None
+            and config["flow_chunk_size"] > 0):
+        flow_iter = iter_prefetched_flows(frames, flow_estimator, config["flow_chunk_size"], report=report)
+    cyclegan_iter = None
+    if "CycleGAN" in processing_mode:
+        cyclegan_iter = iter_cyclegan_frames(frames, cyclegan_processor, config["cyclegan_batch_size"], report=report)
+
+    try:
+        with torch.no_grad():
+            for i, curr_frame in enumerate(frame_iter):
+                with report.frame():
+                    prev_frame = frames[i-1] if i > 0 else None  # 【新增】前一帧
+                    result_image = None
+
+                    if processing_mode == "CycleGAN Only":
+                        stylized_image = Image.fromarray(next(cyclegan_iter))
+                
+                        if i == 0:
+                            try:
+                                diag_input_path = os.path.join(config["output_folder"], "z_diagnostic_input.png")
+                                diag_output_path = os.path.join(config["output_folder"], "z_diagnostic_output.png")
+                                Image.fromarray(curr_frame).save(diag_input_path)
+                                stylized_image.save(diag_output_path)
+                                print(f"诊断图像已保存: {diag_input_path} 和 {diag_output_path}")
+                                print(f"输入尺寸: {curr_frame.shape[1]}x{curr_frame.shape[0]}, "
+                                      f"输出尺寸: {stylized_image.size}")
+                            except Exception as e:
+                                print(f"保存诊断图像时出错: {e}")
+
+                        result_image = stylized_image
+            
+                    elif processing_mode == "Stable Diffusion Only":
+                        flows = next(flow_iter) if (flow_iter is not None and i > 0) else None
+                        # 【新增】使用optical flow增强的Stable Diffusion处理
+                        result_image = process_frame_with_optical_flow(
+                            curr_frame, prev_frame, prev_frame_styled,
+                            pipe, preprocessor, prompt, config,
+                            device, generator, report=report, flows=flows, flow_estimator=flow_estimator,
+                            motion_roi=motion_roi, skip_state=skip_state
+                        )
+
+                    elif processing_mode == "CycleGAN + Stable Diffusion":
+                        cyclegan_output_array = next(cyclegan_iter)
+                
+                        result_image = process_frame_with_optical_flow(
+                            cyclegan_output_array, prev_frame, prev_frame_styled,
+                            pipe, preprocessor, prompt, config,
+                            device, generator, report=report, flow_estimator=flow_estimator,
+                            motion_roi=motion_roi, skip_state=skip_state
+                        )
+            
+                    if result_image:
+                        filename = f"{i:05d}.png"
+                        with report.stage("save_frame"):
+                            result_image.save(os.path.join(output_frames_dir, filename))
+                
+                        # 【新增】更新prev_frame_styled用于下一帧的optical flow
+                        if "Stable Diffusion" in processing_mode:
+                            prev_frame_styled = np.array(result_image)
+                    else:
+                        report.count("frames_skipped")
+    finally:
+        if flow_iter is not None:
+            flow_iter.close()
+    if flow_estimator is not None and flow_estimator.iteration_stats is not None:
+        stats = flow_estimator.iteration_stats.pop()
+        for name, value in stats.items():
+            report.count(f"raft_{name}", value)
+        if stats["seconds"] > 0:
+            report.set_info("raft_pairs_per_s", round(stats["pairs"] / stats["seconds"], 3))
+
+def open_flow_cache(input_video_path, processing_mode, config):
+    """按任务配置打开光流磁盘缓存，不需要光流或未启用缓存时返回None"""
+    if not (OPTICAL_FLOW_AVAILABLE and "Stable Diffusion" in processing_mode and config["flow_cache_dir"]
+            and config["flow_backend"] == "raft"):
+        return None
+    try:
+        model_options = raft_model_options(config)
+        flow_cache = RAFT_open_flow_cache(
+            config["flow_cache_dir"], input_video_path, (config["width"], config["height"]),
+            model_path=model_options["model_path"], small=model_options["small"], codec=config["flow_cache_codec"],
+            **flow_options(config)
+        )
+    except Exception as e:
+        print(f"⚠️ 光流缓存打开失败，将不使用缓存: {e}")
+        return None
+    if flow_cache is not None:
+        print(f"💾 光流缓存: {flow_cache.path}")
+    return flow_cache
+
+def close_flow_cache(flow_cache, report=NULL_REPORT):
+    """关闭光流缓存并把命中情况记入报告"""
+    if flow_cache is None:
+        return
+    flow_cache.close()
+    report.count("flow_cache_hits", flow_cache.hits)
+    report.count("flow_cache_misses", flow_cache.misses)
 
 def process_video_entrypoint(
     input_video_path,
@@ -319,7 +643,10 @@ def process_video_entrypoint(
     processing_mode,
     lora_model_name,  
     lora_weight,      
-    progress=gr.Progress(track_tqdm=True)
+    vae_mode="full",
+    enable_report=True,
+    progress=gr.Progress(track_tqdm=True),
+    **job_options
 ):
     """
     v2版本：接收UI参数并执行完整的视频处理流程，支持LoRA功能和optical flow稳定化。
@@ -332,34 +659,57 @@ def process_video_entrypoint(
     - processing_mode (str): 处理模式，可选值为 "Stable Diffusion Only", "CycleGAN Only", "CycleGAN + Stable Diffusion"
     - lora_model_name (str): LoRA模型文件名，"无 (None)" 表示不使用LoRA
     - lora_weight (float): LoRA权重，范围0.0-2.0
+    - vae_mode (str): VAE模式，"full" 为完整质量，"tiny_decode" 仅解码使用TAESD，"tiny" 编解码都使用TAESD
+    - enable_report (bool): 是否统计各阶段耗时并在输出目录写出 run_report.json
     - progress: Gradio进度条对象
+    - job_options: 其他任务级参数，覆盖 build_job_config 中的默认值（如 inference_backend）
     """
     print(f"🎯 v2版本开始处理: 模式={processing_mode}")
     print(f"🎨 LoRA设置: 模型={lora_model_name}, 权重={lora_weight}")
+    print(f"⚡ VAE模式: {vae_mode}")
     print(f"🌊 Optical Flow: {'启用' if OPTICAL_FLOW_AVAILABLE and 'Stable Diffusion' in processing_mode else '禁用'}")
     
     if input_video_path is None:
         raise gr.Error("请先上传一个视频！")
 
     # 1. 参数配置
-    config = {
-        "output_folder": f"outputs/debug_run_v2_{int(time.time())}",
-        "base_model_path": "models/Stable-diffusion/v1-5-pruned-emaonly.safetensors",
-        "controlnet_model_path": "models/ControlNet/control_v11p_sd15_lineart.pth",
-        "negative_prompt": "low quality, worst quality, blurry, text, logo, watermark, signature",
-        "width": 768,
-        "height": 512,
-        "cfg_scale": 7.5,
-        "steps": 20,
-        "strength": strength,  
-    }
+    config = build_job_config(strength, vae_mode=vae_mode, **job_options)
+    if OPTICAL_FLOW_AVAILABLE and config["flow_backend"] not in FLOW_BACKENDS:
+        raise gr.Error(f"未知的光流后端: {config['flow_backend']}，可选: {', '.join(FLOW_BACKENDS)}")
+    if OPTICAL_FLOW_AVAILABLE and config["raft_variant"] not in RAFT_VARIANTS:
+        raise gr.Error(f"未知的RAFT变体: {config['raft_variant']}，可选: {', '.join(RAFT_VARIANTS)}")
+    if config["cyclegan_quantization"] not in QUANTIZATION_MODES:
+        raise gr.Error(f"未知的CycleGAN量化模式: {config['cyclegan_quantization']}，"
+                       f"可选: {', '.join(QUANTIZATION_MODES)}")
+
+    report = RunReport(enabled=enable_report)
+    report.set_info("processing_mode", processing_mode)
+    report.set_info("width", config["width"])
+    report.set_info("height", config["height"])
+    report.set_info("steps", config["steps"])
+    report.set_info("inference_backend", config["inference_backend"])
+    report.set_info("cyclegan_batch_size", config["cyclegan_batch_size"])
+    report.set_info("flow_backend", config["flow_backend"])
+    report.set_info("raft_variant", config["raft_variant"])
+    report.set_info("raft_alternate_corr", config["raft_alternate_corr"])
+    report.set_info("raft_memory_budget_mb", config["raft_memory_budget_mb"])
+    report.set_info("motion_roi", config["motion_roi"])
+    report.set_info("skip_diffusion_coverage", config["skip_diffusion_coverage"])
+    report.set_info("max_consecutive_skips", config["max_consecutive_skips"])
+    report.set_info("raft_warm_start_iters", config["raft_warm_start_iters"])
+    report.set_info("raft_early_exit", config["raft_early_exit"])
+    report.set_info("raft_upsample", config["raft_upsample"])
+    report.set_info("flow_scale", config["flow_scale"])
 
     # 2. 准备工作
     progress(0, desc="准备工作：创建目录...")
     input_frames_dir, output_frames_dir = setup_directories(config["output_folder"])
     
     progress(0.05, desc="准备工作：拆分视频帧...")
-    fps, frame_total, frames_list = extract_frames(input_video_path, input_frames_dir)  # 【修改】获取帧列表
+    with report.stage("decode"):
+        fps, frame_total, frames_list = extract_frames(input_video_path, input_frames_dir)  # 【修改】获取帧列表
+    report.set_info("frame_total", frame_total)
+    report.count("frames_skipped", 0)
     
     # 【新增】调整帧尺寸用于optical flow
     target_size = (config["width"], config["height"])
@@ -383,87 +733,58 @@ def process_video_entrypoint(
         cyclegan_norm = 'instance'
         cyclegan_no_dropout = True
 
-        cyclegan_processor = CycleGANProcessor(
-            model_name=cyclegan_model_name,
-            netG=cyclegan_netG,
-            norm=cyclegan_norm,
-            no_dropout=cyclegan_no_dropout,
-            gpu_ids='0',
-            generator_suffix='_A',
-            preserve_resolution=True
-        )
+        with report.model_load("cyclegan"):
+            cyclegan_processor = CycleGANProcessor(
+                model_name=cyclegan_model_name,
+                netG=cyclegan_netG,
+                norm=cyclegan_norm,
+                no_dropout=cyclegan_no_dropout,
+                gpu_ids='0',
+                generator_suffix='_A',
+                preserve_resolution=True,
+                inference_backend=config["inference_backend"],
+                warmup_size=(config["width"], config["height"]),
+                batch_size=config["cyclegan_batch_size"]
+            )
+        with report.model_load("cyclegan_quantization"):
+            quantization = cyclegan_processor.quantize(frames_resized, config["cyclegan_quantization"])
+        report.set_info("cyclegan_quantization", quantization["mode"] if quantization else "none")
+        if quantization is not None:
+            report.set_info("cyclegan_quantization_psnr", quantization["psnr"])
+            report.set_info("cyclegan_quantization_cached", quantization["cached"])
         
     # 加载Stable Diffusion模型
     if "Stable Diffusion" in processing_mode:
         progress(0.2, desc="加载Stable Diffusion和ControlNet模型...")
-        controlnet = ControlNetModel.from_single_file(config["controlnet_model_path"], torch_dtype=torch.float16)
-        pipe = StableDiffusionControlNetPipeline.from_single_file(
-            config["base_model_path"], controlnet=controlnet, torch_dtype=torch.float16, use_safetensors=True
-        ).to(device)
-        pipe.scheduler = UniPCMultistepScheduler.from_config(pipe.scheduler.config)
-        preprocessor = LineartAnimeDetector.from_pretrained("lllyasviel/Annotators").to(device)
+        with report.model_load("stable_diffusion"):
+            controlnet = ControlNetModel.from_single_file(config["controlnet_model_path"], torch_dtype=torch.float16)
+            pipe = StableDiffusionControlNetPipeline.from_single_file(
+                config["base_model_path"], controlnet=controlnet, torch_dtype=torch.float16, use_safetensors=True
+            ).to(device)
+            pipe.scheduler = UniPCMultistepScheduler.from_config(pipe.scheduler.config)
+        with report.model_load("vae"):
+            config["vae_mode"] = apply_vae_mode(pipe, config["vae_mode"], config["taesd_path"], device=device)
+        report.set_info("vae_mode", config["vae_mode"])
+        with report.model_load("lineart"):
+            preprocessor = LineartAnimeDetector.from_pretrained("lllyasviel/Annotators").to(device)
         
         progress(0.25, desc="加载LoRA模型...")
-        lora_success = load_lora_into_pipeline(pipe, lora_model_name, lora_weight)
+        with report.model_load("lora"):
+            lora_success = load_lora_into_pipeline(pipe, lora_model_name, lora_weight)
         if not lora_success:
             print("⚠️ LoRA加载失败，将使用基础模型继续处理")
 
     # 4. 核心处理循环
     generator = torch.Generator(device=device).manual_seed(int(seed)) if seed != -1 else None
-    prev_frame_styled = None  # 【新增】用于optical flow的前一帧风格化结果
-
-    with torch.no_grad():
-        for i, curr_frame in enumerate(progress.tqdm(frames_resized, desc=f"正在按模式 [{processing_mode}] 处理每一帧")):
-            prev_frame = frames_resized[i-1] if i > 0 else None  # 【新增】前一帧
-            result_image = None
-
-            if processing_mode == "CycleGAN Only":
-                curr_frame_pil = Image.fromarray(curr_frame)
-                stylized_image = cyclegan_processor.process_frame(curr_frame_pil)
-                
-                if i == 0:
-                    try:
-                        diag_input_path = os.path.join(config["output_folder"], "z_diagnostic_input.png")
-                        diag_output_path = os.path.join(config["output_folder"], "z_diagnostic_output.png")
-                        curr_frame_pil.save(diag_input_path)
-                        stylized_image.save(diag_output_path)
-                        print(f"诊断图像已保存: {diag_input_path} 和 {diag_output_path}")
-                        print(f"输入尺寸: {curr_frame_pil.size}, 输出尺寸: {stylized_image.size}")
-                    except Exception as e:
-                        print(f"保存诊断图像时出错: {e}")
-
-                result_image = stylized_image
-            
-            elif processing_mode == "Stable Diffusion Only":
-                # 【新增】使用optical flow增强的Stable Diffusion处理
-                result_image = process_frame_with_optical_flow(
-                    curr_frame, prev_frame, prev_frame_styled,
-                    pipe, preprocessor, prompt, config,
-                    device, generator
-                )
-
-            elif processing_mode == "CycleGAN + Stable Diffusion":
-                curr_frame_pil = Image.fromarray(curr_frame)
-                cyclegan_output_image = cyclegan_processor.process_frame(curr_frame_pil)
-                cyclegan_output_array = np.array(cyclegan_output_image)
-                
-                result_image = process_frame_with_optical_flow(
-                    cyclegan_output_array, prev_frame, prev_frame_styled,
-                    pipe, preprocessor, prompt, config,
-                    device, generator
-                )
-            
-            if result_image:
-                filename = f"{i:05d}.png"
-                result_image.save(os.path.join(output_frames_dir, filename))
-                
-                # 【新增】更新prev_frame_styled用于下一帧的optical flow
-                if "Stable Diffusion" in processing_mode:
-                    prev_frame_styled = np.array(result_image)
-
-    # 【新增】清理optical flow模型内存
-    if OPTICAL_FLOW_AVAILABLE and "Stable Diffusion" in processing_mode:
-        RAFT_clear_memory()
+    flow_cache = open_flow_cache(input_video_path, processing_mode, config)
+    try:
+        process_frames(
+            frames_resized, processing_mode, cyclegan_processor, pipe, preprocessor,
+            prompt, config, device, generator, output_frames_dir,
+            report=report, progress=progress, flow_cache=flow_cache
+        )
+    finally:
+        close_flow_cache(flow_cache, report)
 
     if pipe and "Stable Diffusion" in processing_mode:
         unload_lora_from_pipeline(pipe)
@@ -471,7 +792,12 @@ def process_video_entrypoint(
     # 5. 视频合成
     progress(0.95, desc="正在合成为最终视频...")
     final_video_path = os.path.join(config["output_folder"], "final_video_v2.mp4")
-    create_video(output_frames_dir, final_video_path, fps)
+    with report.stage("encode"):
+        create_video(output_frames_dir, final_video_path, fps)
+
+    report_path = report.write(os.path.join(config["output_folder"], "run_report.json"))
+    if report_path:
+        print(f"📊 运行报告已保存至: {report_path}")
 
     print(f"v2任务完成！输出视频已保存至: {final_video_path}")
     return final_video_path
@@ -0,0 +1,13 @@
+"""
+pytest 公共设置：让测试与 benchmarks 一样以 PrismFlow 目录为根导入模块
+
+    cd PrismFlow && python -m pytest -q tests
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'optical_flow'), os.path.join(ROOT, 'optical_flow', 'scripts')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
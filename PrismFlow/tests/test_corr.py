@@ -0,0 +1,38 @@
+import pytest
+import torch
+
+from RAFT.corr import CorrBlock, LocalCorrBlock
+
+
+def _inputs(h, w, batch=2, dim=32, seed=0):
+    torch.manual_seed(seed)
+    fmap1 = torch.randn(batch, dim, h, w)
+    fmap2 = torch.randn(batch, dim, h, w)
+    # 覆盖画面内外的采样中心：大位移会越过边界，也会落到其他行的band之外
+    y, x = torch.meshgrid(torch.arange(h).float(), torch.arange(w).float(), indexing='ij')
+    coords = torch.stack([x, y])[None].repeat(batch, 1, 1, 1)
+    coords = coords + torch.randn(batch, 2, h, w) * max(h, w) / 3
+    return fmap1, fmap2, coords
+
+
+# 16x16 对应128x128输入；12x16、8x12 的金字塔最粗一层只有一行或1x1
+@pytest.mark.parametrize("h, w", [(16, 16), (12, 16), (8, 12), (20, 28)])
+@pytest.mark.parametrize("chunk_rows", [1, 8])
+@torch.no_grad()
+def test_local_corr_matches_all_pairs(h, w, chunk_rows):
+    fmap1, fmap2, coords = _inputs(h, w)
+    expected = CorrBlock(fmap1, fmap2)(coords)
+    output = LocalCorrBlock(fmap1, fmap2, chunk_rows=chunk_rows)(coords)
+    assert torch.isfinite(output).all()
+    torch.testing.assert_close(output, expected, atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.parametrize("h, w", [(16, 16), (12, 16), (20, 28)])
+@pytest.mark.parametrize("radius", [3, 4])
+@torch.no_grad()
+def test_fused_lookup_matches_per_level_lookup(h, w, radius):
+    fmap1, fmap2, coords = _inputs(h, w)
+    block = CorrBlock(fmap1, fmap2, radius=radius)
+    # 每个 CorrBlock 自己持有网格项，不在全局缓存中累积
+    assert all(term.device == fmap1.device for term in block.grid_terms)
+    torch.testing.assert_close(block(coords), block.lookup_levels(coords), atol=1e-5, rtol=1e-5)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.stub_models import build_stub_cyclegan
+from benchmarks.synthetic_video import generate_synthetic_frames
+
+
+@pytest.mark.parametrize("width, height", [(96, 64), (90, 62)])
+def test_process_batch_matches_process_frame(tmp_path, width, height):
+    # 90x62 需要填充到4的倍数再裁回
+    frames = np.stack(generate_synthetic_frames(7, width, height, "pan"))
+    processor = build_stub_cyclegan(str(tmp_path), batch_size=3)
+    expected = np.stack([np.asarray(processor.process_frame(Image.fromarray(frame))) for frame in frames])
+
+    # 逐帧送入生成器时与 process_frame 逐位一致
+    np.testing.assert_array_equal(processor.process_batch(frames, batch_size=1), expected)
+
+    # 7帧、批大小3：最后一批只有1帧；批量卷积的累加顺序不同，只允许极少数像素在取整边界上差1
+    output = processor.process_batch(frames)
+    assert output.shape == frames.shape and output.dtype == np.uint8
+    diff = np.abs(output.astype(np.int16) - expected.astype(np.int16))
+    assert diff.max() <= 1
+    assert np.count_nonzero(diff) <= 1e-4 * diff.size
@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+
+from benchmarks.stub_models import build_stub_cyclegan
+from benchmarks.synthetic_video import generate_synthetic_frames
+from cyclegan_lib import cyclegan_processor, util
+from cyclegan_lib.cyclegan_processor import QUANTIZATION_PSNR_CAP
+from inference_opt import int8_engine
+
+PSNR_FLOOR = 25.0
+
+
+def _frames():
+    return np.stack(generate_synthetic_frames(6, 96, 64, "pan"))
+
+
+def test_int8_meets_psnr_floor_and_reuses_the_cache(tmp_path):
+    frames = _frames()
+    processor = build_stub_cyclegan(str(tmp_path))
+    reference = processor.process_batch(frames)
+
+    info = processor.quantize(frames, "int8")
+    assert info["mode"] == ("int8" if int8_engine() is not None else "bf16")
+    assert not info["cached"]
+    assert info["psnr"] > PSNR_FLOOR
+    output = processor.process_batch(frames)
+    assert output.shape == reference.shape
+    assert np.mean([util.psnr(r, o) for r, o in zip(reference, output)]) > PSNR_FLOOR
+
+    if info["mode"] == "int8":
+        # 同一checkpoint再次加载时直接使用缓存的INT8模型，不再校准
+        reloaded = build_stub_cyclegan(str(tmp_path))
+        cached_info = reloaded.quantize(frames, "int8")
+        assert cached_info["cached"] and cached_info["mode"] == "int8"
+        np.testing.assert_array_equal(reloaded.process_batch(frames), output)
+
+
+def test_bf16_meets_psnr_floor(tmp_path):
+    frames = _frames()
+    processor = build_stub_cyclegan(str(tmp_path))
+    info = processor.quantize(frames, "bf16")
+    assert info["mode"] == "bf16" and not info["cached"]
+    assert info["psnr"] > PSNR_FLOOR
+
+
+def test_identical_output_reports_a_finite_psnr(tmp_path, monkeypatch):
+    # 量化后的生成器与fp32逐位一致时 util.psnr 为 inf，报告里封顶，写出的JSON仍是标准JSON
+    monkeypatch.setattr(cyclegan_processor, "AutocastModule", lambda net, *args: net)
+    processor = build_stub_cyclegan(str(tmp_path))
+    info = processor.quantize(_frames(), "bf16")
+    assert info["psnr"] == QUANTIZATION_PSNR_CAP
+    assert json.loads(json.dumps(info, allow_nan=False)) == info
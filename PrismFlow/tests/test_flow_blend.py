@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from benchmarks.bench_diff_map import blend_reference, smooth_flow
+from benchmarks.synthetic_video import generate_synthetic_frames
+from core.local_flow_utils import _gaussian_blur, compute_flow_blend
+from run_v2v_v2_with_lora import FLOW_MASK_ARGS
+
+
+@pytest.mark.parametrize("shape, ksize, sigma", [((64, 96), 5, 3.0), ((33, 47), 9, 1.5)])
+def test_gaussian_blur_matches_cv2(shape, ksize, sigma):
+    mask = np.random.default_rng(0).random(shape).astype(np.float32)
+    expected = cv2.GaussianBlur(mask, (ksize, ksize), sigma)
+    output = _gaussian_blur(torch.from_numpy(mask)[None, None], ksize, sigma)[0, 0].numpy()
+    np.testing.assert_allclose(output, expected, atol=1e-6)
+
+
+@torch.no_grad()
+def test_flow_blend_matches_reference_within_rounding():
+    rng = np.random.default_rng(0)
+    width, height = 192, 128
+    frames = generate_synthetic_frames(3, width, height, "pan")
+    for prev_frame, curr_frame in zip(frames[:-1], frames[1:]):
+        next_flow = smooth_flow(width, height, 4.0, rng)
+        prev_flow = -next_flow + smooth_flow(width, height, 1.0, rng)
+        styled = np.ascontiguousarray(prev_frame[..., ::-1])
+        pair = (next_flow, prev_flow, prev_frame, curr_frame, styled)
+
+        ref_mask, ref_blended, ref_coverage = blend_reference(*pair)
+        mask, blended, coverage = compute_flow_blend(*pair, FLOW_MASK_ARGS, device='cpu')
+        assert np.abs(mask.astype(np.int16) - ref_mask).max() <= 1
+        assert np.abs(blended.astype(np.int16) - ref_blended).max() <= 1
+        assert coverage == pytest.approx(ref_coverage, abs=1e-4)
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from core.flow_cache import FlowCache, pair_key
+
+
+def _pair(seed, height=24, width=32):
+    rng = np.random.default_rng(seed)
+    frame1, frame2 = rng.integers(0, 256, size=(2, height, width, 3), dtype=np.uint8)
+    next_flow = rng.uniform(-40, 40, size=(height, width, 2)).astype(np.float32)
+    prev_flow = rng.uniform(-40, 40, size=(height, width, 2)).astype(np.float32)
+    occlusion = rng.uniform(0, 3, size=(height, width)).astype(np.float32)
+    return frame1, frame2, next_flow, prev_flow, occlusion
+
+
+@pytest.mark.parametrize("codec, atol", [("fp16", 0.02), ("kitti", 1 / 128 + 1e-4)])
+def test_round_trip(tmp_path, codec, atol):
+    frame1, frame2, next_flow, prev_flow, occlusion = _pair(0)
+    cache = FlowCache(str(tmp_path / "clip.flowcache"), codec=codec)
+    assert cache.get(frame1, frame2) is None
+    cache.put(frame1, frame2, next_flow, prev_flow, occlusion)
+    cache.close()
+
+    # 新实例（相当于另一个任务或进程）读到同样的结果
+    reopened = FlowCache(str(tmp_path / "clip.flowcache"), codec=codec)
+    cached_next, cached_prev, cached_occlusion = reopened.get(frame1, frame2)
+    assert cached_next.dtype == np.float32 and cached_next.shape == next_flow.shape
+    np.testing.assert_allclose(cached_next, next_flow, atol=atol)
+    np.testing.assert_allclose(cached_prev, prev_flow, atol=atol)
+    np.testing.assert_allclose(cached_occlusion, occlusion, atol=2e-3)
+    assert reopened.get(frame2, frame1) is None
+    assert (cache.hits, cache.misses, reopened.hits, reopened.misses) == (0, 1, 1, 1)
+
+
+def test_concurrent_writers_share_the_cache(tmp_path):
+    path = str(tmp_path / "clip.flowcache")
+    pairs = [_pair(seed) for seed in range(8)]
+    caches = [FlowCache(path) for _ in range(4)]
+
+    def write(cache):
+        for pair in pairs:
+            cache.put(*pair)
+
+    threads = [threading.Thread(target=write, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not [name for name in os.listdir(path) if name.endswith(".tmp")]
+    for frame1, frame2, next_flow, _, _ in pairs:
+        np.testing.assert_allclose(FlowCache(path).get(frame1, frame2)[0], next_flow, atol=0.02)
+
+
+def test_corrupt_entry_only_drops_that_pair(tmp_path):
+    path = str(tmp_path / "clip.flowcache")
+    cache = FlowCache(path)
+    good, bad = _pair(0), _pair(1)
+    cache.put(*good)
+    cache.put(*bad)
+
+    with open(os.path.join(path, f"{pair_key(bad[0], bad[1])}.npz"), "r+b") as f:
+        f.truncate(64)
+
+    assert cache.get(bad[0], bad[1]) is None
+    assert cache.get(good[0], good[1]) is not None
+    # 损坏的帧对重新计算后可以再次写入
+    cache.put(*bad)
+    assert cache.get(bad[0], bad[1]) is not None
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from core import local_flow_utils
+from core.flow_estimators import (
+    DISFlowEstimator,
+    FarnebackFlowEstimator,
+    RAFTFlowEstimator,
+    create_flow_estimator,
+)
+
+SHIFT = (3, -2)  # (dx, dy)：frame2 中的内容相对 frame1 向右3像素、向上2像素
+
+
+def _translated_pair(width=128, height=96, seed=0):
+    """平滑随机纹理及其整体平移版本"""
+    noise = np.random.default_rng(seed).uniform(0, 255, (height, width, 3)).astype(np.float32)
+    frame1 = np.clip(cv2.GaussianBlur(noise, (0, 0), 2.0) * 3 - 255, 0, 255).astype(np.uint8)
+    frame2 = np.roll(frame1, (SHIFT[1], SHIFT[0]), axis=(0, 1))
+    return frame1, frame2
+
+
+@pytest.fixture(scope="module")
+def raft_outputs(tmp_path_factory):
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path_factory.mktemp("raft")), small=True)
+    try:
+        yield RAFTFlowEstimator(device='cpu', model_path=checkpoint, small=True).estimate(*_translated_pair())
+    finally:
+        local_flow_utils.RAFT_clear_memory()
+
+
+@pytest.mark.parametrize("estimator_cls", [DISFlowEstimator, FarnebackFlowEstimator])
+@pytest.mark.parametrize("flow_scale", [1.0, 0.5])
+def test_opencv_estimators_follow_the_raft_contract(raft_outputs, estimator_cls, flow_scale):
+    frame1, frame2 = _translated_pair()
+    outputs = estimator_cls(flow_scale=flow_scale).estimate(frame1, frame2)
+    for output, reference in zip(outputs, raft_outputs):
+        assert isinstance(output, np.ndarray)
+        assert output.shape == reference.shape and output.dtype == reference.dtype
+
+    # 取中心区域（避开 np.roll 的回绕边缘）的中位数，next_flow 为平移量，prev_flow 为其相反数
+    next_flow, prev_flow, occlusion_mask = outputs
+    center = (slice(16, -16), slice(16, -16))
+    np.testing.assert_allclose(np.median(next_flow[center].reshape(-1, 2), axis=0), SHIFT, atol=0.5)
+    np.testing.assert_allclose(np.median(prev_flow[center].reshape(-1, 2), axis=0), np.negative(SHIFT), atol=0.5)
+    assert np.median(occlusion_mask[center]) < 0.5
+
+
+def test_create_flow_estimator_picks_the_backend_and_rejects_unknown_names():
+    assert isinstance(create_flow_estimator("dis", flow_scale=0.5), DISFlowEstimator)
+    farneback = create_flow_estimator("farneback")
+    assert isinstance(farneback, FarnebackFlowEstimator) and farneback.flow_scale == 1.0
+    with pytest.raises(ValueError, match="未知的光流后端"):
+        create_flow_estimator("pwcnet")
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import torch
+
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import generate_synthetic_frames
+from core import local_flow_utils
+from core.flow_cache import FlowCache
+from core.local_flow_utils import clip_flow_pair, compute_flow_blend
+from run_v2v_v2_with_lora import FLOW_MASK_ARGS
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    yield build_stub_raft_checkpoint(str(tmp_path), small=True)
+    local_flow_utils.RAFT_clear_memory()
+
+
+def _assert_tensor_outputs_match(tensors, arrays, device='cpu'):
+    for tensor, array in zip(tensors, arrays):
+        assert isinstance(tensor, torch.Tensor) and tensor.device == torch.device(device)
+        np.testing.assert_allclose(tensor.numpy(), array, atol=2e-3, rtol=1e-3)
+
+
+@pytest.mark.parametrize("flow_scale", [1.0, 0.5])
+@torch.no_grad()
+def test_estimate_flow_keeps_tensors_on_device(checkpoint, monkeypatch, flow_scale):
+    frame1, frame2 = generate_synthetic_frames(2, 256, 256, "pan")
+    options = dict(device='cpu', model_path=checkpoint, small=True, flow_scale=flow_scale)
+    arrays = local_flow_utils.RAFT_estimate_flow(frame1, frame2, **options)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(torch.Tensor, "numpy", lambda self, *a, **k: pytest.fail("flow copied to numpy"))
+        tensors = local_flow_utils.RAFT_estimate_flow(frame1, frame2, return_tensors=True, **options)
+    _assert_tensor_outputs_match(tensors, arrays)
+    assert tensors[0].shape == (256, 256, 2) and tensors[2].shape == (256, 256, 3)
+
+
+@torch.no_grad()
+def test_clip_flows_keep_tensors_on_device(checkpoint, monkeypatch):
+    frames = generate_synthetic_frames(4, 128, 128, "pan")
+    options = dict(device='cpu', model_path=checkpoint, small=True, batch_size=2)
+    arrays = local_flow_utils.RAFT_estimate_clip_flows(frames, **options)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(torch.Tensor, "numpy", lambda self, *a, **k: pytest.fail("flow copied to numpy"))
+        tensors = local_flow_utils.RAFT_estimate_clip_flows(frames, return_tensors=True, **options)
+        pairs = [clip_flow_pair(tensors, i) for i in range(3)]
+    for i, pair in enumerate(pairs):
+        _assert_tensor_outputs_match(pair, clip_flow_pair(arrays, i))
+
+
+@torch.no_grad()
+def test_cached_flows_come_back_as_tensors(checkpoint, tmp_path):
+    frames = generate_synthetic_frames(3, 128, 128, "pan")
+    cache = FlowCache(str(tmp_path / "pairs.flowcache"))
+    options = dict(device='cpu', model_path=checkpoint, small=True, flow_cache=cache, return_tensors=True)
+    computed = local_flow_utils.RAFT_estimate_clip_flows(frames, **options)
+    local_flow_utils.RAFT_clear_memory()
+    cached = local_flow_utils.RAFT_estimate_clip_flows(frames, **options)
+    assert cache.hits == 2
+    for computed_part, cached_part in zip(computed, cached):
+        assert isinstance(cached_part, torch.Tensor)
+        torch.testing.assert_close(cached_part, computed_part, atol=1e-2, rtol=1e-2)
+
+
+def test_flow_blend_accepts_device_flows():
+    rng = np.random.default_rng(0)
+    prev_frame, curr_frame = generate_synthetic_frames(2, 96, 64, "pan")
+    next_flow = rng.standard_normal((64, 96, 2)).astype(np.float32)
+    prev_flow = -next_flow
+    styled = np.ascontiguousarray(prev_frame[..., ::-1])
+    expected = compute_flow_blend(next_flow, prev_flow, prev_frame, curr_frame, styled, FLOW_MASK_ARGS)
+    output = compute_flow_blend(torch.from_numpy(next_flow), torch.from_numpy(prev_flow), prev_frame, curr_frame,
+                                styled, FLOW_MASK_ARGS)
+    for a, b in zip(output[:2], expected[:2]):
+        np.testing.assert_array_equal(a, b)
+    assert output[2] == expected[2]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import torch
+
+from RAFT.utils.utils import forward_interpolate, forward_interpolate_griddata
+from benchmarks.bench_forward_interpolate import make_flow
+from core.local_flow_utils import RAFT_warm_start_init
+
+
+def _flow(pattern, magnitude=4.0, ht=64, wd=96):
+    return make_flow(pattern, ht, wd, magnitude, np.random.default_rng(0))
+
+
+def _boundary_flow(left, right, ht=64, wd=96):
+    # 左右两半以不同速度平移：运动边界两侧既有空洞又有重叠；小数位移使投影点之间没有等距的情况
+    flow = torch.zeros(2, ht, wd)
+    flow[0, :, :wd // 2] = left
+    flow[0, :, wd // 2:] = right
+    flow[1] = 0.2
+    return flow
+
+
+@pytest.mark.parametrize("left, right", [(4.3, -3.6), (2.3, -5.6), (6.3, 1.4)])
+def test_nearest_fill_matches_griddata_at_motion_boundary(left, right):
+    flow = _boundary_flow(left, right)
+    torch.testing.assert_close(forward_interpolate(flow), forward_interpolate_griddata(flow))
+
+
+@pytest.mark.parametrize("pattern", ["smooth", "zoom"])
+def test_nearest_fill_matches_griddata_on_smooth_motion(pattern):
+    flow = _flow(pattern)
+    torch.testing.assert_close(forward_interpolate(flow), forward_interpolate_griddata(flow))
+
+
+def test_warm_start_projects_on_device_like_griddata():
+    next_low = _boundary_flow(4.3, -3.6)[None]
+    prev_low = -_boundary_flow(3.7, -4.4)[None]
+    init = RAFT_warm_start_init(next_low, prev_low)
+    assert init.device == next_low.device and init.shape == (2, 2, 64, 96)
+    torch.testing.assert_close(init[0], forward_interpolate_griddata(next_low[0]))
+    torch.testing.assert_close(init[1], -forward_interpolate_griddata(-prev_low[0]))
+
+
+@pytest.mark.parametrize("projection", [forward_interpolate, forward_interpolate_griddata])
+def test_flow_leaving_the_frame_projects_to_zero(projection):
+    flow = torch.full((2, 8, 8), 100.0)
+    assert torch.equal(projection(flow), torch.zeros(2, 8, 8))
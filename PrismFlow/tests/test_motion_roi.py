@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import run_v2v_v2_with_lora as pipeline
+from core.motion_roi import MotionROI, _align_span, _merge_boxes, paste_roi
+
+
+def test_moving_square_gives_an_aligned_box_around_it():
+    roi = MotionROI()
+    background = np.full((512, 768, 3), 40, np.uint8)
+    for _ in range(20):
+        roi.observe(background)
+    for x in (300, 310, 320):
+        frame = background.copy()
+        frame[200:240, x:x + 40] = 220
+        roi.observe(frame)
+
+    boxes, roi_mask = roi.extract(np.zeros((512, 768), np.uint8))
+    assert len(boxes) == 1
+    x0, y0, x1, y1 = boxes[0]
+    # 方块当前位置 [320, 360) x [200, 240) 在矩形内，矩形宽高为64的倍数且不小于 min_size
+    assert x0 <= 320 and 360 <= x1 and y0 <= 200 and 240 <= y1
+    assert (x1 - x0) % 64 == 0 and (y1 - y0) % 64 == 0
+    assert min(x1 - x0, y1 - y0) >= roi.min_size
+    assert roi_mask[220, 340] == 255 and roi_mask[0, 0] == 0
+
+
+@pytest.mark.parametrize("span, length, expected", [
+    ((100, 430), 768, (73, 457)),    # 330 向上取到 384，以原区间中心为中心
+    ((0, 10), 768, (0, 256)),        # 扩展到 min_size，贴着左边缘
+    ((600, 700), 768, (512, 768)),   # 扩展后超出右边缘，平移回画面内
+    ((0, 30), 100, (0, 64)),         # 画面不足 min_size 时取画面内最大的64的倍数
+])
+def test_align_span_rounds_to_multiples_of_64_and_clamps(span, length, expected):
+    assert _align_span(*span, length, 64, 256) == expected
+
+
+def test_merge_boxes_merges_overlaps_transitively():
+    # 第三个矩形同时与前两个相交，三个合并为一个；不相交的保持不变
+    boxes = [(0, 0, 10, 10), (30, 30, 40, 40), (5, 5, 32, 32), (100, 100, 120, 120)]
+    assert sorted(_merge_boxes(boxes)) == [(0, 0, 40, 40), (100, 100, 120, 120)]
+    # 只共享边的矩形不算相交
+    assert sorted(_merge_boxes([(0, 0, 10, 10), (10, 0, 20, 10)])) == [(0, 0, 10, 10), (10, 0, 20, 10)]
+
+
+def test_paste_roi_round_trip():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)
+    original = frame.copy()
+    box = (32, 0, 96, 64)
+    crop = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    mask = np.zeros((64, 96), np.uint8)
+    mask[:, 64:] = 255
+
+    paste_roi(frame, crop, box, mask)
+    # 遮罩为255处取裁剪块，为0处（包括矩形内）保持原样
+    np.testing.assert_array_equal(frame[:, 64:], crop[:, 32:])
+    np.testing.assert_array_equal(frame[:, :64], original[:, :64])
+
+
+def test_empty_roi_skips_inpainting(monkeypatch):
+    monkeypatch.setattr(pipeline, "OPTICAL_FLOW_AVAILABLE", True)
+    width, height = 256, 192
+    warped = np.full((height, width, 3), 90, np.uint8)
+    # 覆盖率超过0.1，但遮罩值都低于 MotionROI 的阈值，没有变化区域
+    mask = np.full((height, width), 30, np.uint8)
+    monkeypatch.setattr(pipeline, "compute_flow_blend", lambda *args, **kwargs: (mask, warped, 30 / 255))
+    diffusion_calls = []
+    monkeypatch.setattr(pipeline, "run_diffusion", lambda *args, **kwargs: diffusion_calls.append(kwargs))
+
+    roi = MotionROI()
+    roi.observe = lambda frame: None
+    config = pipeline.build_job_config(0.75, width=width, height=height)
+    frame = np.zeros((height, width, 3), np.uint8)
+    flows = (np.zeros((height, width, 2), np.float32),) * 2 + (np.zeros((height, width, 3), np.float32),)
+    result = pipeline.process_frame_with_optical_flow(
+        frame, frame, frame, None, None, "", config, "cpu", None, flows=flows, motion_roi=roi
+    )
+
+    assert diffusion_calls == []
+    np.testing.assert_array_equal(np.asarray(result), warped)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import run_v2v_v2_with_lora as pipeline
+from core.flow_estimators import FlowEstimator
+
+
+class _RecordingEstimator(FlowEstimator):
+    """按帧对返回零光流，并记录分块生成器是否被关闭"""
+
+    def __init__(self):
+        self.closed = False
+
+    def estimate(self, frame1, frame2):
+        h, w = frame1.shape[:2]
+        return np.zeros((h, w, 2), np.float32), np.zeros((h, w, 2), np.float32), np.zeros((h, w, 3), np.float32)
+
+    def iter_clip_flows(self, frames, chunk_size=16):
+        try:
+            yield from super().iter_clip_flows(frames, chunk_size)
+        finally:
+            self.closed = True
+
+
+def _frames(count=6):
+    return [np.zeros((32, 48, 3), np.uint8) for _ in range(count)]
+
+
+def test_close_before_first_pair_stops_prefetch():
+    estimator = _RecordingEstimator()
+    flows = pipeline.iter_prefetched_flows(_frames(), estimator, chunk_size=2)
+    flows.close()
+    assert estimator.closed
+    assert flows._executor._shutdown
+
+
+def test_prefetched_flows_cover_every_pair():
+    flows = pipeline.iter_prefetched_flows(_frames(), _RecordingEstimator(), chunk_size=2)
+    try:
+        pairs = list(flows)
+    finally:
+        flows.close()
+    assert len(pairs) == 5 and all(pair is not None for pair in pairs)
+
+
+def test_process_frames_closes_prefetch_when_a_frame_fails(tmp_path, monkeypatch):
+    estimator = _RecordingEstimator()
+    monkeypatch.setattr(pipeline, "OPTICAL_FLOW_AVAILABLE", True)
+    monkeypatch.setattr(pipeline, "build_flow_estimator", lambda config, device, flow_cache: estimator)
+
+    def failing_frame(*args, **kwargs):
+        raise RuntimeError("CUDA out of memory")
+
+    monkeypatch.setattr(pipeline, "process_frame_with_optical_flow", failing_frame)
+    config = pipeline.build_job_config(0.75, output_folder=str(tmp_path), flow_chunk_size=2, motion_roi=False)
+    with pytest.raises(RuntimeError):
+        pipeline.process_frames(_frames(), "Stable Diffusion Only", None, None, None, "", config, "cpu", None,
+                                str(tmp_path))
+    assert estimator.closed
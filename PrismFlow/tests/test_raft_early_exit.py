@@ -0,0 +1,109 @@
+import argparse
+
+import pytest
+import torch
+from torch import nn
+
+from RAFT.raft import RAFT
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import generate_synthetic_frames
+from core import local_flow_utils
+from core.local_flow_utils import RAFTIterationStats
+
+ITERS = 12
+
+
+class _DecayingUpdate(nn.Module):
+    """包装 update_block：第 k 次调用的 delta_flow 乘以 0.5**k，模拟逐步收敛，并记录每次的最大幅值"""
+
+    def __init__(self, update_block):
+        super().__init__()
+        self.update_block = update_block
+        self.peaks = []
+
+    def forward(self, *args):
+        net, up_mask, delta_flow = self.update_block(*args)
+        delta_flow = delta_flow * 0.5 ** len(self.peaks)
+        self.peaks.append(delta_flow.norm(dim=1).max().tolist())
+        return net, up_mask, delta_flow
+
+
+def _model_and_encodings(small=True):
+    torch.manual_seed(0)
+    args = argparse.Namespace(small=small, mixed_precision=False, alternate_corr=False, dropout=0)
+    model = RAFT(args).eval()
+    torch.manual_seed(1)
+    image1 = torch.rand(1, 3, 128, 128) * 255
+    image2 = torch.roll(image1, shifts=(2, 3), dims=(2, 3))
+    return model, model.encode(image1), model.encode(image2, context=False)
+
+
+@torch.no_grad()
+def test_converged_input_stops_before_iters(monkeypatch):
+    model, encoding1, encoding2 = _model_and_encodings()
+    model.update_block = _DecayingUpdate(model.update_block)
+    # 阈值取第一次更新幅值的1/20，幅值每次减半，应在第6次迭代后收敛
+    model.refine(encoding1, encoding2, iters=1, test_mode=True)
+    tol = model.update_block.peaks[0] / 20
+
+    model.update_block.peaks.clear()
+    # _converged 每次只做一次 device -> host 同步（.tolist()），不再逐个 .item()
+    with monkeypatch.context() as patch:
+        patch.setattr(torch.Tensor, "item", lambda self: pytest.fail("_converged called .item()"))
+        flow_low, flow_up, iters_used = model.refine(encoding1, encoding2, iters=ITERS, test_mode=True,
+                                                     delta_max_tol=tol, return_iters=True)
+    peaks = model.update_block.peaks
+    assert iters_used < ITERS and iters_used == len(peaks)
+    assert peaks[-1] < tol and all(peak >= tol for peak in peaks[:-1])
+
+    # 提前退出的结果与固定运行 iters_used 次完全相同
+    model.update_block.peaks.clear()
+    expected_low, expected_up = model.refine(encoding1, encoding2, iters=iters_used, test_mode=True)
+    torch.testing.assert_close(flow_low, expected_low, rtol=0, atol=0)
+    torch.testing.assert_close(flow_up, expected_up, rtol=0, atol=0)
+
+
+@torch.no_grad()
+def test_min_iters_is_respected():
+    model, encoding1, encoding2 = _model_and_encodings()
+    *_, iters_used = model.refine(encoding1, encoding2, iters=ITERS, test_mode=True, min_iters=4,
+                                  delta_mean_tol=float("inf"), return_iters=True)
+    assert iters_used == 4
+
+
+@torch.no_grad()
+def test_without_tolerances_the_fixed_iteration_result_is_kept():
+    model, encoding1, encoding2 = _model_and_encodings()
+    expected_low, expected_up = model.refine(encoding1, encoding2, iters=ITERS, test_mode=True)
+    for tolerances in ({}, {"delta_mean_tol": None, "delta_max_tol": None}, {"delta_mean_tol": 0.0}):
+        flow_low, flow_up, iters_used = model.refine(encoding1, encoding2, iters=ITERS, test_mode=True,
+                                                     return_iters=True, **tolerances)
+        assert iters_used == ITERS
+        torch.testing.assert_close(flow_low, expected_low, rtol=0, atol=0)
+        torch.testing.assert_close(flow_up, expected_up, rtol=0, atol=0)
+
+
+@torch.no_grad()
+def test_estimate_flow_without_early_exit_runs_every_iteration(tmp_path):
+    # RAFT_estimate_flow 不热启动时固定迭代20次
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    frame1, frame2 = generate_synthetic_frames(2, 128, 128, "pan")
+    options = dict(device='cpu', model_path=checkpoint, small=True)
+    try:
+        stats = RAFTIterationStats()
+        fixed = local_flow_utils.RAFT_estimate_flow(frame1, frame2, iteration_stats=stats, **options)
+        assert stats.pop()["iterations"] == 20
+
+        # 永远达不到的阈值：跑满 iters，结果与不启用提前退出相同
+        never = local_flow_utils.RAFT_estimate_flow(frame1, frame2, iteration_stats=stats,
+                                                    early_exit={"delta_mean_tol": 0.0}, **options)
+        assert stats.pop()["iterations"] == 20
+        for output, expected in zip(never, fixed):
+            torch.testing.assert_close(torch.from_numpy(output), torch.from_numpy(expected), rtol=0, atol=0)
+
+        # 立即满足的阈值：只跑 min_iters 次
+        local_flow_utils.RAFT_estimate_flow(frame1, frame2, iteration_stats=stats,
+                                            early_exit={"min_iters": 2, "delta_mean_tol": float("inf")}, **options)
+        assert stats.pop()["iterations"] == 2
+    finally:
+        local_flow_utils.RAFT_clear_memory()
@@ -0,0 +1,112 @@
+import argparse
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from RAFT.corr import CorrBlock
+from RAFT.raft import RAFT
+from RAFT.utils.utils import coords_grid, upflow8
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from core import local_flow_utils
+
+
+def _raft(small):
+    torch.manual_seed(0)
+    args = argparse.Namespace(small=small, mixed_precision=False, alternate_corr=False, dropout=0)
+    return RAFT(args).eval()
+
+
+def _images(height=128, width=128):
+    # 1/8分辨率为16x16，相关金字塔最粗一层仍有2x2，参考实现的逐层查找不会出现单像素层
+    torch.manual_seed(1)
+    image1 = torch.rand(1, 3, height, width) * 255
+    # 第二帧为平移后的第一帧加少量噪声，光流不是处处为零
+    image2 = (torch.roll(image1, shifts=(2, 3), dims=(2, 3)) + torch.rand_like(image1) * 8).clamp(0, 255)
+    return image1, image2
+
+
+def _upsample_unfold(flow, mask):
+    N, _, H, W = flow.shape
+    mask = torch.softmax(mask.view(N, 1, 9, 8, 8, H, W), dim=2)
+    up_flow = F.unfold(8 * flow, [3, 3], padding=1).view(N, 2, 9, 1, 1, H, W)
+    up_flow = torch.sum(mask * up_flow, dim=2).permute(0, 1, 4, 2, 5, 3)
+    return up_flow.reshape(N, 2, 8 * H, 8 * W)
+
+
+def upstream_forward(model, image1, image2, iters):
+    """上游RAFT.forward（编码两帧、逐层查找相关体、每次迭代都上采样），作为参考"""
+    image1 = 2 * (image1 / 255.0) - 1.0
+    image2 = 2 * (image2 / 255.0) - 1.0
+    fmap1, fmap2 = model.fnet([image1, image2])
+    corr_fn = CorrBlock(fmap1.float(), fmap2.float(), radius=model.args.corr_radius, fused=False)
+    net, inp = torch.split(model.cnet(image1), [model.hidden_dim, model.context_dim], dim=1)
+    net, inp = torch.tanh(net), torch.relu(inp)
+
+    N, _, H, W = image1.shape
+    coords0 = coords_grid(N, H // 8, W // 8, device=image1.device)
+    coords1 = coords_grid(N, H // 8, W // 8, device=image1.device)
+    predictions = []
+    for _ in range(iters):
+        corr = corr_fn(coords1)
+        net, up_mask, delta_flow = model.update_block(net, inp, corr, coords1 - coords0)
+        coords1 = coords1 + delta_flow
+        if up_mask is None:
+            predictions.append(upflow8(coords1 - coords0))
+        else:
+            predictions.append(_upsample_unfold(coords1 - coords0, up_mask))
+    return predictions
+
+
+@pytest.mark.parametrize("small", [False, True])
+@torch.no_grad()
+def test_forward_matches_upstream(small):
+    model = _raft(small)
+    image1, image2 = _images()
+    reference = upstream_forward(model, image1, image2, iters=6)
+
+    predictions = model(image1, image2, iters=6)
+    assert len(predictions) == len(reference)
+    for prediction, expected in zip(predictions, reference):
+        torch.testing.assert_close(prediction, expected, atol=1e-4, rtol=1e-4)
+
+    # test_mode 只上采样最后一次迭代的结果
+    _, flow_up = model(image1, image2, iters=6, test_mode=True)
+    torch.testing.assert_close(flow_up, reference[-1], atol=1e-4, rtol=1e-4)
+
+
+@torch.no_grad()
+def test_batched_encodings_serve_both_directions():
+    model = _raft(small=False)
+    image1, image2 = _images()
+    encoding = model.encode(torch.cat([image1, image2]))
+    first, second = (local_flow_utils.slice_encoding(encoding, slice(i, i + 1)) for i in range(2))
+
+    _, next_flow = model.refine(first, second, iters=6, test_mode=True)
+    _, prev_flow = model.refine(second, first, iters=6, test_mode=True)
+    torch.testing.assert_close(next_flow, model(image1, image2, iters=6, test_mode=True)[1], atol=1e-4, rtol=1e-4)
+    torch.testing.assert_close(prev_flow, model(image2, image1, iters=6, test_mode=True)[1], atol=1e-4, rtol=1e-4)
+
+
+def test_estimate_flow_matches_two_forward_calls(tmp_path):
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    image1, image2, image3 = (_images()[0], _images()[1], torch.roll(_images()[1], shifts=2, dims=3))
+    frames = [image.clamp(0, 255).byte()[0].permute(1, 2, 0).numpy() for image in (image1, image2, image3)]
+
+    model = _raft(small=True)
+    model.load_state_dict({k[len("module."):]: v for k, v in torch.load(checkpoint).items()})
+    try:
+        for frame1, frame2 in zip(frames[:-1], frames[1:]):
+            # 第二个帧对复用上一帧对第二帧的编码
+            next_flow, prev_flow, _ = local_flow_utils.RAFT_estimate_flow(
+                frame1, frame2, device='cpu', model_path=checkpoint, small=True
+            )
+            tensor1, tensor2 = (torch.from_numpy(f).permute(2, 0, 1).float()[None] for f in (frame1, frame2))
+            with torch.no_grad():
+                expected_next = model(tensor1, tensor2, iters=20, test_mode=True)[1][0].permute(1, 2, 0).numpy()
+                expected_prev = model(tensor2, tensor1, iters=20, test_mode=True)[1][0].permute(1, 2, 0).numpy()
+            np.testing.assert_allclose(next_flow, expected_next, atol=1e-3)
+            np.testing.assert_allclose(prev_flow, expected_prev, atol=1e-3)
+    finally:
+        local_flow_utils.RAFT_clear_memory()
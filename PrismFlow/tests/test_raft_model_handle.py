@@ -0,0 +1,88 @@
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from core import local_flow_utils
+from core.flow_estimators import RAFTFlowEstimator
+
+
+def _frames(count, seed=0, size=(128, 128)):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8) for _ in range(count)]
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_idle_unload_uses_one_reaper_thread(tmp_path):
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    handle = local_flow_utils.RAFTModelHandle('cpu', checkpoint, small=True, idle_timeout=0.5)
+    try:
+        with handle.use() as model:
+            assert model is not None
+        threads = threading.active_count()
+        # 连续使用只更新使用时间，不为每次使用创建计时线程
+        for _ in range(20):
+            with handle.use():
+                pass
+        assert threading.active_count() == threads
+        assert handle.model is not None
+        assert _wait_for(lambda: handle.model is None)
+        assert _wait_for(lambda: threading.active_count() == threads - 1)
+
+        # 卸载后再次使用时重新加载
+        with handle.use() as model:
+            assert model is not None
+    finally:
+        handle.unload()
+
+
+def test_idle_timeout_is_a_handle_setting(tmp_path):
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    default = local_flow_utils.RAFT_IDLE_TIMEOUT
+    try:
+        estimator = RAFTFlowEstimator(device='cpu', model_path=checkpoint, small=True)
+        assert estimator.load() is not None
+        local_flow_utils.RAFT_set_idle_timeout(0.2)
+        assert estimator.handle.idle_timeout == 0.2
+        # 之后创建的估计器不会改动共用句柄的设置
+        RAFTFlowEstimator(device='cpu', model_path=checkpoint, small=True)
+        assert estimator.handle.idle_timeout == 0.2
+        assert _wait_for(lambda: estimator.handle.model is None)
+    finally:
+        local_flow_utils.RAFT_set_idle_timeout(default)
+        local_flow_utils.RAFT_clear_memory()
+
+
+def test_concurrent_estimators_keep_their_own_stats(tmp_path):
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    estimators = [RAFTFlowEstimator(device='cpu', model_path=checkpoint, small=True) for _ in range(2)]
+    assert estimators[0].handle is estimators[1].handle
+    pairs = [3, 5]
+
+    def run(estimator, count, seed):
+        frames = _frames(count + 1, seed)
+        for frame1, frame2 in zip(frames[:-1], frames[1:]):
+            assert estimator.estimate(frame1, frame2)[0] is not None
+
+    try:
+        threads = [threading.Thread(target=run, args=(estimator, count, seed))
+                   for seed, (estimator, count) in enumerate(zip(estimators, pairs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for estimator, count in zip(estimators, pairs):
+            stats = estimator.iteration_stats.pop()
+            assert stats["pairs"] == count
+            assert stats["iterations"] == stats["iteration_budget"] == 20 * count
+            assert estimator.iteration_stats.pop()["pairs"] == 0
+    finally:
+        local_flow_utils.RAFT_clear_memory()
@@ -0,0 +1,77 @@
+import argparse
+import copy
+
+import torch
+
+from RAFT.raft import RAFT
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from core import local_flow_utils
+from core.local_flow_utils import RAFT_optimize
+from inference_opt import prepare_for_inference
+
+
+def _raft(small):
+    torch.manual_seed(0)
+    args = argparse.Namespace(small=small, mixed_precision=False, alternate_corr=False, dropout=0)
+    return RAFT(args).eval()
+
+
+@torch.no_grad()
+def test_script_backend_traces_small_update_block():
+    model = _raft(small=True)
+    image1, image2 = torch.rand(2, 1, 3, 64, 96) * 255
+    _, expected = model(image1, image2, iters=4, test_mode=True)
+
+    optimized = copy.deepcopy(model)
+    RAFT_optimize(optimized, "script", (1, 3, 64, 96), "cpu")
+    compiled = list(optimized.update_block.tensors._cache.values())
+    assert compiled and all(isinstance(m, torch.jit.ScriptModule) for m in compiled)
+
+    _, flow = optimized(image1, image2, iters=4, test_mode=True)
+    torch.testing.assert_close(flow, expected, atol=1e-3, rtol=1e-4)
+
+
+@torch.no_grad()
+def test_load_folds_only_encoders_with_batchnorm(tmp_path, monkeypatch):
+    folded = []
+
+    def recording_prepare(module):
+        folded.append(module)
+        return prepare_for_inference(module)
+
+    monkeypatch.setattr(local_flow_utils, "prepare_for_inference", recording_prepare)
+    image1, image2 = torch.rand(2, 1, 3, 64, 96) * 255
+    for small in (False, True):
+        folded.clear()
+        checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=small)
+        model = local_flow_utils.RAFTModelHandle('cpu', checkpoint, small=small).load()
+        reference = _raft(small)
+        reference.load_state_dict({k[len("module."):]: v for k, v in torch.load(checkpoint).items()})
+
+        # RAFT只折叠cnet（BatchNorm），fnet为InstanceNorm；RAFT-small 没有BatchNorm，保持原样
+        assert folded == ([model.cnet] if not small else [])
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules())
+        torch.testing.assert_close(model(image1, image2, iters=4, test_mode=True)[1],
+                                   reference(image1, image2, iters=4, test_mode=True)[1], atol=1e-3, rtol=1e-4)
+
+
+def _compiled_keys(model):
+    return {(name, key) for name, module in model.named_modules()
+            if hasattr(module, "_cache") for key in module._cache}
+
+
+@torch.no_grad()
+def test_warmup_covers_the_estimate_flow_shapes(tmp_path):
+    frames = (torch.rand(2, 128, 128, 3) * 255).to(torch.uint8).numpy()
+    for small in (False, True):
+        checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=small)
+        handle = local_flow_utils.RAFT_model_handle('cpu', checkpoint, small=small, inference_backend="script")
+        try:
+            model = handle.load(example_size=(128, 128))
+            warmed = _compiled_keys(model)
+            assert warmed
+            local_flow_utils.RAFT_estimate_flow(frames[0], frames[1], device='cpu', model_path=checkpoint,
+                                                small=small, inference_backend="script")
+            assert _compiled_keys(model) == warmed
+        finally:
+            local_flow_utils.RAFT_clear_memory()
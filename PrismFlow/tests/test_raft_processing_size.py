@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import torch
+
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import generate_synthetic_frames
+from core import local_flow_utils
+from core.local_flow_utils import RAFT_processing_size
+
+NEXT, PREV = (2.0, 1.0), (-1.5, -1.0)  # 前后向不一致 |NEXT + PREV| = 0.5
+
+
+@pytest.mark.parametrize("org_size, flow_scale, expected", [
+    ((1920, 1080), 1.0, (1920, 1072)),
+    ((1920, 1080), 0.5, (960, 528)),
+    ((1920, 1080), 0.25, (480, 256)),
+    # 缩得太小时每边保留128像素
+    ((1920, 1080), 0.05, (128, 128)),
+    ((200, 120), 0.5, (128, 112)),
+    # 原图本身不足128像素时不放大，只向下取16的倍数
+    ((100, 70), 1.0, (96, 64)),
+    ((100, 70), 0.25, (96, 64)),
+])
+def test_processing_size_rounding(org_size, flow_scale, expected):
+    assert RAFT_processing_size(org_size, flow_scale) == expected
+
+
+@pytest.mark.parametrize("flow_scale", [1.0, 0.75, 0.5, 0.25, 0.1])
+@pytest.mark.parametrize("org_size", [(1920, 1080), (1280, 720), (854, 480), (333, 250), (130, 90)])
+def test_processing_size_is_a_multiple_of_16_within_the_frame(org_size, flow_scale):
+    size = RAFT_processing_size(org_size, flow_scale)
+    for length, org_length in zip(size, org_size):
+        assert length % 16 == 0
+        assert min(128, org_length // 16 * 16) <= length <= org_length
+        assert length >= int(org_length * flow_scale) // 16 * 16
+
+
+@pytest.mark.parametrize("return_tensors", [False, True])
+@torch.no_grad()
+def test_flows_are_scaled_back_to_full_resolution(tmp_path, monkeypatch, return_tensors):
+    """RAFT在处理分辨率上输出恒定光流，放大回原始分辨率后向量按各自方向的缩放比例放大"""
+    org_size = (200, 120)
+    size = RAFT_processing_size(org_size, 0.5)
+    scale_x, scale_y = org_size[0] / size[0], org_size[1] / size[1]
+    assert scale_x != scale_y
+
+    def constant_refine_pairs(model, encoding1, encoding2, iters, **kwargs):
+        # 处理分辨率 128x112 的1/8为 16x14，不需要填充
+        n, _, h, w = encoding1.fmap.shape
+        assert (w * 8, h * 8) == size
+        flow = torch.tensor([NEXT, PREV]).view(2, 2, 1, 1).expand(2, 2, h * 8, w * 8).contiguous()
+        return flow[:, :, ::8, ::8] / 8, flow, iters
+
+    monkeypatch.setattr(local_flow_utils, "RAFT_refine_pairs", constant_refine_pairs)
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    frame1, frame2 = generate_synthetic_frames(2, *org_size, "pan")
+    try:
+        outputs = local_flow_utils.RAFT_estimate_flow(frame1, frame2, device='cpu', model_path=checkpoint,
+                                                      small=True, flow_scale=0.5, return_tensors=return_tensors)
+    finally:
+        local_flow_utils.RAFT_clear_memory()
+
+    next_flow, prev_flow, occlusion_mask = [
+        output.numpy() if isinstance(output, torch.Tensor) else output for output in outputs
+    ]
+    assert next_flow.shape == prev_flow.shape == (org_size[1], org_size[0], 2)
+    assert occlusion_mask.shape == (org_size[1], org_size[0], 3)
+    np.testing.assert_allclose(next_flow[..., 0], NEXT[0] * scale_x, rtol=1e-5)
+    np.testing.assert_allclose(next_flow[..., 1], NEXT[1] * scale_y, rtol=1e-5)
+    np.testing.assert_allclose(prev_flow[..., 0], PREV[0] * scale_x, rtol=1e-5)
+    np.testing.assert_allclose(prev_flow[..., 1], PREV[1] * scale_y, rtol=1e-5)
+    # 遮挡图（像素单位）按两个方向的平均缩放比例放大
+    np.testing.assert_allclose(occlusion_mask, 0.5 * (scale_x + scale_y) / 2, rtol=1e-5)
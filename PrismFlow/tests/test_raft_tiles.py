@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from RAFT.raft import Encoding
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import generate_synthetic_frames
+from core import local_flow_utils
+from core.local_flow_utils import RAFT_pair_memory, RAFT_plan_tiles, RAFT_tiled_flow
+
+
+@pytest.mark.parametrize("size, small, fraction", [
+    ((768, 512), False, 0.5),
+    ((768, 512), False, 0.1),
+    ((1920, 1088), True, 0.05),
+    ((640, 360), True, 0.3),
+])
+def test_tile_plan_covers_the_frame_within_budget(size, small, fraction):
+    budget = RAFT_pair_memory(size, small) * fraction
+    tiles, tile_size = RAFT_plan_tiles(size, budget, small)
+
+    assert len(tiles) > 1
+    assert RAFT_pair_memory(tile_size, small) <= budget
+    assert tile_size[0] % 8 == 0 and tile_size[1] % 8 == 0
+    covered = np.zeros((size[1], size[0]), bool)
+    for x0, y0, x1, y1 in tiles:
+        assert (x1 - x0, y1 - y0) == tile_size
+        assert 0 <= x0 and 0 <= y0 and x1 <= size[0] and y1 <= size[1]
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+
+
+def test_whole_frame_when_it_fits():
+    size = (768, 512)
+    assert RAFT_plan_tiles(size, None) == ([(0, 0, 768, 512)], size)
+    assert RAFT_plan_tiles(size, RAFT_pair_memory(size)) == ([(0, 0, 768, 512)], size)
+
+
+class _PointwiseRAFT:
+    """
+    光流只取决于同一像素两帧颜色的替身模型：分块与整帧估计的结果应当完全相同，只检验分块、融合和前后向的拼接。
+    （随机权重的RAFT有InstanceNorm和全局相关体，结果本身就随分块而变）
+    """
+
+    def encode(self, images):
+        return Encoding(images, images, images)
+
+    def refine(self, encoding1, encoding2, iters=12, flow_init=None, upsample=True, test_mode=False,
+               return_iters=False, **kwargs):
+        image1, image2 = encoding1.fmap, encoding2.fmap
+        flow_up = torch.stack([image1[:, 0] - image2[:, 1], image1[:, 2] * 0.5 - image2[:, 0] * 0.25], dim=1) / 16
+        return F.avg_pool2d(flow_up, 8), flow_up, iters
+
+
+def test_tiled_flow_matches_whole_frame_flow():
+    frame1, frame2 = generate_synthetic_frames(2, 384, 256, "pan")
+    size = (384, 256)
+    model = _PointwiseRAFT()
+    budget = RAFT_pair_memory(size) * 0.3
+    tiles, tile_size = RAFT_plan_tiles(size, budget)
+    assert len(tiles) > 2
+
+    with torch.no_grad():
+        expected = RAFT_tiled_flow(model, frame1, frame2, [(0, 0) + size], size, 'cpu', float('inf'))
+        tiled = RAFT_tiled_flow(model, frame1, frame2, tiles, tile_size, 'cpu', budget)
+    torch.testing.assert_close(tiled[0], expected[0])
+    torch.testing.assert_close(tiled[1], expected[1])
+    # 前向为 frame1 -> frame2，后向为 frame2 -> frame1
+    assert not torch.allclose(tiled[0], tiled[1])
+    assert tiled[2] == expected[2] == 20
+
+
+def test_estimate_flow_tiles_over_budget(tmp_path):
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    frame1, frame2 = generate_synthetic_frames(2, 384, 256, "pan")
+    stats = local_flow_utils.RAFTIterationStats()
+    try:
+        next_flow, prev_flow, occlusion = local_flow_utils.RAFT_estimate_flow(
+            frame1, frame2, device='cpu', model_path=checkpoint, small=True,
+            memory_budget=RAFT_pair_memory((384, 256), small=True) * 0.5, iteration_stats=stats
+        )
+    finally:
+        local_flow_utils.RAFT_clear_memory()
+    assert next_flow.shape == prev_flow.shape == (256, 384, 2) and occlusion.shape == (256, 384, 3)
+    assert np.isfinite(next_flow).all() and np.isfinite(prev_flow).all()
+    assert stats.pop()["pairs"] == 1
@@ -0,0 +1,30 @@
+import torch
+
+import run_report
+from run_report import RunReport
+
+
+def test_cuda_sync_is_opt_in(monkeypatch):
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    assert not RunReport(enabled=False).sync_cuda
+    assert not RunReport(enabled=False, sync_cuda=False).sync_cuda
+    assert RunReport(enabled=False, sync_cuda=True).sync_cuda
+
+
+def test_peak_memory_comes_from_the_jobs_own_samples(monkeypatch):
+    rss = iter([100, 300, 200, 150])
+    report = RunReport(enabled=True)
+    monkeypatch.setattr(report, "_rss", lambda: next(rss))
+    report._rss_start = report._peak_rss = report._rss()
+    with report.stage("a"):
+        pass
+    with report.frame():
+        pass
+
+    memory = report.peak_memory()
+    # 基线和峰值只来自本任务的采样，进程启动以来的峰值单独标注
+    assert memory["rss_at_start_bytes"] == 100
+    assert memory["peak_rss_bytes"] == 300
+    if run_report.RESOURCE_AVAILABLE:
+        assert memory["process_peak_rss_bytes"] > 300
+
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import run_v2v_v2_with_lora as pipeline
+from test_prefetched_flows import _RecordingEstimator
+
+
+@pytest.mark.parametrize("overrides, expect_skipping", [({}, False), ({"skip_diffusion_coverage": 0.01}, True)])
+def test_skipping_diffusion_is_opt_in(tmp_path, monkeypatch, overrides, expect_skipping):
+    monkeypatch.setattr(pipeline, "OPTICAL_FLOW_AVAILABLE", True)
+    monkeypatch.setattr(pipeline, "build_flow_estimator", lambda config, device, flow_cache: _RecordingEstimator())
+    skip_states = []
+
+    def record_frame(*args, skip_state=None, **kwargs):
+        skip_states.append(skip_state)
+        return None
+
+    monkeypatch.setattr(pipeline, "process_frame_with_optical_flow", record_frame)
+    config = pipeline.build_job_config(0.75, output_folder=str(tmp_path), motion_roi=False, **overrides)
+    frames = [np.zeros((32, 48, 3), np.uint8) for _ in range(4)]
+    pipeline.process_frames(frames, "Stable Diffusion Only", None, None, None, "", config, "cpu", None, str(tmp_path))
+
+    assert len(skip_states) == len(frames)
+    assert all((state is not None) == expect_skipping for state in skip_states)
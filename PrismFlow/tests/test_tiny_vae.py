@@ -0,0 +1,45 @@
+import torch
+from diffusers import AutoencoderKL, AutoencoderTiny, DiffusionPipeline
+
+from tiny_vae import TinyDecodeVAE
+
+
+class _VAEPipeline(DiffusionPipeline):
+    def __init__(self, vae):
+        super().__init__()
+        self.register_modules(vae=vae)
+
+
+def _tiny_decode_vae():
+    torch.manual_seed(0)
+    full = AutoencoderKL(block_out_channels=(8,), norm_num_groups=4, latent_channels=4, sample_size=32)
+    tiny = AutoencoderTiny(encoder_block_out_channels=(8, 8, 8, 8), decoder_block_out_channels=(8, 8, 8, 8))
+    return TinyDecodeVAE(full, tiny)
+
+
+def test_tiny_decode_vae_exposes_pipeline_attributes():
+    vae = _tiny_decode_vae()
+    pipe = _VAEPipeline(vae.full_vae)
+    pipe.vae = vae
+    pipe.to("cpu", torch.float32)
+
+    assert pipe.vae is vae
+    assert vae.config is vae.full_vae.config
+    assert vae.dtype == torch.float32 and vae.device.type == "cpu"
+    assert pipe.dtype == torch.float32
+
+    vae.enable_tiling()
+    assert vae.full_vae.use_tiling and vae.tiny_vae.use_tiling
+    vae.disable_tiling()
+    assert not vae.full_vae.use_tiling and not vae.tiny_vae.use_tiling
+    vae.enable_slicing()
+    assert vae.full_vae.use_slicing and vae.tiny_vae.use_slicing
+
+
+@torch.no_grad()
+def test_tiny_decode_vae_rescales_latents_for_taesd():
+    vae = _tiny_decode_vae()
+    z = torch.randn(1, 4, 8, 8)
+    scale = vae.full_vae.config.scaling_factor / vae.tiny_vae.config.scaling_factor
+    expected = vae.tiny_vae.decode(z * scale).sample
+    torch.testing.assert_close(vae.decode(z).sample, expected)
@@ -0,0 +1,19 @@
+import argparse
+
+import torch
+
+from benchmarks.bench_raft_flow import warm_start_cost
+from benchmarks.stub_models import build_stub_raft_checkpoint
+from benchmarks.synthetic_video import generate_synthetic_frames
+from core import local_flow_utils
+
+
+@torch.no_grad()
+def test_warm_start_projection_costs_less_than_the_iterations_it_saves(tmp_path):
+    frames = generate_synthetic_frames(3, 128, 128, "pan")
+    checkpoint = build_stub_raft_checkpoint(str(tmp_path), small=True)
+    model = local_flow_utils.RAFTModelHandle('cpu', checkpoint, small=True).load()
+    args = argparse.Namespace(device='cpu', iters=20, warm_iters=8)
+
+    projection, saved = warm_start_cost(model, frames, args, runs=3)
+    assert 0 < projection < saved
@@ -0,0 +1,69 @@
+import argparse
+import os
+
+import numpy as np
+import torch
+
+import convert_weights
+from benchmarks.stub_models import STUB_CYCLEGAN_NAME, build_stub_cyclegan, build_stub_raft_checkpoint
+from benchmarks.synthetic_video import generate_synthetic_frames
+from cyclegan_lib.cyclegan_processor import CycleGANProcessor
+from core.local_flow_utils import RAFTModelHandle
+from weights_io import load_safetensors, resolve_weights, safetensors_path
+
+
+def _cyclegan_args(checkpoints_dir):
+    return argparse.Namespace(name=STUB_CYCLEGAN_NAME, checkpoints_dir=checkpoints_dir, netG='resnet_6blocks',
+                              norm='instance', ngf=8, dropout=False, suffix='_A', epoch='latest')
+
+
+def _load_cyclegan(checkpoints_dir):
+    return CycleGANProcessor(STUB_CYCLEGAN_NAME, netG='resnet_6blocks', norm='instance', gpu_ids='-1',
+                             checkpoints_dir=checkpoints_dir, ngf=8)
+
+
+def test_cyclegan_safetensors_matches_pth(tmp_path):
+    frames = np.stack(generate_synthetic_frames(2, 64, 48, "pan"))
+    expected = build_stub_cyclegan(str(tmp_path)).process_batch(frames)
+
+    checkpoints_dir = str(tmp_path / "checkpoints")
+    convert_weights.convert_cyclegan(_cyclegan_args(checkpoints_dir))
+    pth_path = os.path.join(checkpoints_dir, STUB_CYCLEGAN_NAME, "latest_net_G_A.pth")
+    assert resolve_weights(pth_path) == safetensors_path(pth_path)
+
+    np.testing.assert_array_equal(_load_cyclegan(checkpoints_dir).process_batch(frames), expected)
+
+
+def test_int8_cache_key_follows_the_loaded_weights(tmp_path):
+    frames = np.stack(generate_synthetic_frames(2, 64, 48, "pan"))
+    build_stub_cyclegan(str(tmp_path))
+    checkpoints_dir = str(tmp_path / "checkpoints")
+    convert_weights.convert_cyclegan(_cyclegan_args(checkpoints_dir))
+    # 只保留转换后的 .safetensors
+    os.remove(os.path.join(checkpoints_dir, STUB_CYCLEGAN_NAME, "latest_net_G_A.pth"))
+
+    processor = _load_cyclegan(checkpoints_dir)
+    info = processor.quantize(frames, "int8")
+    if info["mode"] == "int8":
+        assert _load_cyclegan(checkpoints_dir).quantize(frames, "int8")["cached"]
+
+
+@torch.no_grad()
+def test_raft_safetensors_matches_pth(tmp_path):
+    image1, image2 = torch.rand(2, 1, 3, 64, 96) * 255
+    for small in (False, True):
+        work_dir = tmp_path / ("small" if small else "full")
+        work_dir.mkdir()
+        pth_path = build_stub_raft_checkpoint(str(work_dir), small=small)
+        expected = RAFTModelHandle('cpu', pth_path, small=small).load()(image1, image2, iters=4, test_mode=True)[1]
+
+        convert_weights.convert_raft(argparse.Namespace(checkpoints=[pth_path]))
+        sf_path = safetensors_path(pth_path)
+        assert resolve_weights(pth_path) == sf_path
+        state_dict = load_safetensors(sf_path)
+        assert not any(name.startswith("module.") for name in state_dict)
+
+        model = RAFTModelHandle('cpu', pth_path, small=small).load()
+        # 没有被折叠改写的权重直接是整个文件映射的视图
+        assert model.fnet.conv1.weight.untyped_storage().nbytes() == os.path.getsize(sf_path)
+        torch.testing.assert_close(model(image1, image2, iters=4, test_mode=True)[1], expected)
@@ -0,0 +1,186 @@
+"""
+轻量级VAE模块 - 用TAESD风格的小型自编码器替换Stable Diffusion的完整VAE
+
+完整的SD VAE解码器是每帧开销中占比很大的一部分（在CPU上尤为明显）。
+TAESD是蒸馏得到的小型自编码器，与SD VAE共享同一潜空间，可以直接替换，
+代价是细节质量略有下降，适合预览和追求吞吐量的任务。
+
+支持的VAE模式:
+- "full":        使用完整的SD VAE（默认，最高质量）
+- "tiny_decode": 编码仍使用完整VAE，仅解码使用TAESD
+- "tiny":        编码和解码都使用TAESD（最快）
+
+权重目录支持两种格式:
+1. diffusers格式目录 (包含 config.json 和 diffusion_pytorch_model.safetensors)
+2. 原始TAESD权重文件 taesd_encoder.pth / taesd_decoder.pth
+"""
+
+import os
+from typing import Optional
+
+import torch
+from diffusers import AutoencoderTiny
+
+VAE_MODES = ("full", "tiny_decode", "tiny")
+
+TAESD_ENCODER_FILE = "taesd_encoder.pth"
+TAESD_DECODER_FILE = "taesd_decoder.pth"
+
+
+def _load_original_taesd(taesd_dir: str, need_encoder: bool) -> Optional[AutoencoderTiny]:
+    """从原始TAESD的 .pth 文件构建 AutoencoderTiny"""
+    decoder_path = os.path.join(taesd_dir, TAESD_DECODER_FILE)
+    encoder_path = os.path.join(taesd_dir, TAESD_ENCODER_FILE)
+    if not os.path.isfile(decoder_path):
+        print(f"⚠️ 找不到TAESD解码器权重: {decoder_path}")
+        return None
+    if need_encoder and not os.path.isfile(encoder_path):
+        print(f"⚠️ 找不到TAESD编码器权重: {encoder_path}")
+        return None
+
+    vae = AutoencoderTiny()
+    state_dict = {}
+
+    # 原始解码器以Clamp层开头，diffusers版本把clamp放进了forward，层序号整体减1
+    decoder_state = torch.load(decoder_path, map_location="cpu")
+    for key, value in decoder_state.items():
+        layer_id, rest = key.split(".", 1)
+        state_dict[f"decoder.layers.{int(layer_id) - 1}.{rest}"] = value
+
+    if need_encoder:
+        encoder_state = torch.load(encoder_path, map_location="cpu")
+        for key, value in encoder_state.items():
+            state_dict[f"encoder.layers.{key}"] = value
+
+    # 仅解码模式下编码器权重保持随机初始化，不会被使用
+    vae.load_state_dict(state_dict, strict=need_encoder)
+    return vae
+
+
+def load_tiny_vae(taesd_dir: str, need_encoder: bool = True, dtype=torch.float16) -> Optional[AutoencoderTiny]:
+    """
+    从本地目录加载TAESD小型自编码器
+
+    Args:
+        taesd_dir: TAESD权重目录
+        need_encoder: 是否需要编码器权重（仅解码模式下可以只提供解码器）
+        dtype: 模型精度
+
+    Returns:
+        成功时返回 AutoencoderTiny，失败时返回None
+    """
+    if not os.path.isdir(taesd_dir):
+        print(f"⚠️ TAESD目录不存在: {taesd_dir}")
+        return None
+
+    if os.path.isfile(os.path.join(taesd_dir, "config.json")):
+        vae = AutoencoderTiny.from_pretrained(taesd_dir, torch_dtype=dtype)
+    else:
+        vae = _load_original_taesd(taesd_dir, need_encoder)
+        if vae is None:
+            return None
+        vae = vae.to(dtype=dtype)
+
+    vae.eval()
+    return vae
+
+
+class TinyDecodeVAE(torch.nn.Module):
+    """
+    混合VAE：编码使用完整VAE，解码使用TAESD
+
+    对外暴露完整VAE的config（包括scaling_factor），因此pipeline传入的潜变量
+    已被除以完整VAE的scaling_factor，这里需要先还原再交给TAESD解码。
+
+    diffusers pipeline 会直接读取 pipe.vae 的 config / dtype / device，并调用 enable_slicing、
+    enable_tiling、fuse_qkv_projections 等方法，这些都在这里显式转发：切片和分块对两个VAE都生效，
+    注意力相关的方法只作用于完整VAE（TAESD没有注意力层）。
+    """
+
+    def __init__(self, full_vae, tiny_vae):
+        super().__init__()
+        self.full_vae = full_vae
+        self.tiny_vae = tiny_vae
+
+    @property
+    def config(self):
+        return self.full_vae.config
+
+    @property
+    def dtype(self):
+        return self.tiny_vae.dtype
+
+    @property
+    def device(self):
+        return self.tiny_vae.device
+
+    def encode(self, x, return_dict=True):
+        return self.full_vae.encode(x, return_dict=return_dict)
+
+    def decode(self, z, return_dict=True, generator=None):
+        scale = self.full_vae.config.scaling_factor / self.tiny_vae.config.scaling_factor
+        return self.tiny_vae.decode(z * scale, return_dict=return_dict)
+
+    def enable_slicing(self):
+        self.full_vae.enable_slicing()
+        self.tiny_vae.enable_slicing()
+
+    def disable_slicing(self):
+        self.full_vae.disable_slicing()
+        self.tiny_vae.disable_slicing()
+
+    def enable_tiling(self, *args, **kwargs):
+        self.full_vae.enable_tiling(*args, **kwargs)
+        self.tiny_vae.enable_tiling(*args, **kwargs)
+
+    def disable_tiling(self):
+        self.full_vae.disable_tiling()
+        self.tiny_vae.disable_tiling()
+
+    @property
+    def attn_processors(self):
+        return self.full_vae.attn_processors
+
+    def set_attn_processor(self, processor):
+        self.full_vae.set_attn_processor(processor)
+
+    def fuse_qkv_projections(self):
+        self.full_vae.fuse_qkv_projections()
+
+    def unfuse_qkv_projections(self):
+        self.full_vae.unfuse_qkv_projections()
+
+
+def apply_vae_mode(pipe, vae_mode, taesd_dir, device="cuda", dtype=torch.float16):
+    """
+    根据VAE模式替换pipeline中的VAE
+
+    加载失败时打印警告并保留完整VAE，不中断任务。
+
+    Returns:
+        实际生效的VAE模式
+    """
+    if vae_mode not in VAE_MODES:
+        print(f"⚠️ 未知的VAE模式: {vae_mode}，使用完整VAE")
+        return "full"
+    if vae_mode == "full":
+        return "full"
+
+    try:
+        tiny_vae = load_tiny_vae(taesd_dir, need_encoder=(vae_mode == "tiny"), dtype=dtype)
+    except Exception as e:
+        print(f"⚠️ TAESD加载失败: {e}")
+        tiny_vae = None
+
+    if tiny_vae is None:
+        print("⚠️ 将继续使用完整VAE")
+        return "full"
+
+    tiny_vae = tiny_vae.to(device)
+    if vae_mode == "tiny":
+        pipe.vae = tiny_vae
+        print("⚡ VAE模式: TAESD编码+解码")
+    else:
+        pipe.vae = TinyDecodeVAE(pipe.vae, tiny_vae)
+        print("⚡ VAE模式: 完整VAE编码 + TAESD解码")
+    return vae_mode
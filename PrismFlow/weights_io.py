@@ -0,0 +1,117 @@
+"""
+权重文件读写 - 把 .pth checkpoint 转换为 safetensors，并通过 mmap 加载
+
+torch.load 会把整个 .pth 反序列化到每个进程的私有内存中；safetensors 文件按 mmap 映射后，
+张量直接是文件页的视图:
+- 冷启动不需要反序列化，只读取实际用到的页
+- 同一台机器上的多个 worker 进程共享页缓存中的同一份权重（load_state_dict(..., assign=True) 时）
+  加载后被改写的权重不再共享：inference_opt.prepare_for_inference 折叠 BatchNorm 时生成新的卷积权重
+  （RAFT 的 cnet、--norm batch 的 CycleGAN 生成器），这部分为每个进程私有
+
+转换后的文件与 .pth 放在一起（同名，扩展名为 .safetensors），存的是已经整理好的权重
+（CycleGAN 已修补 InstanceNorm 的键，RAFT 已去掉 DataParallel 的 "module." 前缀），加载时不再处理。
+转换工具见 convert_weights.py。
+
+    path = resolve_weights("models/RAFT/raft-sintel.pth")   # 有更新的 .safetensors 时返回它
+    state_dict = load_weights(path, device="cpu")
+"""
+
+import json
+import os
+import struct
+
+import torch
+from safetensors.torch import save_file
+
+# safetensors 头部的 dtype 名称 -> torch dtype
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def safetensors_path(path):
+    """checkpoint 对应的 safetensors 文件路径（同目录、同名）"""
+    return os.path.splitext(path)[0] + ".safetensors"
+
+
+def resolve_weights(path):
+    """
+    返回实际要加载的权重文件：存在不比 .pth 旧的同名 .safetensors 时返回它，否则返回 path
+
+    .pth 重新训练/替换后比转换结果新，此时仍加载 .pth，避免用到过期的转换结果。
+    """
+    if path.endswith(".safetensors"):
+        return path
+    converted = safetensors_path(path)
+    if os.path.isfile(converted) and (not os.path.isfile(path) or os.path.getmtime(converted) >= os.path.getmtime(path)):
+        return converted
+    return path
+
+
+def load_safetensors(path, device="cpu"):
+    """
+    通过 mmap 加载 safetensors 文件，返回 {名称: 张量}
+
+    CPU 上的张量是文件映射（MAP_PRIVATE）的视图，不复制数据；写入时只复制被写的页，不会改动文件。
+    其他设备上从映射直接拷贝到设备。
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+
+    nbytes = os.path.getsize(path)
+    data = torch.UntypedStorage.from_file(path, shared=False, nbytes=nbytes)
+    data = torch.empty(0, dtype=torch.uint8).set_(data)
+    base = 8 + header_size
+
+    state_dict = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        tensor = data[base + start:base + end]
+        if (base + start) % torch.empty(0, dtype=dtype).element_size():
+            # 未按元素大小对齐时不能直接重解释，复制一份
+            tensor = tensor.clone()
+        state_dict[name] = tensor.view(dtype).view(info["shape"])
+    if torch.device(device).type != "cpu":
+        state_dict = {name: tensor.to(device) for name, tensor in state_dict.items()}
+    return state_dict
+
+
+def load_weights(path, device="cpu"):
+    """按扩展名加载权重：.safetensors 走 mmap，其他按 torch.load（映射到 device）"""
+    if path.endswith(".safetensors"):
+        return load_safetensors(path, device)
+    state_dict = torch.load(path, map_location=str(device))
+    if hasattr(state_dict, "_metadata"):
+        del state_dict._metadata
+    return state_dict
+
+
+def save_safetensors(state_dict, path, metadata=None):
+    """
+    把 state_dict 保存为 safetensors
+
+    每个张量单独复制为连续的CPU张量（safetensors 不接受共享存储的张量）；先写临时文件再替换，
+    避免其他进程读到写了一半的文件。
+    """
+    tensors = {name: tensor.detach().cpu().contiguous().clone() for name, tensor in state_dict.items()}
+    tmp_path = path + ".tmp"
+    save_file(tensors, tmp_path, metadata=metadata)
+    os.replace(tmp_path, path)
+    return path
+
+
+def strip_prefix(state_dict, prefix="module."):
+    """去掉键的前缀（如 DataParallel 保存的 "module."），没有该前缀的键保持不变"""
+    return {name[len(prefix):] if name.startswith(prefix) else name: tensor for name, tensor in state_dict.items()}